@@ -41,6 +41,10 @@ def create_app():
         print(f"Failed to connect to MongoDB: {e}")
         app.db = None
     
+    if app.db is not None:
+        from app.models.indexes import bootstrap_indexes
+        bootstrap_indexes(app.db)
+    
     try:
         # Disable ChromaDB telemetry completely
         os.environ["ANONYMIZED_TELEMETRY"] = "False"
@@ -76,4 +80,7 @@ def create_app():
     init_socketio_events(socketio)
     app.websocket_notifications = WebSocketNotifications(socketio)
     
+    from app.services.chat_context_writer import start_chat_context_writer
+    app.chat_context_writer = start_chat_context_writer(app)
+    
     return app, socketio
\ No newline at end of file
@@ -0,0 +1,295 @@
+import os
+from datetime import datetime
+from bson import ObjectId
+from pymongo import IndexModel, UpdateOne
+
+ANALYTICS_RECENT_QUESTIONS = int(os.getenv('ANALYTICS_RECENT_QUESTIONS', 20))
+HIGH_CONFIDENCE = 0.7
+CONFIDENCE_BINS = 10
+DOCUMENT_STATUSES = ('pending', 'completed', 'failed')
+
+def _day(timestamp):
+    return timestamp.strftime('%Y-%m-%d')
+
+def _confidence_bin(confidence):
+    return str(min(max(int(confidence * CONFIDENCE_BINS), 0), CONFIDENCE_BINS - 1))
+
+def _field_key(value):
+    # Content types such as application/vnd.ms-excel contain dots, which MongoDB reads as paths
+    return (value or 'unknown').replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+def _unfield_key(key):
+    return key.replace('%24', '$').replace('%2E', '.').replace('%25', '%')
+
+class AnalyticsRollup:
+    """Per-user analytics counters and daily rollups, maintained at write time.
+    
+    ``analytics_counters`` holds one document per user with running totals
+    (documents by status and content type, storage, processing times, answer
+    confidence). ``analytics_daily`` holds one document per user per day with
+    uploads, questions and answers for that day. Analytics endpoints read only
+    these documents, so their cost does not grow with account history.
+    
+    Counters for users whose data predates the rollups are rebuilt once from
+    the source collections the first time they are read.
+    """
+    COLLECTION = 'analytics_daily'
+    COUNTERS_COLLECTION = 'analytics_counters'
+    INDEXES = [
+        IndexModel([('user_id', 1), ('day', 1)], unique=True)
+    ]
+    HOT_QUERIES = [
+        {
+            'name': 'daily rollups for a period',
+            'filter': {'user_id': ObjectId(), 'day': {'$gte': '2024-01-01', '$lte': '2024-01-31'}},
+            'sort': [('day', 1)]
+        }
+    ]
+    
+    def __init__(self, db):
+        self.db = db
+        self.daily = db[self.COLLECTION]
+        self.counters = db[self.COUNTERS_COLLECTION]
+    
+    def _update(self, user_id, timestamp, counters_update, daily_update=None):
+        # Analytics must never fail the write that triggered it
+        try:
+            user_id = ObjectId(user_id)
+            self.counters.update_one({'_id': user_id}, counters_update, upsert=True)
+            if daily_update:
+                daily_update.setdefault('$setOnInsert', {})['created_at'] = datetime.utcnow()
+                self.daily.update_one({'user_id': user_id, 'day': _day(timestamp)}, daily_update, upsert=True)
+        except Exception as e:
+            print(f"Could not update analytics rollups for user {user_id}: {e}")
+    
+    def record_upload(self, user_id, size, content_type, status, upload_date):
+        content_key = _field_key(content_type)
+        self._update(user_id, upload_date, {
+            '$inc': {
+                'documents.total': 1,
+                'documents.total_size': size,
+                f'documents.status.{status}': 1,
+                f'documents.content_types.{content_key}.count': 1,
+                f'documents.content_types.{content_key}.total_size': size
+            }
+        }, {
+            '$inc': {'uploads': 1, 'upload_size': size}
+        })
+    
+    def record_status_change(self, document, new_status, processed_date=None):
+        """Move a document between status counters; ``document`` is its state before the change."""
+        old_status = document.get('processing_status')
+        if old_status == new_status:
+            return
+        counters_inc = {f'documents.status.{new_status}': 1}
+        daily_inc = {new_status: 1} if new_status in ('completed', 'failed') else {}
+        if old_status:
+            counters_inc[f'documents.status.{old_status}'] = -1
+            if old_status in ('completed', 'failed'):
+                daily_inc[old_status] = -1
+        
+        counters_update = {'$inc': counters_inc}
+        if new_status == 'completed' and processed_date and document.get('upload_date'):
+            processing_ms = (processed_date - document['upload_date']).total_seconds() * 1000
+            counters_inc['processing.count'] = 1
+            counters_inc['processing.total_ms'] = processing_ms
+            counters_update['$min'] = {'processing.min_ms': processing_ms}
+            counters_update['$max'] = {'processing.max_ms': processing_ms}
+        
+        # Completion counts belong to the day the document was uploaded
+        self._update(
+            document['user_id'], document.get('upload_date') or datetime.utcnow(),
+            counters_update, {'$inc': daily_inc} if daily_inc else None
+        )
+    
+    def record_delete(self, document):
+        content_key = _field_key(document.get('content_type'))
+        size = document.get('size', 0)
+        self._update(document['user_id'], None, {
+            '$inc': {
+                'documents.total': -1,
+                'documents.total_size': -size,
+                f"documents.status.{document.get('processing_status', 'pending')}": -1,
+                f'documents.content_types.{content_key}.count': -1,
+                f'documents.content_types.{content_key}.total_size': -size
+            }
+        })
+    
+    def record_message(self, user_id, chat_id, message_data):
+        timestamp = message_data['timestamp']
+        if message_data['role'] == 'user':
+            counters_update = {'$inc': {'questions.total': 1}}
+            if len(message_data['content']) >= 5:
+                counters_update['$push'] = {'questions.recent': {
+                    '$each': [{'content': message_data['content'][:200], 'timestamp': timestamp}],
+                    '$slice': -ANALYTICS_RECENT_QUESTIONS
+                }}
+            self._update(user_id, timestamp, counters_update, {
+                '$inc': {'questions': 1},
+                '$addToSet': {'active_chats': ObjectId(chat_id)}
+            })
+            return
+        
+        confidence = (message_data.get('metadata') or {}).get('confidence')
+        if message_data['role'] != 'assistant' or confidence is None:
+            return
+        confidence_inc = {
+            'total': 1,
+            'confidence_sum': confidence,
+            'high_confidence': 1 if confidence >= HIGH_CONFIDENCE else 0,
+            f'histogram.{_confidence_bin(confidence)}': 1
+        }
+        self._update(
+            user_id, timestamp,
+            {'$inc': {f'answers.{k}': v for k, v in confidence_inc.items()}},
+            {'$inc': {f'answers.{k}': v for k, v in confidence_inc.items()}}
+        )
+    
+    def get_counters(self, user_id):
+        counters = self.counters.find_one({'_id': ObjectId(user_id)})
+        if not counters or not counters.get('initialized'):
+            counters = self.rebuild(user_id)
+        
+        documents = counters.get('documents') or {}
+        processing = counters.get('processing') or {}
+        answers = counters.get('answers') or {}
+        histogram = answers.get('histogram') or {}
+        return {
+            'documents': {
+                'total': documents.get('total', 0),
+                'total_size': documents.get('total_size', 0),
+                'status': {s: (documents.get('status') or {}).get(s, 0) for s in DOCUMENT_STATUSES},
+                'content_types': sorted(
+                    [
+                        {'_id': _unfield_key(key), 'count': value.get('count', 0), 'total_size': value.get('total_size', 0)}
+                        for key, value in (documents.get('content_types') or {}).items()
+                        if value.get('count', 0) > 0
+                    ],
+                    key=lambda row: -row['count']
+                )
+            },
+            'processing': {
+                'count': processing.get('count', 0),
+                'average_ms': processing['total_ms'] / processing['count'] if processing.get('count') else 0,
+                'min_ms': processing.get('min_ms', 0),
+                'max_ms': processing.get('max_ms', 0)
+            },
+            'questions': {
+                'total': (counters.get('questions') or {}).get('total', 0),
+                'recent': (counters.get('questions') or {}).get('recent', [])
+            },
+            'answers': {
+                'total': answers.get('total', 0),
+                'average_confidence': answers['confidence_sum'] / answers['total'] if answers.get('total') else 0.0,
+                'high_confidence': answers.get('high_confidence', 0),
+                'histogram': [histogram.get(str(i), 0) for i in range(CONFIDENCE_BINS)]
+            }
+        }
+    
+    def get_daily(self, user_id, start_date, end_date):
+        return list(self.daily.find(
+            {'user_id': ObjectId(user_id), 'day': {'$gte': _day(start_date), '$lte': _day(end_date)}},
+            {'_id': 0, 'user_id': 0, 'created_at': 0}
+        ).sort('day', 1))
+    
+    def _chat_messages(self, user_id):
+        """Yield (chat_id, messages) for every message a user's chats hold, in either storage format."""
+        # Chats not yet migrated out of the embedded array; a chat caught mid-migration
+        # has its messages in both places and is counted from the array only
+        legacy_chat_ids = set()
+        for chat in self.db.chats.find({'user_id': user_id, 'messages': {'$exists': True}}, {'messages': 1}):
+            legacy_chat_ids.add(chat['_id'])
+            yield chat['_id'], chat.get('messages') or []
+        
+        for bucket in self.db.chat_messages.find({'user_id': user_id}, {'chat_id': 1, 'messages': 1}):
+            if bucket['chat_id'] not in legacy_chat_ids:
+                yield bucket['chat_id'], bucket.get('messages', [])
+    
+    def rebuild(self, user_id):
+        """Recompute a user's counters and daily rollups from the source collections."""
+        user_id = ObjectId(user_id)
+        documents = {'total': 0, 'total_size': 0, 'status': {}, 'content_types': {}}
+        processing = {'count': 0, 'total_ms': 0}
+        daily = {}
+        
+        def day_entry(timestamp):
+            return daily.setdefault(_day(timestamp), {
+                'uploads': 0, 'upload_size': 0, 'completed': 0, 'failed': 0, 'questions': 0,
+                'active_chats': set(),
+                'answers': {'total': 0, 'confidence_sum': 0, 'high_confidence': 0, 'histogram': {}}
+            })
+        
+        for document in self.db.documents.find(
+            {'user_id': user_id},
+            {'size': 1, 'content_type': 1, 'processing_status': 1, 'upload_date': 1, 'processed_date': 1}
+        ):
+            size = document.get('size', 0)
+            status = document.get('processing_status', 'pending')
+            content_key = _field_key(document.get('content_type'))
+            documents['total'] += 1
+            documents['total_size'] += size
+            documents['status'][status] = documents['status'].get(status, 0) + 1
+            content_type = documents['content_types'].setdefault(content_key, {'count': 0, 'total_size': 0})
+            content_type['count'] += 1
+            content_type['total_size'] += size
+            
+            if document.get('upload_date'):
+                entry = day_entry(document['upload_date'])
+                entry['uploads'] += 1
+                entry['upload_size'] += size
+                if status in ('completed', 'failed'):
+                    entry[status] += 1
+            if status == 'completed' and document.get('upload_date') and document.get('processed_date'):
+                processing_ms = (document['processed_date'] - document['upload_date']).total_seconds() * 1000
+                processing['count'] += 1
+                processing['total_ms'] += processing_ms
+                processing['min_ms'] = min(processing.get('min_ms', processing_ms), processing_ms)
+                processing['max_ms'] = max(processing.get('max_ms', processing_ms), processing_ms)
+        
+        questions = {'total': 0, 'recent': []}
+        answers = {'total': 0, 'confidence_sum': 0, 'high_confidence': 0, 'histogram': {}}
+        for chat_id, messages in self._chat_messages(user_id):
+            for message in messages:
+                entry = day_entry(message['timestamp'])
+                if message['role'] == 'user':
+                    questions['total'] += 1
+                    entry['questions'] += 1
+                    entry['active_chats'].add(chat_id)
+                    if len(message['content']) >= 5:
+                        questions['recent'].append({'content': message['content'][:200], 'timestamp': message['timestamp']})
+                    continue
+                confidence = (message.get('metadata') or {}).get('confidence')
+                if message['role'] != 'assistant' or confidence is None:
+                    continue
+                for target in (answers, entry['answers']):
+                    target['total'] += 1
+                    target['confidence_sum'] += confidence
+                    target['high_confidence'] += 1 if confidence >= HIGH_CONFIDENCE else 0
+                    bin_key = _confidence_bin(confidence)
+                    target['histogram'][bin_key] = target['histogram'].get(bin_key, 0) + 1
+        questions['recent'] = sorted(questions['recent'], key=lambda q: q['timestamp'])[-ANALYTICS_RECENT_QUESTIONS:]
+        
+        counters = {
+            'documents': documents,
+            'processing': processing,
+            'questions': questions,
+            'answers': answers,
+            'initialized': True,
+            'rebuilt_at': datetime.utcnow()
+        }
+        self.counters.replace_one({'_id': user_id}, counters, upsert=True)
+        
+        if daily:
+            self.daily.bulk_write([
+                UpdateOne(
+                    {'user_id': user_id, 'day': day},
+                    {
+                        '$set': {**entry, 'active_chats': list(entry['active_chats'])},
+                        '$setOnInsert': {'created_at': datetime.utcnow()}
+                    },
+                    upsert=True
+                )
+                for day, entry in daily.items()
+            ])
+        counters['_id'] = user_id
+        return counters
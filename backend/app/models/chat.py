@@ -1,48 +1,146 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument, IndexModel
+from app.models.chat_message import ChatMessage
+from app.models.pagination import keyset_filter, keyset_page, count_cache
+from app.models.analytics_rollup import AnalyticsRollup
 
 class Chat:
+    COLLECTION = 'chats'
+    INDEXES = [
+        IndexModel([('user_id', 1), ('is_active', 1), ('updated_at', -1), ('_id', -1)])
+    ]
+    HOT_QUERIES = [
+        {
+            'name': 'active chats by user',
+            'filter': {'user_id': ObjectId(), 'is_active': True},
+            'sort': [('updated_at', -1), ('_id', -1)]
+        }
+    ]
+    DETAIL_PROJECTION = {'messages': 0}
+    OWNERSHIP_PROJECTION = {'user_id': 1, 'document_id': 1}
+    # Legacy chats still embedding their messages report the array size instead
+    LIST_PROJECTION = {
+        'user_id': 1, 'document_id': 1, 'title': 1, 'created_at': 1, 'updated_at': 1,
+        'is_active': 1, 'last_message': 1,
+        'message_count': {'$ifNull': ['$message_count', {'$size': {'$ifNull': ['$messages', []]}}]}
+    }
+    
     def __init__(self, db):
-        self.collection = db.chats
+        self.collection = db[self.COLLECTION]
+        self.messages = ChatMessage(db)
+        self.rollup = AnalyticsRollup(db)
     
     def create_chat(self, user_id, document_id, title="New Chat"):
         chat_data = {
             'user_id': ObjectId(user_id),
             'document_id': ObjectId(document_id) if document_id else None,
             'title': title,
-            'messages': [],
+            'message_count': 0,
+            'next_seq': 0,
+            'last_message': None,
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow(),
             'is_active': True
         }
         result = self.collection.insert_one(chat_data)
+        count_cache.invalidate(('chats', str(user_id)))
         return str(result.inserted_id)
     
-    def find_by_id(self, chat_id):
-        return self.collection.find_one({'_id': ObjectId(chat_id)})
+    def find_by_id(self, chat_id, projection=None):
+        # Legacy embedded message arrays are read through get_chat_messages instead
+        return self.collection.find_one(
+            {'_id': ObjectId(chat_id)},
+            projection if projection is not None else self.DETAIL_PROJECTION
+        )
     
     def find_by_user_id(self, user_id, skip=0, limit=50):
         return list(self.collection.find(
-            {'user_id': ObjectId(user_id), 'is_active': True}
-        ).sort('updated_at', -1).skip(skip).limit(limit))
+            {'user_id': ObjectId(user_id), 'is_active': True},
+            self.LIST_PROJECTION
+        ).sort([('updated_at', -1), ('_id', -1)]).skip(skip).limit(limit))
+    
+    def find_page_by_user_id(self, user_id, cursor=None, limit=50):
+        """Keyset page of a user's chats, most recently updated first; returns (chats, next_cursor)."""
+        query = keyset_filter({'user_id': ObjectId(user_id), 'is_active': True}, 'updated_at', cursor)
+        return keyset_page(
+            self.collection.find(query, self.LIST_PROJECTION).sort([('updated_at', -1), ('_id', -1)]).limit(limit + 1),
+            'updated_at', limit
+        )
+    
+    @staticmethod
+    def _preview(message_data):
+        return {
+            'id': message_data['id'],
+            'role': message_data['role'],
+            'content': message_data['content'][:200],
+            'timestamp': message_data['timestamp']
+        }
     
-    def add_message(self, chat_id, message, role='user', metadata=None):
+    def _migrate_legacy_messages(self, chat_id):
+        """Move a chat's embedded ``messages`` array into message buckets, once."""
+        chat = self.collection.find_one(
+            {'_id': ObjectId(chat_id), 'messages': {'$exists': True}},
+            {'user_id': 1, 'messages': 1}
+        )
+        if not chat:
+            return
+        
+        # Copy first with idempotent writes keyed by seq; the embedded array stays
+        # in place until the copy is complete, so a failure here loses nothing
+        messages = chat.get('messages') or []
+        for seq, message in enumerate(messages):
+            message['seq'] = seq
+        if messages:
+            self.messages.insert_many(chat_id, chat['user_id'], messages)
+        
+        # Removing the array and setting the counters in one guarded update means
+        # add_message cannot allocate a seq until the migrated ones are reserved
+        self.collection.update_one(
+            {'_id': ObjectId(chat_id), 'messages': {'$exists': True}},
+            {
+                '$unset': {'messages': ''},
+                '$set': {
+                    'message_count': len(messages),
+                    'last_message': self._preview(messages[-1]) if messages else None
+                },
+                '$max': {'next_seq': len(messages)}
+            }
+        )
+    
+    def add_message(self, chat_id, message, role='user', metadata=None, message_id=None):
+        """Append a message and return it, or None when the chat does not exist."""
+        self._migrate_legacy_messages(chat_id)
+        
         message_data = {
-            'id': str(ObjectId()),
+            'id': message_id or str(ObjectId()),
             'role': role,
             'content': message,
             'timestamp': datetime.utcnow(),
             'metadata': metadata or {}
         }
         
-        result = self.collection.update_one(
+        # Allocating the sequence number and updating the preview in one update
+        # keeps last_message on the highest sequence under concurrent writers
+        chat = self.collection.find_one_and_update(
             {'_id': ObjectId(chat_id)},
             {
-                '$push': {'messages': message_data},
-                '$set': {'updated_at': datetime.utcnow()}
-            }
+                '$inc': {'next_seq': 1, 'message_count': 1},
+                '$set': {
+                    'updated_at': message_data['timestamp'],
+                    'last_message': self._preview(message_data)
+                }
+            },
+            projection={'next_seq': 1, 'user_id': 1},
+            return_document=ReturnDocument.AFTER
         )
-        return result.modified_count > 0
+        if not chat:
+            return None
+        
+        message_data['seq'] = chat['next_seq'] - 1
+        self.messages.append(chat_id, chat['user_id'], message_data['seq'], message_data)
+        self.rollup.record_message(chat['user_id'], chat_id, message_data)
+        return message_data
     
     def update_chat_title(self, chat_id, title):
         return self.collection.update_one(
@@ -56,31 +154,48 @@ class Chat:
         )
     
     def delete_chat(self, chat_id):
-        return self.collection.update_one(
+        chat = self.collection.find_one_and_update(
             {'_id': ObjectId(chat_id)},
-            {'$set': {'is_active': False}}
+            {'$set': {'is_active': False}},
+            projection={'user_id': 1}
         )
+        if chat:
+            count_cache.invalidate(('chats', str(chat['user_id'])))
+        return chat
     
-    def get_chat_messages(self, chat_id, limit=100):
-        chat = self.collection.find_one(
-            {'_id': ObjectId(chat_id)},
-            {'messages': {'$slice': -limit}}
-        )
-        return chat['messages'] if chat else []
+    def get_chat_messages(self, chat_id, limit=100, before_seq=None):
+        """Return the latest ``limit`` messages, or the page before ``before_seq``, oldest first."""
+        self._migrate_legacy_messages(chat_id)
+        return self.messages.get_page(chat_id, before_seq, limit)
+    
+    def get_messages_range(self, chat_id, start_seq, end_seq):
+        self._migrate_legacy_messages(chat_id)
+        return self.messages.get_range(chat_id, start_seq, end_seq)
+    
+    def get_all_messages(self, chat_id):
+        self._migrate_legacy_messages(chat_id)
+        return self.messages.get_all(chat_id)
     
     def clear_chat_messages(self, chat_id):
+        self._migrate_legacy_messages(chat_id)
+        self.messages.delete_chat_messages(chat_id)
+        # next_seq is kept so sequence numbers are never reused
         return self.collection.update_one(
             {'_id': ObjectId(chat_id)},
             {
                 '$set': {
-                    'messages': [],
+                    'message_count': 0,
+                    'last_message': None,
                     'updated_at': datetime.utcnow()
-                }
+                },
+                '$unset': {'memory': ''}
             }
         )
     
-    def get_user_chat_count(self, user_id):
-        return self.collection.count_documents({
-            'user_id': ObjectId(user_id),
-            'is_active': True
-        })
\ No newline at end of file
+    def get_user_chat_count(self, user_id, exact=True):
+        if exact:
+            return self.collection.count_documents({
+                'user_id': ObjectId(user_id),
+                'is_active': True
+            })
+        return count_cache.get(('chats', str(user_id)), lambda: self.get_user_chat_count(user_id))
\ No newline at end of file
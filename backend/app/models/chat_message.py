@@ -0,0 +1,106 @@
+import os
+from datetime import datetime
+from bson import ObjectId
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError
+
+CHAT_MESSAGE_BUCKET_SIZE = int(os.getenv('CHAT_MESSAGE_BUCKET_SIZE', 50))
+
+class ChatMessage:
+    """Chat messages stored outside the chat document in fixed-size buckets.
+    
+    Each message gets a per-chat sequence number; message ``seq`` lives in the
+    bucket document ``(chat_id, seq // bucket_size)``. Reading the latest messages
+    or a page of older ones touches only one or two small bucket documents.
+    """
+    COLLECTION = 'chat_messages'
+    INDEXES = [
+        IndexModel([('chat_id', 1), ('bucket', 1)], unique=True),
+        IndexModel([('user_id', 1), ('updated_at', -1)])
+    ]
+    HOT_QUERIES = [
+        {'name': 'latest message buckets', 'filter': {'chat_id': ObjectId()}, 'sort': [('bucket', -1)]}
+    ]
+    
+    def __init__(self, db, bucket_size=CHAT_MESSAGE_BUCKET_SIZE):
+        self.collection = db[self.COLLECTION]
+        self.bucket_size = bucket_size
+    
+    def append(self, chat_id, user_id, seq, message_data):
+        bucket_filter = {'chat_id': ObjectId(chat_id), 'bucket': seq // self.bucket_size}
+        update = {
+            '$push': {'messages': message_data},
+            '$inc': {'count': 1},
+            '$set': {'updated_at': message_data['timestamp']},
+            '$setOnInsert': {'user_id': ObjectId(user_id), 'created_at': message_data['timestamp']}
+        }
+        try:
+            self.collection.update_one(bucket_filter, update, upsert=True)
+        except DuplicateKeyError:
+            # Another writer created the bucket between our match and insert
+            self.collection.update_one(bucket_filter, update)
+    
+    def insert_many(self, chat_id, user_id, messages):
+        """Write already-sequenced messages, e.g. when migrating a legacy chat.
+        
+        Messages whose seq is already stored are skipped, so an interrupted copy
+        can simply be run again.
+        """
+        for message in messages:
+            bucket_filter = {'chat_id': ObjectId(chat_id), 'bucket': message['seq'] // self.bucket_size}
+            update = {
+                '$push': {'messages': message},
+                '$inc': {'count': 1},
+                '$max': {'updated_at': message.get('timestamp') or datetime.utcnow()},
+                '$setOnInsert': {
+                    'user_id': ObjectId(user_id),
+                    'created_at': message.get('timestamp') or datetime.utcnow()
+                }
+            }
+            try:
+                self.collection.update_one({**bucket_filter, 'messages.seq': {'$ne': message['seq']}}, update, upsert=True)
+            except DuplicateKeyError:
+                # The bucket exists and already holds this seq, or was created concurrently
+                self.collection.update_one({**bucket_filter, 'messages.seq': {'$ne': message['seq']}}, update)
+    
+    def get_page(self, chat_id, before_seq=None, limit=50):
+        """Return up to ``limit`` messages with seq < before_seq (or the latest), oldest first."""
+        query = {'chat_id': ObjectId(chat_id)}
+        if before_seq is not None:
+            query['bucket'] = {'$lte': before_seq // self.bucket_size}
+        
+        messages = []
+        for bucket in self.collection.find(query, {'messages': 1}).sort('bucket', -1):
+            bucket_messages = sorted(bucket['messages'], key=lambda m: m['seq'], reverse=True)
+            for message in bucket_messages:
+                if before_seq is None or message['seq'] < before_seq:
+                    messages.append(message)
+            if len(messages) >= limit:
+                break
+        
+        return list(reversed(messages[:limit]))
+    
+    def get_range(self, chat_id, start_seq, end_seq):
+        """Return messages with start_seq <= seq < end_seq, oldest first."""
+        if end_seq <= start_seq:
+            return []
+        buckets = self.collection.find(
+            {
+                'chat_id': ObjectId(chat_id),
+                'bucket': {'$gte': start_seq // self.bucket_size, '$lte': (end_seq - 1) // self.bucket_size}
+            },
+            {'messages': 1}
+        ).sort('bucket', 1)
+        messages = []
+        for bucket in buckets:
+            messages.extend(m for m in bucket['messages'] if start_seq <= m['seq'] < end_seq)
+        return sorted(messages, key=lambda m: m['seq'])
+    
+    def get_all(self, chat_id):
+        messages = []
+        for bucket in self.collection.find({'chat_id': ObjectId(chat_id)}, {'messages': 1}).sort('bucket', 1):
+            messages.extend(sorted(bucket['messages'], key=lambda m: m['seq']))
+        return messages
+    
+    def delete_chat_messages(self, chat_id):
+        return self.collection.delete_many({'chat_id': ObjectId(chat_id)})
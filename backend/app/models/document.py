@@ -1,9 +1,53 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument, IndexModel
+from app.models.document_text import DocumentText
+from app.models.pagination import keyset_filter, keyset_page, count_cache
+from app.models.analytics_rollup import AnalyticsRollup
 
 class Document:
+    COLLECTION = 'documents'
+    INDEXES = [
+        # Listing and keyset paging; also serves any query on user_id alone
+        IndexModel([('user_id', 1), ('upload_date', -1), ('_id', -1)]),
+        IndexModel([('processing_status', 1), ('user_id', 1)])
+    ]
+    HOT_QUERIES = [
+        {'name': 'documents by user', 'filter': {'user_id': ObjectId()}, 'sort': [('upload_date', -1), ('_id', -1)]},
+        {
+            'name': 'documents page after cursor',
+            'filter': {'$and': [
+                {'user_id': ObjectId()},
+                {'$or': [
+                    {'upload_date': {'$lt': datetime(2024, 1, 1)}},
+                    {'upload_date': datetime(2024, 1, 1), '_id': {'$lt': ObjectId()}}
+                ]}
+            ]},
+            'sort': [('upload_date', -1), ('_id', -1)]
+        },
+        {'name': 'documents by status', 'filter': {'processing_status': 'completed', 'user_id': ObjectId()}}
+    ]
+    
+    # Everything except the large text fields; used by list and summary views
+    LIST_PROJECTION = {'extracted_text': 0, 'template_answers': 0}
+    # Just enough to check ownership and status
+    OWNERSHIP_PROJECTION = {'user_id': 1, 'processing_status': 1, 'filepath': 1}
+    # Question answering needs the flags and precomputed answers, not the text
+    QA_PROJECTION = {
+        'user_id': 1,
+        'processing_status': 1,
+        'processed_date': 1,
+        'template_answers': 1,
+        # Documents processed before text moved out of line still carry it inline
+        'has_text': {'$gt': [
+            {'$ifNull': ['$text_length', {'$strLenCP': {'$ifNull': ['$extracted_text', '']}}]}, 0
+        ]}
+    }
+    
     def __init__(self, db):
-        self.collection = db.documents
+        self.collection = db[self.COLLECTION]
+        self.texts = DocumentText(db)
+        self.rollup = AnalyticsRollup(db)
     
     def create_document(self, user_id, filename, filepath, content_type, size, extracted_text=None):
         document_data = {
@@ -12,7 +56,7 @@ class Document:
             'filepath': filepath,
             'content_type': content_type,
             'size': size,
-            'extracted_text': extracted_text,
+            'text_length': 0,
             'processing_status': 'pending',
             'upload_date': datetime.now(),
             'processed_date': None,
@@ -23,39 +67,137 @@ class Document:
             'embeddings_stored': False
         }
         result = self.collection.insert_one(document_data)
-        return str(result.inserted_id)
+        count_cache.invalidate(('documents', str(user_id)))
+        self.rollup.record_upload(user_id, size, content_type, 'pending', document_data['upload_date'])
+        document_id = str(result.inserted_id)
+        if extracted_text:
+            self.store_text(document_id, user_id, extracted_text)
+        return document_id
     
-    def find_by_id(self, document_id):
-        return self.collection.find_one({'_id': ObjectId(document_id)})
+    def find_by_id(self, document_id, projection=None):
+        return self.collection.find_one({'_id': ObjectId(document_id)}, projection)
     
-    def find_by_user_id(self, user_id, skip=0, limit=50):
+    def find_owned(self, document_id, user_id, projection=None):
+        """Return the document only if it belongs to user_id, otherwise None."""
+        return self.collection.find_one(
+            {'_id': ObjectId(document_id), 'user_id': ObjectId(user_id)},
+            projection if projection is not None else self.OWNERSHIP_PROJECTION
+        )
+    
+    def find_by_user_id(self, user_id, skip=0, limit=50, projection=LIST_PROJECTION):
         return list(self.collection.find(
-            {'user_id': ObjectId(user_id)}
-        ).sort('upload_date', -1).skip(skip).limit(limit))
+            {'user_id': ObjectId(user_id)},
+            projection
+        ).sort([('upload_date', -1), ('_id', -1)]).skip(skip).limit(limit))
+    
+    def find_page_by_user_id(self, user_id, cursor=None, limit=50, projection=LIST_PROJECTION):
+        """Keyset page of a user's documents, newest first; returns (documents, next_cursor)."""
+        query = keyset_filter({'user_id': ObjectId(user_id)}, 'upload_date', cursor)
+        return keyset_page(
+            self.collection.find(query, projection).sort([('upload_date', -1), ('_id', -1)]).limit(limit + 1),
+            'upload_date', limit
+        )
     
     def update_document(self, document_id, update_data):
         if 'processed_date' not in update_data and 'processing_status' in update_data and update_data['processing_status'] == 'completed':
             update_data['processed_date'] = datetime.now()
         
-        return self.collection.update_one(
+        if 'processing_status' not in update_data:
+            return self.collection.update_one(
+                {'_id': ObjectId(document_id)},
+                {'$set': update_data}
+            )
+        
+        # The previous status is needed to move the document between rollup counters
+        previous = self.collection.find_one_and_update(
+            {'_id': ObjectId(document_id)},
+            {'$set': update_data},
+            projection={'user_id': 1, 'processing_status': 1, 'upload_date': 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous:
+            self.rollup.record_status_change(previous, update_data['processing_status'], update_data.get('processed_date'))
+        return previous
+    
+    def store_text(self, document_id, user_id, text):
+        """Write the extracted text to the compressed text store and record its length."""
+        text_fields = self.texts.save(document_id, user_id, text)
+        self.collection.update_one(
             {'_id': ObjectId(document_id)},
-            {'$set': update_data}
+            {'$set': text_fields, '$unset': {'extracted_text': ''}}
+        )
+        return text_fields
+    
+    def _migrate_inline_text(self, document_id):
+        # Move text from documents processed before the text store existed. The
+        # pages are written before the inline copy is dropped, in one guarded
+        # update, so the text stays readable throughout; a concurrent caller just
+        # rewrites the same pages
+        document = self.collection.find_one(
+            {'_id': ObjectId(document_id), 'extracted_text': {'$exists': True}},
+            {'user_id': 1, 'extracted_text': 1}
         )
+        if not document:
+            return None
+        text_fields = self.texts.save(document_id, document['user_id'], document.get('extracted_text'))
+        self.collection.update_one(
+            {'_id': ObjectId(document_id), 'extracted_text': {'$exists': True}},
+            {'$set': text_fields, '$unset': {'extracted_text': ''}}
+        )
+        return text_fields
+    
+    def get_text_page(self, document, offset=0, limit=None):
+        """Return a slice of the document's extracted text along with paging info."""
+        document_id = str(document['_id'])
+        text_length = document.get('text_length')
+        if text_length is None:
+            migrated = self._migrate_inline_text(document_id)
+            if not migrated:
+                # Another caller may have finished the move since the document was read
+                migrated = self.collection.find_one({'_id': ObjectId(document_id)}, {'text_length': 1}) or {}
+            text_length = migrated.get('text_length', 0)
+        
+        text = self.texts.read(document_id, offset, limit)
+        next_offset = offset + len(text)
+        return {
+            'text': text,
+            'offset': offset,
+            'length': len(text),
+            'total_length': text_length,
+            'has_more': next_offset < text_length,
+            'next_offset': next_offset if next_offset < text_length else None
+        }
     
     def delete_document(self, document_id):
-        return self.collection.delete_one({'_id': ObjectId(document_id)})
+        self.texts.delete(document_id)
+        document = self.collection.find_one_and_delete(
+            {'_id': ObjectId(document_id)},
+            {'user_id': 1, 'size': 1, 'content_type': 1, 'processing_status': 1}
+        )
+        if document:
+            count_cache.invalidate(('documents', str(document['user_id'])))
+            self.rollup.record_delete(document)
+        return document
     
-    def search_documents(self, user_id, query, skip=0, limit=20):
+    def search_documents(self, user_id, query, cursor=None, limit=20):
+        """Keyword match on filename, summary, tags and text; returns (documents, next_cursor)."""
         search_filter = {
             'user_id': ObjectId(user_id),
             '$or': [
                 {'filename': {'$regex': query, '$options': 'i'}},
-                {'extracted_text': {'$regex': query, '$options': 'i'}},
                 {'summary': {'$regex': query, '$options': 'i'}},
-                {'tags': {'$regex': query, '$options': 'i'}}
+                {'tags': {'$regex': query, '$options': 'i'}},
+                {'_id': {'$in': self.texts.search(user_id, query)}},
+                # Text not yet moved to the text store
+                {'extracted_text': {'$regex': query, '$options': 'i'}}
             ]
         }
-        return list(self.collection.find(search_filter).sort('upload_date', -1).skip(skip).limit(limit))
+        return keyset_page(
+            self.collection.find(
+                keyset_filter(search_filter, 'upload_date', cursor), self.LIST_PROJECTION
+            ).sort([('upload_date', -1), ('_id', -1)]).limit(limit + 1),
+            'upload_date', limit
+        )
     
     def get_processing_stats(self, user_id=None):
         match_filter = {}
@@ -74,12 +216,12 @@ class Document:
         ]
         return list(self.collection.aggregate(pipeline))
     
-    def get_documents_by_status(self, status, user_id=None):
+    def get_documents_by_status(self, status, user_id=None, projection=LIST_PROJECTION):
         match_filter = {'processing_status': status}
         if user_id:
             match_filter['user_id'] = ObjectId(user_id)
         
-        return list(self.collection.find(match_filter))
+        return list(self.collection.find(match_filter, projection))
     
     def add_tag(self, document_id, tag):
         return self.collection.update_one(
@@ -93,5 +235,7 @@ class Document:
             {'$pull': {'tags': tag}}
         )
     
-    def get_user_document_count(self, user_id):
-        return self.collection.count_documents({'user_id': ObjectId(user_id)})
\ No newline at end of file
+    def get_user_document_count(self, user_id, exact=True):
+        if exact:
+            return self.collection.count_documents({'user_id': ObjectId(user_id)})
+        return count_cache.get(('documents', str(user_id)), lambda: self.get_user_document_count(user_id))
\ No newline at end of file
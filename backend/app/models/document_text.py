@@ -0,0 +1,134 @@
+import os
+import re
+import zlib
+from datetime import datetime
+from bson import ObjectId, Binary
+from pymongo import IndexModel, ReplaceOne
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+DOCUMENT_TEXT_PAGE_CHARS = int(os.getenv('DOCUMENT_TEXT_PAGE_CHARS', 20000))
+DOCUMENT_TEXT_ZSTD_LEVEL = int(os.getenv('DOCUMENT_TEXT_ZSTD_LEVEL', 3))
+
+def _search_terms(text):
+    # Distinct words of a page; far smaller than the page itself and enough for a text index
+    return ' '.join(sorted(set(re.findall(r'\w+', text.lower()))))
+
+def _compress(text):
+    data = text.encode('utf-8')
+    if ZSTD_AVAILABLE:
+        return 'zstd', zstandard.ZstdCompressor(level=DOCUMENT_TEXT_ZSTD_LEVEL).compress(data)
+    return 'zlib', zlib.compress(data, 6)
+
+def _decompress(codec, data):
+    if codec == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError('Document text is zstd-compressed but the zstandard package is not installed')
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    if codec == 'zlib':
+        return zlib.decompress(data).decode('utf-8')
+    return data.decode('utf-8')
+
+class DocumentText:
+    """Extracted document text stored outside the document, compressed in pages.
+    
+    The text is split into pages of DOCUMENT_TEXT_PAGE_CHARS characters; each
+    page records its character range, so reading an offset range decompresses
+    only the pages that overlap it. Pages are zstd-compressed when the
+    zstandard package is installed and zlib-compressed otherwise; the codec is
+    stored per page so either can be read back.
+    
+    Each page also keeps its distinct words uncompressed under a text index,
+    so document content stays searchable without decompressing any pages.
+    """
+    COLLECTION = 'document_texts'
+    INDEXES = [
+        IndexModel([('document_id', 1), ('offset', 1)], unique=True),
+        IndexModel([('user_id', 1), ('terms', 'text')])
+    ]
+    HOT_QUERIES = [
+        {
+            'name': 'document text range',
+            'filter': {'document_id': ObjectId(), 'end': {'$gt': 0}, 'offset': {'$lt': DOCUMENT_TEXT_PAGE_CHARS}},
+            'sort': [('offset', 1)]
+        },
+        {'name': 'document text search', 'filter': {'user_id': ObjectId(), '$text': {'$search': 'contract'}}}
+    ]
+    
+    def __init__(self, db, page_chars=DOCUMENT_TEXT_PAGE_CHARS):
+        self.collection = db[self.COLLECTION]
+        self.page_chars = page_chars
+    
+    def save(self, document_id, user_id, text):
+        """Replace the stored text for a document; returns the summary fields for the document.
+        
+        Pages are upserted by (document_id, offset) and only pages past the new
+        end are removed, so saving the same text twice, or from two callers at
+        once, leaves one complete copy.
+        """
+        text = text or ''
+        
+        pages = []
+        compressed_size = 0
+        codec = None
+        for page, offset in enumerate(range(0, len(text), self.page_chars)):
+            page_text = text[offset:offset + self.page_chars]
+            codec, data = _compress(page_text)
+            compressed_size += len(data)
+            pages.append({
+                'document_id': ObjectId(document_id),
+                'user_id': ObjectId(user_id),
+                'page': page,
+                'offset': offset,
+                'end': offset + len(page_text),
+                'codec': codec,
+                'data': Binary(data),
+                'terms': _search_terms(page_text),
+                'created_at': datetime.now()
+            })
+        if pages:
+            self.collection.bulk_write([
+                ReplaceOne({'document_id': page['document_id'], 'offset': page['offset']}, page, upsert=True)
+                for page in pages
+            ])
+        self.collection.delete_many({'document_id': ObjectId(document_id), 'offset': {'$gte': len(text)}})
+        
+        return {
+            'text_length': len(text),
+            'text_storage': {
+                'pages': len(pages),
+                'codec': codec,
+                'compressed_size': compressed_size
+            }
+        }
+    
+    def read(self, document_id, offset=0, limit=None):
+        """Return the text in [offset, offset + limit), decompressing only the overlapping pages."""
+        query = {'document_id': ObjectId(document_id), 'end': {'$gt': offset}}
+        if limit is not None:
+            query['offset'] = {'$lt': offset + limit}
+        
+        parts = []
+        for page in self.collection.find(query, {'offset': 1, 'codec': 1, 'data': 1}).sort('offset', 1):
+            page_text = _decompress(page['codec'], page['data'])
+            start = max(offset - page['offset'], 0)
+            end = None if limit is None else offset + limit - page['offset']
+            parts.append(page_text[start:end])
+        return ''.join(parts)
+    
+    def search(self, user_id, query):
+        """Return the ids of the user's documents whose text contains any word of the query."""
+        return self.collection.distinct(
+            'document_id', {'user_id': ObjectId(user_id), '$text': {'$search': query}}
+        )
+    
+    def get_text(self, document_id):
+        return self.read(document_id)
+    
+    def delete(self, document_id):
+        return self.collection.delete_many({'document_id': ObjectId(document_id)})
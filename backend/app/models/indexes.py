@@ -0,0 +1,75 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+QUERY_PLAN_CHECK = os.getenv('QUERY_PLAN_CHECK', 'False').lower() == 'true'
+
+def indexed_classes():
+    """Every class that owns a collection and declares INDEXES / HOT_QUERIES."""
+    from app.models.user import User
+    from app.models.document import Document
+    from app.models.document_text import DocumentText
+    from app.models.chat import Chat
+    from app.models.chat_message import ChatMessage
+    from app.models.analytics_rollup import AnalyticsRollup
+    from app.services.chat_context_writer import ChatContextQueue
+    from app.services.llm_cache import LLMCache
+    from app.services.qa_cache import QACache
+    
+    return [
+        User, Document, DocumentText, Chat, ChatMessage, AnalyticsRollup,
+        ChatContextQueue, LLMCache, QACache
+    ]
+
+def ensure_indexes(db):
+    """Create the declared indexes; existing indexes with the same spec are left alone."""
+    created = {}
+    for cls in indexed_classes():
+        try:
+            created[cls.COLLECTION] = db[cls.COLLECTION].create_indexes(cls.INDEXES)
+        except Exception as e:
+            logger.warning(f"Could not create indexes for {cls.COLLECTION}: {e}")
+    return created
+
+def _find_stage(plan, stage):
+    if isinstance(plan, dict):
+        if plan.get('stage') == stage:
+            return True
+        return any(_find_stage(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_find_stage(value, stage) for value in plan)
+    return False
+
+def check_query_plans(db):
+    """Explain each declared hot query and report the ones that would scan the whole collection.
+    
+    The planner only falls back to a COLLSCAN when no index can answer the
+    query, so this works on an empty database as well as a populated one.
+    """
+    results = []
+    for cls in indexed_classes():
+        for query in getattr(cls, 'HOT_QUERIES', []):
+            cursor = db[cls.COLLECTION].find(query['filter'])
+            if query.get('sort'):
+                cursor = cursor.sort(query['sort'])
+            winning_plan = cursor.limit(query.get('limit', 20)).explain()['queryPlanner']['winningPlan']
+            results.append({
+                'collection': cls.COLLECTION,
+                'name': query['name'],
+                'collscan': _find_stage(winning_plan, 'COLLSCAN'),
+                'in_memory_sort': _find_stage(winning_plan, 'SORT')
+            })
+    return results
+
+def bootstrap_indexes(db):
+    """Startup hook: ensure indexes and, with QUERY_PLAN_CHECK on, log hot queries that scan."""
+    ensure_indexes(db)
+    if not QUERY_PLAN_CHECK:
+        return
+    try:
+        for result in check_query_plans(db):
+            if result['collscan']:
+                logger.warning(f"Hot query '{result['name']}' on {result['collection']} uses a collection scan")
+    except Exception as e:
+        logger.warning(f"Query plan check failed: {e}")
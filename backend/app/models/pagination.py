@@ -0,0 +1,77 @@
+import base64
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+
+COUNT_CACHE_TTL_SECONDS = int(os.getenv('COUNT_CACHE_TTL_SECONDS', 60))
+
+def encode_cursor(sort_value, document_id):
+    """Opaque cursor for the position just after (sort_value, _id)."""
+    payload = json.dumps([sort_value.isoformat(), str(document_id)])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Return (sort_value, _id) for a cursor, or raise ValueError when it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, document_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(sort_value), ObjectId(document_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise ValueError('Invalid cursor') from e
+
+def keyset_filter(query, sort_field, cursor):
+    """Restrict a descending (sort_field, _id) query to rows after the cursor."""
+    if not cursor:
+        return query
+    sort_value, document_id = decode_cursor(cursor)
+    return {
+        '$and': [
+            query,
+            {'$or': [
+                {sort_field: {'$lt': sort_value}},
+                {sort_field: sort_value, '_id': {'$lt': document_id}}
+            ]}
+        ]
+    }
+
+def keyset_page(cursor, sort_field, limit):
+    """Split a result fetched with limit + 1 rows into (items, next_cursor)."""
+    items = list(cursor)
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(items[-1][sort_field], items[-1]['_id'])
+
+class CountCache:
+    """Per-process cache of per-user collection counts.
+    
+    Listing endpoints report these instead of running count_documents on every
+    page; writers in this process invalidate their user's entry, and entries
+    changed by other processes are corrected when they expire.
+    """
+    
+    def __init__(self, ttl_seconds=COUNT_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.counts = {}
+        self.lock = threading.Lock()
+    
+    def get(self, key, count_fn):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.counts.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+        count = count_fn()
+        with self.lock:
+            self.counts[key] = (count, now + self.ttl_seconds)
+        return count
+    
+    def invalidate(self, key):
+        with self.lock:
+            self.counts.pop(key, None)
+
+count_cache = CountCache()
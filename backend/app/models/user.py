@@ -1,10 +1,20 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import IndexModel
+from app.models.analytics_rollup import AnalyticsRollup
 from werkzeug.security import generate_password_hash, check_password_hash
 
 class User:
+    COLLECTION = 'users'
+    INDEXES = [
+        IndexModel([('email', 1)], unique=True)
+    ]
+    HOT_QUERIES = [
+        {'name': 'user by email', 'filter': {'email': 'user@example.com'}}
+    ]
+    
     def __init__(self, db):
-        self.collection = db.users
+        self.collection = db[self.COLLECTION]
     
     def create_user(self, email, password, name):
         import logging
@@ -43,27 +53,12 @@ class User:
         return self.collection.delete_one({'_id': ObjectId(user_id)})
     
     def get_user_stats(self, user_id):
-        pipeline = [
-            {
-                '$match': {'_id': ObjectId(user_id)}
-            },
-            {
-                '$lookup': {
-                    'from': 'documents',
-                    'localField': '_id',
-                    'foreignField': 'user_id',
-                    'as': 'documents'
-                }
-            },
-            {
-                '$project': {
-                    'name': 1,
-                    'email': 1,
-                    'created_at': 1,
-                    'document_count': {'$size': '$documents'},
-                    'total_size': {'$sum': '$documents.size'}
-                }
-            }
-        ]
-        result = list(self.collection.aggregate(pipeline))
-        return result[0] if result else None
\ No newline at end of file
+        user = self.collection.find_one({'_id': ObjectId(user_id)}, {'name': 1, 'email': 1, 'created_at': 1})
+        if not user:
+            return None
+        
+        # Document totals come from the rollup counters instead of a $lookup over every document
+        documents = AnalyticsRollup(self.collection.database).get_counters(user_id)['documents']
+        user['document_count'] = documents['total']
+        user['total_size'] = documents['total_size']
+        return user
\ No newline at end of file
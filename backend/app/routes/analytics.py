@@ -3,12 +3,21 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.document import Document
 from app.models.chat import Chat
 from app.models.user import User
+from app.models.analytics_rollup import AnalyticsRollup
 from app.services.vector_service import VectorService
+from app.services.llm_gateway import get_llm_gateway
+from app.services.circuit_breaker import get_circuit_states
+from app.services.local_models import get_scheduler_stats
+from app.services.chat_context_writer import ChatContextQueue
+from app.services.document_session_cache import get_session_cache
 from datetime import datetime, timedelta
-from bson import ObjectId
 
 analytics_bp = Blueprint('analytics', __name__)
 
+def _day_id(day):
+    year, month, day_of_month = (int(part) for part in day.split('-'))
+    return {'year': year, 'month': month, 'day': day_of_month}
+
 @analytics_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 def get_dashboard_data():
@@ -19,37 +28,22 @@ def get_dashboard_data():
         chat_model = Chat(current_app.db)
         user_model = User(current_app.db)
         
-        user_stats = user_model.get_user_stats(current_user_id)
-        processing_stats = document_model.get_processing_stats(current_user_id)
-        
-        processing_summary = {
-            'pending': 0,
-            'completed': 0,
-            'failed': 0,
-            'total_size': 0
-        }
-        
-        for stat in processing_stats:
-            status = stat['_id']
-            count = stat['count']
-            size = stat.get('total_size', 0)
-            
-            if status in processing_summary:
-                processing_summary[status] = count
-            processing_summary['total_size'] += size
+        user = user_model.find_by_id(current_user_id)
+        document_counters = AnalyticsRollup(current_app.db).get_counters(current_user_id)['documents']
         
-        processing_summary['total_documents'] = sum([
-            processing_summary['pending'],
-            processing_summary['completed'],
-            processing_summary['failed']
-        ])
+        processing_summary = dict(document_counters['status'])
+        processing_summary['total_size'] = document_counters['total_size']
+        processing_summary['total_documents'] = sum(document_counters['status'].values())
         
-        chat_count = chat_model.get_user_chat_count(current_user_id)
+        chat_count = chat_model.get_user_chat_count(current_user_id, exact=False)
         
         vector_service = VectorService(current_app.chroma)
         vector_stats = vector_service.get_collection_stats()
         
-        recent_documents = document_model.find_by_user_id(current_user_id, 0, 5)
+        recent_documents = document_model.find_by_user_id(
+            current_user_id, 0, 5,
+            projection={'filename': 1, 'processing_status': 1, 'upload_date': 1, 'size': 1}
+        )
         recent_doc_list = []
         for doc in recent_documents:
             recent_doc_list.append({
@@ -62,9 +56,9 @@ def get_dashboard_data():
         
         return jsonify({
             'user_stats': {
-                'total_documents': user_stats.get('document_count', 0) if user_stats else 0,
-                'total_storage_used': user_stats.get('total_size', 0) if user_stats else 0,
-                'account_created': user_stats['created_at'].isoformat() if user_stats else None,
+                'total_documents': document_counters['total'],
+                'total_storage_used': document_counters['total_size'],
+                'account_created': user['created_at'].isoformat() if user else None,
                 'total_chats': chat_count
             },
             'processing_stats': processing_summary,
@@ -73,7 +67,8 @@ def get_dashboard_data():
             'system_health': {
                 'mongodb_connected': current_app.db is not None,
                 'chromadb_connected': current_app.chroma is not None,
-                'services_running': True
+                'services_running': True,
+                'circuit_breakers': get_circuit_states()
             }
         }), 200
         
@@ -85,60 +80,25 @@ def get_dashboard_data():
 def get_document_stats():
     try:
         current_user_id = get_jwt_identity()
-        document_model = Document(current_app.db)
+        rollup = AnalyticsRollup(current_app.db)
         
         days = int(request.args.get('days', 7))
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        pipeline = [
-            {
-                '$match': {
-                    'user_id': ObjectId(current_user_id),
-                    'upload_date': {'$gte': start_date, '$lte': end_date}
-                }
-            },
-            {
-                '$group': {
-                    '_id': {
-                        'year': {'$year': '$upload_date'},
-                        'month': {'$month': '$upload_date'},
-                        'day': {'$dayOfMonth': '$upload_date'}
-                    },
-                    'count': {'$sum': 1},
-                    'total_size': {'$sum': '$size'},
-                    'completed': {
-                        '$sum': {'$cond': [{'$eq': ['$processing_status', 'completed']}, 1, 0]}
-                    },
-                    'failed': {
-                        '$sum': {'$cond': [{'$eq': ['$processing_status', 'failed']}, 1, 0]}
-                    }
-                }
-            },
-            {
-                '$sort': {'_id': 1}
-            }
-        ]
-        
-        daily_stats = list(document_model.collection.aggregate(pipeline))
-        
-        content_type_pipeline = [
-            {
-                '$match': {'user_id': ObjectId(current_user_id)}
-            },
+        daily_stats = [
             {
-                '$group': {
-                    '_id': '$content_type',
-                    'count': {'$sum': 1},
-                    'total_size': {'$sum': '$size'}
-                }
-            },
-            {
-                '$sort': {'count': -1}
+                '_id': _day_id(row['day']),
+                'count': row.get('uploads', 0),
+                'total_size': row.get('upload_size', 0),
+                'completed': row.get('completed', 0),
+                'failed': row.get('failed', 0)
             }
+            for row in rollup.get_daily(current_user_id, start_date, end_date)
+            if row.get('uploads')
         ]
         
-        content_type_stats = list(document_model.collection.aggregate(content_type_pipeline))
+        content_type_stats = rollup.get_counters(current_user_id)['documents']['content_types']
         
         return jsonify({
             'daily_stats': daily_stats,
@@ -158,87 +118,27 @@ def get_document_stats():
 def get_search_trends():
     try:
         current_user_id = get_jwt_identity()
-        chat_model = Chat(current_app.db)
+        rollup = AnalyticsRollup(current_app.db)
         
         days = int(request.args.get('days', 30))
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        pipeline = [
-            {
-                '$match': {
-                    'user_id': ObjectId(current_user_id),
-                    'updated_at': {'$gte': start_date, '$lte': end_date}
-                }
-            },
-            {
-                '$unwind': '$messages'
-            },
-            {
-                '$match': {
-                    'messages.role': 'user',
-                    'messages.timestamp': {'$gte': start_date, '$lte': end_date}
-                }
-            },
+        search_trends = [
             {
-                '$group': {
-                    '_id': {
-                        'year': {'$year': '$messages.timestamp'},
-                        'month': {'$month': '$messages.timestamp'},
-                        'day': {'$dayOfMonth': '$messages.timestamp'}
-                    },
-                    'question_count': {'$sum': 1},
-                    'unique_chats': {'$addToSet': '$_id'}
-                }
-            },
-            {
-                '$project': {
-                    '_id': 1,
-                    'question_count': 1,
-                    'active_chats': {'$size': '$unique_chats'}
-                }
-            },
-            {
-                '$sort': {'_id': 1}
+                '_id': _day_id(row['day']),
+                'question_count': row['questions'],
+                'active_chats': len(row.get('active_chats', []))
             }
+            for row in rollup.get_daily(current_user_id, start_date, end_date)
+            if row.get('questions')
         ]
         
-        search_trends = list(chat_model.collection.aggregate(pipeline))
-        
-        popular_topics_pipeline = [
-            {
-                '$match': {
-                    'user_id': ObjectId(current_user_id),
-                    'updated_at': {'$gte': start_date}
-                }
-            },
-            {
-                '$unwind': '$messages'
-            },
-            {
-                '$match': {
-                    'messages.role': 'user',
-                    'messages.timestamp': {'$gte': start_date}
-                }
-            },
-            {
-                '$project': {
-                    'content': '$messages.content',
-                    'length': {'$strLenCP': '$messages.content'}
-                }
-            },
-            {
-                '$match': {
-                    'length': {'$gte': 5}
-                }
-            },
-            {
-                '$limit': 100
-            }
+        recent_questions = [
+            q for q in rollup.get_counters(current_user_id)['questions']['recent']
+            if q['timestamp'] >= start_date
         ]
         
-        recent_questions = list(chat_model.collection.aggregate(popular_topics_pipeline))
-        
         return jsonify({
             'search_trends': search_trends,
             'recent_questions': [q['content'][:100] + '...' if len(q['content']) > 100 else q['content'] for q in recent_questions[-10:]],
@@ -257,90 +157,38 @@ def get_search_trends():
 def get_performance_metrics():
     try:
         current_user_id = get_jwt_identity()
-        document_model = Document(current_app.db)
-        chat_model = Chat(current_app.db)
-        
-        avg_processing_time_pipeline = [
-            {
-                '$match': {
-                    'user_id': ObjectId(current_user_id),
-                    'processing_status': 'completed',
-                    'processed_date': {'$exists': True},
-                    'upload_date': {'$exists': True}
-                }
-            },
-            {
-                '$project': {
-                    'processing_time': {
-                        '$subtract': ['$processed_date', '$upload_date']
-                    }
-                }
-            },
-            {
-                '$group': {
-                    '_id': None,
-                    'avg_processing_time': {'$avg': '$processing_time'},
-                    'min_processing_time': {'$min': '$processing_time'},
-                    'max_processing_time': {'$max': '$processing_time'},
-                    'count': {'$sum': 1}
-                }
-            }
-        ]
-        
-        processing_performance = list(document_model.collection.aggregate(avg_processing_time_pipeline))
-        
-        chat_response_pipeline = [
-            {
-                '$match': {
-                    'user_id': ObjectId(current_user_id)
-                }
-            },
-            {
-                '$unwind': '$messages'
-            },
-            {
-                '$match': {
-                    'messages.role': 'assistant',
-                    'messages.metadata.confidence': {'$exists': True}
-                }
-            },
-            {
-                '$group': {
-                    '_id': None,
-                    'avg_confidence': {'$avg': '$messages.metadata.confidence'},
-                    'high_confidence_count': {
-                        '$sum': {'$cond': [{'$gte': ['$messages.metadata.confidence', 0.7]}, 1, 0]}
-                    },
-                    'total_responses': {'$sum': 1}
-                }
-            }
-        ]
-        
-        chat_performance = list(chat_model.collection.aggregate(chat_response_pipeline))
+        counters = AnalyticsRollup(current_app.db).get_counters(current_user_id)
+        processing = counters['processing']
+        answers = counters['answers']
         
         vector_service = VectorService(current_app.chroma)
         vector_stats = vector_service.get_collection_stats()
         
         performance_data = {
             'document_processing': {
-                'average_time_ms': processing_performance[0]['avg_processing_time'] if processing_performance else 0,
-                'min_time_ms': processing_performance[0]['min_processing_time'] if processing_performance else 0,
-                'max_time_ms': processing_performance[0]['max_processing_time'] if processing_performance else 0,
-                'total_processed': processing_performance[0]['count'] if processing_performance else 0
+                'average_time_ms': processing['average_ms'],
+                'min_time_ms': processing['min_ms'],
+                'max_time_ms': processing['max_ms'],
+                'total_processed': processing['count']
             },
             'chat_performance': {
-                'average_confidence': round(chat_performance[0]['avg_confidence'], 3) if chat_performance else 0.0,
-                'high_confidence_responses': chat_performance[0]['high_confidence_count'] if chat_performance else 0,
-                'total_responses': chat_performance[0]['total_responses'] if chat_performance else 0,
+                'average_confidence': round(answers['average_confidence'], 3),
+                'high_confidence_responses': answers['high_confidence'],
+                'total_responses': answers['total'],
                 'success_rate': round(
-                    (chat_performance[0]['high_confidence_count'] / chat_performance[0]['total_responses']) * 100, 2
-                ) if chat_performance and chat_performance[0]['total_responses'] > 0 else 0.0
+                    (answers['high_confidence'] / answers['total']) * 100, 2
+                ) if answers['total'] > 0 else 0.0,
+                'confidence_histogram': answers['histogram']
             },
             'vector_database': vector_stats,
             'system_metrics': {
                 'uptime': 'Available',
                 'status': 'Healthy'
-            }
+            },
+            'llm_metrics': get_llm_gateway().get_metrics() if get_llm_gateway() else {},
+            'local_inference': get_scheduler_stats(),
+            'chat_context_queue': ChatContextQueue(current_app.db).get_stats(),
+            'session_cache': get_session_cache().stats() if get_session_cache() else {}
         }
         
         return jsonify(performance_data), 200
@@ -383,8 +231,8 @@ def export_data():
                 export_data.append({
                     'title': chat['title'],
                     'created_at': chat['created_at'].isoformat(),
-                    'message_count': len(chat['messages']),
-                    'messages': chat['messages']
+                    'message_count': chat['message_count'],
+                    'messages': chat_model.get_all_messages(str(chat['_id']))
                 })
         
         else:
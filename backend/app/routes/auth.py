@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required
 from app.models.user import User
+from app.services.qa_router import QA_POLICIES
+from app.services.question_templates import QuestionTemplates
 import re
 import logging
 
@@ -148,6 +150,7 @@ def get_profile():
                 'email': user['email'],
                 'name': user['name'],
                 'role': user.get('role', 'user'),
+                'settings': user.get('settings', {}),
                 'created_at': user['created_at'].isoformat(),
                 'document_count': stats.get('document_count', 0) if stats else 0,
                 'total_size': stats.get('total_size', 0) if stats else 0
@@ -174,6 +177,20 @@ def update_profile():
         if 'name' in data and data['name'].strip():
             update_data['name'] = data['name'].strip()
         
+        if 'qa_policy' in data:
+            if data['qa_policy'] not in QA_POLICIES:
+                return jsonify({
+                    'error': 'Invalid QA policy',
+                    'allowed_policies': list(QA_POLICIES.keys())
+                }), 400
+            update_data['settings.qa_policy'] = data['qa_policy']
+        
+        if 'question_templates' in data:
+            try:
+                update_data['settings.question_templates'] = QuestionTemplates.validate(data['question_templates'])
+            except ValueError as validation_error:
+                return jsonify({'error': str(validation_error)}), 400
+        
         if update_data:
             user_model.update_user(current_user_id, update_data)
         
@@ -185,7 +202,8 @@ def update_profile():
                 'id': str(updated_user['_id']),
                 'email': updated_user['email'],
                 'name': updated_user['name'],
-                'role': updated_user.get('role', 'user')
+                'role': updated_user.get('role', 'user'),
+                'settings': updated_user.get('settings', {})
             }
         }), 200
         
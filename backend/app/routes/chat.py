@@ -1,13 +1,124 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_socketio import emit
 from app.models.chat import Chat
 from app.models.document import Document
+from app.models.pagination import keyset_page
 from app.services.document_processor import DocumentProcessor
 from app.services.vector_service import VectorService
+from app.services.qa_cache import QACache, QA_CACHE_ENABLED
+from app.services.qa_router import QARouter
+from app.services.question_templates import QuestionTemplates, QUESTION_TEMPLATES_ENABLED
+from app.services.chat_context_writer import ChatContextQueue
+from app.services.conversation_memory import ConversationMemory, schedule_compaction
+from app.services.document_session_cache import get_session_cache
+from app.services.context_builder import CONTEXT_BUILDER_ENABLED
+from bson import ObjectId
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import time
 
 chat_bp = Blueprint('chat', __name__)
 
+BATCH_QA_MAX_ITEMS = int(os.getenv('BATCH_QA_MAX_ITEMS', 200))
+BATCH_QA_CONCURRENCY = int(os.getenv('BATCH_QA_CONCURRENCY', 4))
+BATCH_QA_MAX_QUESTION_CHARS = int(os.getenv('BATCH_QA_MAX_QUESTION_CHARS', 2000))
+
+def _answer_document_question(processor, question, user_id, document, n_results=5, top_k=3, fallback_k=2,
+                              on_token=None, query_embedding=None, search_results=None, session=None):
+    """Answer a question about a processed document, serving repeats from the QA cache.
+    
+    ``query_embedding`` and ``search_results`` may be precomputed by batch callers;
+    with a DocumentSession the chunk search runs in memory instead of in Chroma.
+    Returns None when retrieval finds no usable context.
+    """
+    document_id = str(document['_id'])
+    
+    # Standard questions were answered when the document was processed
+    if QUESTION_TEMPLATES_ENABLED:
+        template_answer = QuestionTemplates.find_answer(document, question)
+        if template_answer:
+            return {
+                'answer': template_answer['answer'],
+                'confidence': template_answer['confidence'],
+                'context_used': template_answer.get('context_used', ''),
+                'context': template_answer.get('context_used', ''),
+                'sources': template_answer.get('sources', []),
+                'search_results_count': 0,
+                'context_tokens': 0,
+                'rerank_time_ms': None,
+                'model': template_answer.get('model'),
+                'route': template_answer.get('route'),
+                'cache': 'template'
+            }
+    
+    qa_cache = QACache(current_app.db) if QA_CACHE_ENABLED else None
+    fingerprint = qa_cache.retrieval_fingerprint(document, processor.qa_model_name) if qa_cache else None
+    
+    if qa_cache:
+        cached = qa_cache.get_exact(document_id, question, fingerprint)
+        if cached:
+            return {**cached['result'], 'cache': 'exact'}
+    
+    if query_embedding is None:
+        query_embedding = processor.vector_service.embed_query(question)
+    
+    if qa_cache:
+        cached = qa_cache.get_semantic(document_id, query_embedding, fingerprint)
+        if cached:
+            return {**cached['result'], 'cache': 'semantic', 'cache_similarity': cached['similarity']}
+    
+    if session and search_results is None:
+        search_results = session.search(
+            query_embedding, processor.retrieval_fetch_count(n_results), include_embeddings=CONTEXT_BUILDER_ENABLED
+        )
+    
+    selection = processor.select_context_chunks(
+        question, user_id, document_id, n_results=n_results, top_k=top_k, fallback_k=fallback_k,
+        query_embedding=query_embedding, search_results=search_results
+    )
+    context = selection['context']
+    if not context.strip():
+        return None
+    
+    router = QARouter(current_app.db)
+    decision = router.decide(question, selection['retrieval_confidence'], router.get_policy(user_id))
+    
+    started = time.perf_counter()
+    qa_result = processor.answer_question(
+        question, context, document_id, on_token=on_token,
+        route=decision['route'], escalate_below=decision['escalate_below']
+    )
+    router.record(
+        user_id, document_id, question, decision, qa_result,
+        round((time.perf_counter() - started) * 1000, 2)
+    )
+    
+    result = {
+        'answer': qa_result['answer'],
+        'confidence': qa_result['confidence'],
+        'context_used': qa_result.get('context_used', ''),
+        'context': context,
+        'sources': selection['metadatas'][:3],
+        'search_results_count': len(selection['search_results']['documents']),
+        'context_tokens': selection['context_tokens'],
+        'rerank_time_ms': selection['rerank_time_ms'],
+        'model': qa_result.get('model'),
+        'route': qa_result.get('route'),
+        'cache': None
+    }
+    
+    # Only cache real answers, not service fallbacks
+    if qa_cache and qa_result.get('model') != 'fallback':
+        try:
+            qa_cache.put(document_id, question, fingerprint, query_embedding, result)
+        except Exception as cache_error:
+            print(f"Error caching answer: {cache_error}")
+    
+    return result
+
 @chat_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_chat():
@@ -20,9 +131,9 @@ def create_chat():
         
         if document_id:
             document_model = Document(current_app.db)
-            document = document_model.find_by_id(document_id)
+            document = document_model.find_owned(document_id, current_user_id)
             
-            if not document or str(document['user_id']) != current_user_id:
+            if not document:
                 return jsonify({'error': 'Document not found or access denied'}), 404
         
         chat_model = Chat(current_app.db)
@@ -37,7 +148,7 @@ def create_chat():
                 'document_id': str(chat['document_id']) if chat['document_id'] else None,
                 'title': chat['title'],
                 'created_at': chat['created_at'].isoformat(),
-                'message_count': len(chat['messages'])
+                'message_count': chat['message_count']
             }
         }), 201
         
@@ -49,11 +160,21 @@ def create_chat():
 def get_chats():
     try:
         current_user_id = get_jwt_identity()
+        cursor = request.args.get('cursor')
         skip = int(request.args.get('skip', 0))
         limit = min(int(request.args.get('limit', 20)), 100)
         
         chat_model = Chat(current_app.db)
-        chats = chat_model.find_by_user_id(current_user_id, skip, limit)
+        if skip and not cursor:
+            # Offset paging is kept for old clients; the cursor it returns continues by keyset
+            chats, next_cursor = keyset_page(
+                chat_model.find_by_user_id(current_user_id, skip, limit + 1), 'updated_at', limit
+            )
+        else:
+            try:
+                chats, next_cursor = chat_model.find_page_by_user_id(current_user_id, cursor, limit)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         
         chat_list = []
         for chat in chats:
@@ -63,13 +184,16 @@ def get_chats():
                 'title': chat['title'],
                 'created_at': chat['created_at'].isoformat(),
                 'updated_at': chat['updated_at'].isoformat(),
-                'message_count': len(chat['messages'])
+                'message_count': chat['message_count'],
+                'last_message': chat.get('last_message')
             })
         
         return jsonify({
             'chats': chat_list,
             'skip': skip,
-            'limit': limit
+            'limit': limit,
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -89,6 +213,12 @@ def get_chat(chat_id):
         if str(chat['user_id']) != current_user_id:
             return jsonify({'error': 'Access denied'}), 403
         
+        limit = min(int(request.args.get('limit', 100)), 500)
+        # One extra message tells whether older pages exist
+        messages = chat_model.get_chat_messages(chat_id, limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[-limit:]
+        
         return jsonify({
             'chat': {
                 'id': str(chat['_id']),
@@ -96,13 +226,217 @@ def get_chat(chat_id):
                 'title': chat['title'],
                 'created_at': chat['created_at'].isoformat(),
                 'updated_at': chat['updated_at'].isoformat(),
-                'messages': chat['messages']
+                'messages': messages,
+                'message_count': chat.get('message_count', len(messages)),
+                'has_more': has_more
             }
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@chat_bp.route('/<chat_id>/messages', methods=['GET'])
+@jwt_required()
+def get_chat_messages(chat_id):
+    try:
+        current_user_id = get_jwt_identity()
+        chat_model = Chat(current_app.db)
+        
+        chat = chat_model.find_by_id(chat_id)
+        if not chat:
+            return jsonify({'error': 'Chat not found'}), 404
+        
+        if str(chat['user_id']) != current_user_id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        before = request.args.get('before')
+        before_seq = int(before) if before is not None else None
+        limit = min(int(request.args.get('limit', 50)), 200)
+        
+        messages = chat_model.get_chat_messages(chat_id, limit + 1, before_seq)
+        has_more = len(messages) > limit
+        messages = messages[-limit:]
+        
+        return jsonify({
+            'messages': messages,
+            'chat_id': chat_id,
+            'has_more': has_more,
+            'next_before': messages[0]['seq'] if has_more else None
+        }), 200
+        
+    except ValueError:
+        return jsonify({'error': 'before and limit must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _generate_reply(processor, vector_service, chat, chat_id, message, user_id, on_token=None, message_seq=None):
+    """Produce the assistant reply for a chat message.
+    
+    ``message_seq`` is the stored user message, left out of the recent-turn window.
+    Returns (answer, metadata, context) where context is the document or chat history
+    text the answer was grounded on, or None when there was none.
+    """
+    context = None
+    if chat['document_id']:
+        # The session cache holds the document flags and chunk vectors between turns
+        session_cache = get_session_cache()
+        session = session_cache.get(chat_id, user_id) if session_cache else None
+        if session is None and session_cache:
+            try:
+                session = session_cache.warm(current_app.db, vector_service, chat)
+            except Exception as warm_error:
+                print(f"Error warming document session: {warm_error}")
+        
+        if session:
+            document = session.document if session.has_text else None
+        else:
+            document_model = Document(current_app.db)
+            document = document_model.find_by_id(str(chat['document_id']), Document.QA_PROJECTION)
+            if document and not document.get('has_text'):
+                document = None
+        
+        if document:
+            try:
+                print(f"Answering message from document: {message[:50]}...")
+                result = _answer_document_question(
+                    processor, message, user_id, document, 5, 3, 2, on_token, session=session
+                )
+                
+                if result:
+                    answer = result['answer']
+                    confidence = result['confidence']
+                    context = result['context']
+                    
+                    metadata = {
+                        'confidence': confidence,
+                        'context_used': result['context_used'],
+                        'search_results_count': result['search_results_count'],
+                        'context_tokens': result['context_tokens']
+                    }
+                    if result['rerank_time_ms'] is not None:
+                        metadata['rerank_time_ms'] = result['rerank_time_ms']
+                    if result['cache']:
+                        metadata['cache'] = result['cache']
+                    if result.get('route'):
+                        metadata['route'] = result['route']
+                    print(f"Answer generated successfully with confidence: {confidence}")
+                else:
+                    answer = "I couldn't find relevant information in the document to answer your question."
+                    metadata = {'confidence': 0.0}
+                    print("No context found in search results")
+            except Exception as search_error:
+                print(f"Error during document search/QA: {search_error}")
+                import traceback
+                print(f"Search/QA traceback: {traceback.format_exc()}")
+                answer = f"Error processing your question: {str(search_error)}"
+                metadata = {'confidence': 0.0, 'error': str(search_error)}
+        else:
+            answer = "Document is not available or hasn't been processed yet."
+            metadata = {'confidence': 0.0}
+            print("Document not found or not processed")
+    else:
+        try:
+            print("Getting conversation memory and relevant chat history...")
+            # Rolling summary plus recent turns keeps the prompt size fixed as the chat grows
+            memory_context = ConversationMemory(Chat(current_app.db)).build_context(chat, exclude_seq=message_seq)
+            relevant_history = vector_service.get_relevant_chat_history(message, chat_id, 2)
+            
+            context_parts = [memory_context] if memory_context else []
+            if relevant_history['contexts']:
+                context_parts.append("Related earlier exchanges:\n" + ' '.join(relevant_history['contexts']))
+            
+            if context_parts:
+                context = '\n\n'.join(context_parts)
+                print(f"Using chat history context, length: {len(context)}")
+                qa_result = processor.answer_question(message, context, on_token=on_token)
+                answer = qa_result['answer']
+                metadata = {
+                    'confidence': qa_result['confidence'],
+                    'context_type': 'conversation_memory' if memory_context else 'chat_history'
+                }
+                print(f"Answer from chat history generated with confidence: {qa_result['confidence']}")
+            else:
+                answer = "I don't have enough context to provide a specific answer. Could you provide more details or upload a relevant document?"
+                metadata = {'confidence': 0.0}
+                print("No relevant chat history found")
+        except Exception as history_error:
+            print(f"Error getting chat history: {history_error}")
+            import traceback
+            print(f"Chat history traceback: {traceback.format_exc()}")
+            answer = f"Error accessing chat history: {str(history_error)}"
+            metadata = {'confidence': 0.0, 'error': str(history_error)}
+    
+    return answer, metadata, context
+
+def _store_reply(chat_model, vector_service, chat, chat_id, user_id, message, answer, metadata, context,
+                 message_id=None):
+    stored_message = chat_model.add_message(chat_id, answer, 'assistant', metadata, message_id=message_id)
+    
+    if not chat['document_id']:
+        schedule_compaction(current_app._get_current_object(), chat_id)
+    
+    if chat['document_id']:
+        try:
+            # Embedding happens in the background writer, off the response path
+            writer = getattr(current_app, 'chat_context_writer', None)
+            if writer:
+                ChatContextQueue(current_app.db).enqueue(chat_id, user_id, message, answer, context)
+                writer.notify()
+                print("Chat context queued for the vector database")
+            else:
+                vector_service.add_chat_context(chat_id, user_id, message, answer, context)
+                print("Chat context added successfully")
+        except Exception as context_error:
+            print(f"Error adding chat context: {context_error}")
+            # Don't fail the request for this error, just log it
+    
+    return stored_message
+
+def _stream_reply(app_instance, websocket_notifications, chat, chat_id, message, user_id, message_id,
+                  message_seq=None):
+    """Generate a reply in the background, pushing tokens to the chat room as they arrive."""
+    with app_instance.app_context():
+        started = time.perf_counter()
+        first_token_ms = None
+        streamed = []
+        
+        def on_token(token):
+            nonlocal first_token_ms
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+            streamed.append(token)
+            websocket_notifications.notify_chat_message_token(chat_id, message_id, token)
+        
+        try:
+            processor = DocumentProcessor(app_instance.chroma, app_instance.db)
+            vector_service = VectorService(app_instance.chroma)
+            answer, metadata, context = _generate_reply(
+                processor, vector_service, chat, chat_id, message, user_id, on_token, message_seq
+            )
+            
+            # Cached, local-model and fixed replies arrive in one piece
+            if not streamed:
+                on_token(answer)
+            metadata['time_to_first_token_ms'] = first_token_ms
+            metadata['total_time_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            
+            chat_model = Chat(app_instance.db)
+            _store_reply(chat_model, vector_service, chat, chat_id, user_id, message, answer, metadata, context,
+                         message_id=message_id)
+            
+            websocket_notifications.notify_chat_message_complete(chat_id, {
+                'id': message_id,
+                'role': 'assistant',
+                'content': answer,
+                'timestamp': datetime.utcnow().isoformat(),
+                'metadata': metadata
+            })
+        except Exception as e:
+            import traceback
+            print(f"Error streaming reply for chat {chat_id}: {e}")
+            print(f"Streaming traceback: {traceback.format_exc()}")
+            websocket_notifications.notify_chat_message_failed(chat_id, message_id, str(e))
+
 @chat_bp.route('/<chat_id>/messages', methods=['POST'])
 @jwt_required()
 def send_message(chat_id):
@@ -126,14 +460,34 @@ def send_message(chat_id):
         if str(chat['user_id']) != current_user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        chat_model.add_message(chat_id, message, 'user')
+        user_message = chat_model.add_message(chat_id, message, 'user')
+        
+        if data.get('stream'):
+            websocket_notifications = getattr(current_app, 'websocket_notifications', None)
+            if not websocket_notifications:
+                return jsonify({'error': 'Streaming is not available'}), 503
+            if not current_app.chroma:
+                return jsonify({'error': 'Service initialization failed: ChromaDB client not initialized'}), 500
+            
+            message_id = str(ObjectId())
+            websocket_notifications.socketio.start_background_task(
+                _stream_reply, current_app._get_current_object(), websocket_notifications,
+                chat, chat_id, message, current_user_id, message_id,
+                user_message['seq'] if user_message else None
+            )
+            
+            return jsonify({
+                'chat_id': chat_id,
+                'message_id': message_id,
+                'status': 'streaming'
+            }), 202
         
         print(f"Creating DocumentProcessor and VectorService for chat {chat_id}")
         try:
             if not current_app.chroma:
                 raise Exception("ChromaDB client not initialized")
             
-            processor = DocumentProcessor(current_app.chroma)
+            processor = DocumentProcessor(current_app.chroma, current_app.db)
             vector_service = VectorService(current_app.chroma)
             print("Services created successfully")
         except Exception as service_error:
@@ -142,105 +496,17 @@ def send_message(chat_id):
             print(f"Service creation traceback: {traceback.format_exc()}")
             return jsonify({'error': f'Service initialization failed: {str(service_error)}'}), 500
         
-        if chat['document_id']:
-            document_model = Document(current_app.db)
-            document = document_model.find_by_id(str(chat['document_id']))
-            
-            if document and document.get('extracted_text'):
-                try:
-                    print(f"Searching documents for message: {message[:50]}...")
-                    search_results = processor.search_documents(
-                        message, current_user_id, str(chat['document_id']), 5
-                    )
-                    print(f"Search completed, found {len(search_results.get('documents', []))} results")
-                    
-                    # Filter and rank results by relevance (distance/similarity)
-                    if search_results['documents'] and search_results['distances']:
-                        # Only use chunks with good similarity (distance < 0.8)
-                        good_chunks = []
-                        for i, distance in enumerate(search_results['distances']):
-                            if distance < 0.8 and i < len(search_results['documents']):
-                                good_chunks.append(search_results['documents'][i])
-                        
-                        # Use top 3 good chunks or all if fewer than 3
-                        context_chunks = good_chunks[:3] if good_chunks else search_results['documents'][:2]
-                        context = ' '.join(context_chunks)
-                        
-                        print(f"Using {len(context_chunks)} relevant chunks (filtered from {len(search_results['documents'])})")
-                    else:
-                        context = ' '.join(search_results['documents'][:3])
-                    
-                    if context.strip():
-                        print(f"Generating answer with context length: {len(context)}")
-                        qa_result = processor.answer_question(message, context, str(chat['document_id']))
-                        answer = qa_result['answer']
-                        confidence = qa_result['confidence']
-                        
-                        metadata = {
-                            'confidence': confidence,
-                            'context_used': qa_result.get('context_used', ''),
-                            'search_results_count': len(search_results['documents'])
-                        }
-                        print(f"Answer generated successfully with confidence: {confidence}")
-                    else:
-                        answer = "I couldn't find relevant information in the document to answer your question."
-                        metadata = {'confidence': 0.0}
-                        print("No context found in search results")
-                except Exception as search_error:
-                    print(f"Error during document search/QA: {search_error}")
-                    import traceback
-                    print(f"Search/QA traceback: {traceback.format_exc()}")
-                    answer = f"Error processing your question: {str(search_error)}"
-                    metadata = {'confidence': 0.0, 'error': str(search_error)}
-            else:
-                answer = "Document is not available or hasn't been processed yet."
-                metadata = {'confidence': 0.0}
-                print("Document not found or not processed")
-        else:
-            try:
-                print("Getting relevant chat history...")
-                relevant_history = vector_service.get_relevant_chat_history(message, chat_id, 2)
-                
-                if relevant_history['contexts']:
-                    context = ' '.join(relevant_history['contexts'])
-                    print(f"Using chat history context, length: {len(context)}")
-                    qa_result = processor.answer_question(message, context)
-                    answer = qa_result['answer']
-                    metadata = {
-                        'confidence': qa_result['confidence'],
-                        'context_type': 'chat_history'
-                    }
-                    print(f"Answer from chat history generated with confidence: {qa_result['confidence']}")
-                else:
-                    answer = "I don't have enough context to provide a specific answer. Could you provide more details or upload a relevant document?"
-                    metadata = {'confidence': 0.0}
-                    print("No relevant chat history found")
-            except Exception as history_error:
-                print(f"Error getting chat history: {history_error}")
-                import traceback
-                print(f"Chat history traceback: {traceback.format_exc()}")
-                answer = f"Error accessing chat history: {str(history_error)}"
-                metadata = {'confidence': 0.0, 'error': str(history_error)}
+        answer, metadata, context = _generate_reply(
+            processor, vector_service, chat, chat_id, message, current_user_id,
+            message_seq=user_message['seq'] if user_message else None
+        )
         
-        chat_model.add_message(chat_id, answer, 'assistant', metadata)
-        
-        if chat['document_id']:
-            try:
-                print("Adding chat context to vector database...")
-                vector_service.add_chat_context(
-                    chat_id, current_user_id, message, answer,
-                    context if 'context' in locals() else None
-                )
-                print("Chat context added successfully")
-            except Exception as context_error:
-                print(f"Error adding chat context: {context_error}")
-                # Don't fail the request for this error, just log it
-        
-        updated_chat = chat_model.find_by_id(chat_id)
-        latest_messages = updated_chat['messages'][-2:]
+        assistant_message = _store_reply(
+            chat_model, vector_service, chat, chat_id, current_user_id, message, answer, metadata, context
+        )
         
         return jsonify({
-            'messages': latest_messages,
+            'messages': [user_message, assistant_message],
             'chat_id': chat_id
         }), 200
         
@@ -265,7 +531,7 @@ def update_chat(chat_id):
             return jsonify({'error': 'Title cannot be empty'}), 400
         
         chat_model = Chat(current_app.db)
-        chat = chat_model.find_by_id(chat_id)
+        chat = chat_model.find_by_id(chat_id, Chat.OWNERSHIP_PROJECTION)
         
         if not chat:
             return jsonify({'error': 'Chat not found'}), 404
@@ -287,13 +553,16 @@ def delete_chat(chat_id):
         current_user_id = get_jwt_identity()
         chat_model = Chat(current_app.db)
         
-        chat = chat_model.find_by_id(chat_id)
+        chat = chat_model.find_by_id(chat_id, Chat.OWNERSHIP_PROJECTION)
         if not chat:
             return jsonify({'error': 'Chat not found'}), 404
         
         if str(chat['user_id']) != current_user_id:
             return jsonify({'error': 'Access denied'}), 403
         
+        ChatContextQueue(current_app.db).discard_chat(chat_id)
+        if get_session_cache():
+            get_session_cache().evict(chat_id)
         vector_service = VectorService(current_app.chroma)
         vector_service.delete_chat_embeddings(chat_id)
         
@@ -311,7 +580,7 @@ def clear_chat(chat_id):
         current_user_id = get_jwt_identity()
         chat_model = Chat(current_app.db)
         
-        chat = chat_model.find_by_id(chat_id)
+        chat = chat_model.find_by_id(chat_id, Chat.OWNERSHIP_PROJECTION)
         if not chat:
             return jsonify({'error': 'Chat not found'}), 404
         
@@ -320,6 +589,9 @@ def clear_chat(chat_id):
         
         chat_model.clear_chat_messages(chat_id)
         
+        ChatContextQueue(current_app.db).discard_chat(chat_id)
+        if get_session_cache():
+            get_session_cache().evict(chat_id)
         vector_service = VectorService(current_app.chroma)
         vector_service.delete_chat_embeddings(chat_id)
         
@@ -344,33 +616,21 @@ def ask_question():
         
         document_id = data.get('document_id')
         
-        processor = DocumentProcessor(current_app.chroma)
+        processor = DocumentProcessor(current_app.chroma, current_app.db)
         
         if document_id:
             document_model = Document(current_app.db)
-            document = document_model.find_by_id(document_id)
+            document = document_model.find_owned(document_id, current_user_id, Document.QA_PROJECTION)
             
-            if not document or str(document['user_id']) != current_user_id:
+            if not document:
                 return jsonify({'error': 'Document not found or access denied'}), 404
             
-            if not document.get('extracted_text'):
+            if not document.get('has_text'):
                 return jsonify({'error': 'Document has not been processed yet'}), 400
             
-            search_results = processor.search_documents(question, current_user_id, document_id, 7)
-            
-            # Filter results by relevance for better QA
-            if search_results['documents'] and search_results['distances']:
-                good_chunks = []
-                for i, distance in enumerate(search_results['distances']):
-                    if distance < 0.8 and i < len(search_results['documents']):
-                        good_chunks.append(search_results['documents'][i])
-                
-                context_chunks = good_chunks[:4] if good_chunks else search_results['documents'][:3]
-                context = ' '.join(context_chunks)
-            else:
-                context = ' '.join(search_results['documents'][:3])
+            result = _answer_document_question(processor, question, current_user_id, document, 7, 4, 3)
             
-            if not context.strip():
+            if not result:
                 return jsonify({
                     'answer': "I couldn't find relevant information in the document to answer your question.",
                     'confidence': 0.0,
@@ -378,20 +638,172 @@ def ask_question():
                     'sources': []
                 }), 200
             
-            qa_result = processor.answer_question(question, context, document_id)
-            
             return jsonify({
                 'question': question,
-                'answer': qa_result['answer'],
-                'confidence': qa_result['confidence'],
-                'context_used': qa_result.get('context_used', ''),
-                'sources': search_results['metadatas'][:3],
-                'document_id': document_id
+                'answer': result['answer'],
+                'confidence': result['confidence'],
+                'context_used': result['context_used'],
+                'sources': result['sources'],
+                'document_id': document_id,
+                'rerank_time_ms': result['rerank_time_ms'],
+                'cached': result['cache']
             }), 200
         else:
             return jsonify({
                 'error': 'Document ID is required for question answering'
             }), 400
         
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _answer_batch_item(app_instance, processor, item, user_id):
+    with app_instance.app_context():
+        result = _answer_document_question(
+            processor, item['question'], user_id, item['document'], 7, 4, 3,
+            query_embedding=item['query_embedding'], search_results=item['search_results']
+        )
+    
+    answer = {
+        'type': 'answer',
+        'index': item['index'],
+        'document_id': str(item['document']['_id']),
+        'question': item['question']
+    }
+    if not result:
+        answer.update({
+            'answer': "I couldn't find relevant information in the document to answer your question.",
+            'confidence': 0.0,
+            'context_used': '',
+            'sources': [],
+            'cached': None
+        })
+    else:
+        answer.update({
+            'answer': result['answer'],
+            'confidence': result['confidence'],
+            'context_used': result['context_used'],
+            'sources': result['sources'],
+            'route': result.get('route'),
+            'cached': result['cache']
+        })
+    return answer
+
+@chat_bp.route('/ask/batch', methods=['POST'])
+@jwt_required()
+def ask_questions_batch():
+    """Answer many questions about one or more documents, sharing retrieval work.
+    
+    All questions are embedded in one call and each document is searched with a
+    single multi-query vector search. Answers are generated with bounded
+    concurrency and streamed back as newline-delimited JSON as they complete.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('questions'), list):
+            return jsonify({'error': 'A list of questions is required'}), 400
+        
+        if not all(isinstance(q, str) for q in data['questions']):
+            return jsonify({'error': 'Each question must be a string'}), 400
+        
+        questions = [q.strip() for q in data['questions'] if q.strip()]
+        if not questions:
+            return jsonify({'error': 'Questions cannot be empty'}), 400
+        
+        if any(len(q) > BATCH_QA_MAX_QUESTION_CHARS for q in questions):
+            return jsonify({'error': f'Questions can be at most {BATCH_QA_MAX_QUESTION_CHARS} characters long'}), 400
+        
+        document_ids = data.get('document_ids')
+        if document_ids is None and data.get('document_id'):
+            document_ids = [data['document_id']]
+        if not isinstance(document_ids, list) or not document_ids:
+            return jsonify({'error': 'Document ID is required for question answering'}), 400
+        
+        if not all(isinstance(d, str) and ObjectId.is_valid(d) for d in document_ids):
+            return jsonify({'error': 'Each document ID must be a valid ID string'}), 400
+        document_ids = list(dict.fromkeys(document_ids))
+        
+        if len(questions) * len(document_ids) > BATCH_QA_MAX_ITEMS:
+            return jsonify({'error': f'A batch can contain at most {BATCH_QA_MAX_ITEMS} question/document pairs'}), 400
+        
+        document_model = Document(current_app.db)
+        documents = []
+        for document_id in document_ids:
+            document = document_model.find_owned(document_id, current_user_id, Document.QA_PROJECTION)
+            if not document:
+                return jsonify({'error': f'Document {document_id} not found or access denied'}), 404
+            if not document.get('has_text'):
+                return jsonify({'error': f'Document {document_id} has not been processed yet'}), 400
+            documents.append(document)
+        
+        processor = DocumentProcessor(current_app.chroma, current_app.db)
+        
+        # One embedding call for every question, one vector query per document
+        query_embeddings = processor.vector_service.embed_queries(questions)
+        fetch_count = processor.retrieval_fetch_count(7)
+        items = []
+        for document in documents:
+            search_results = processor.vector_service.search_documents_batch(
+                query_embeddings, current_user_id, fetch_count, str(document['_id']),
+                include_embeddings=CONTEXT_BUILDER_ENABLED
+            )
+            for i, question in enumerate(questions):
+                items.append({
+                    'index': len(items),
+                    'question': question,
+                    'document': document,
+                    'query_embedding': query_embeddings[i],
+                    'search_results': search_results[i]
+                })
+        
+        app_instance = current_app._get_current_object()
+        
+        def generate_answers():
+            started = time.perf_counter()
+            failed = 0
+            executor = ThreadPoolExecutor(max_workers=BATCH_QA_CONCURRENCY)
+            try:
+                futures = {
+                    executor.submit(_answer_batch_item, app_instance, processor, item, current_user_id): item
+                    for item in items
+                }
+                for future in as_completed(futures):
+                    item = futures[future]
+                    try:
+                        yield future.result()
+                    except Exception as e:
+                        print(f"Batch question {item['index']} failed: {e}")
+                        failed += 1
+                        yield {
+                            'type': 'error',
+                            'index': item['index'],
+                            'document_id': str(item['document']['_id']),
+                            'question': item['question'],
+                            'error': str(e)
+                        }
+            finally:
+                # On a client disconnect, drop the queued questions instead of answering them
+                executor.shutdown(wait=False, cancel_futures=True)
+            yield {
+                'type': 'summary',
+                'total': len(items),
+                'answered': len(items) - failed,
+                'failed': failed,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+            }
+        
+        if data.get('stream', True):
+            return Response(
+                stream_with_context(json.dumps(line) + '\n' for line in generate_answers()),
+                mimetype='application/x-ndjson'
+            )
+        
+        lines = list(generate_answers())
+        return jsonify({
+            'results': sorted([line for line in lines if line['type'] != 'summary'], key=lambda line: line['index']),
+            'summary': lines[-1]
+        }), 200
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
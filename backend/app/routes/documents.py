@@ -2,7 +2,12 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 from app.models.document import Document
+from app.models.document_text import DOCUMENT_TEXT_PAGE_CHARS
+from app.models.pagination import keyset_page
 from app.services.document_processor import DocumentProcessor
+from app.services.qa_cache import QACache
+from app.services.question_templates import QuestionTemplates, QUESTION_TEMPLATES_ENABLED
+from app.services.document_session_cache import get_session_cache
 import os
 import uuid
 from datetime import datetime
@@ -14,10 +19,26 @@ ALLOWED_EXTENSIONS = {
     'pdf', 'doc', 'docx', 'txt', 'jpg', 'jpeg', 'png', 'gif', 'bmp'
 }
 
+MAX_TEXT_PAGE_CHARS = int(os.getenv('MAX_TEXT_PAGE_CHARS', 100000))
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def document_list_item(doc):
+    return {
+        'id': str(doc['_id']),
+        'filename': doc['filename'],
+        'size': doc['size'],
+        'content_type': doc['content_type'],
+        'processing_status': doc['processing_status'],
+        'upload_date': doc['upload_date'].isoformat(),
+        'processed_date': doc['processed_date'].isoformat() if doc['processed_date'] else None,
+        'summary': doc.get('summary'),
+        'tags': doc.get('tags', []),
+        'metadata': doc.get('metadata', {})
+    }
+
 def get_file_size(filepath):
     return os.path.getsize(filepath) if os.path.exists(filepath) else 0
 
@@ -63,7 +84,7 @@ def upload_document():
         
         # Return immediately with basic document info
         print(f"Document uploaded successfully: {document_id}")
-        document = document_model.find_by_id(document_id)
+        document = document_model.find_by_id(document_id, Document.LIST_PROJECTION)
         
         # Start background processing using threading
         import threading
@@ -94,7 +115,7 @@ def upload_document():
                                 {'document_id': document_id, 'status': 'processing'}
                             )
                         
-                        processor = DocumentProcessor(chroma_client)
+                        processor = DocumentProcessor(chroma_client, app_instance.db)
                         print("DocumentProcessor created successfully")
                         
                         processing_result = processor.process_document(
@@ -102,14 +123,17 @@ def upload_document():
                         )
                         print(f"Document processing completed with status: {processing_result.get('status')}")
                     
+                    # Extracted text goes to the compressed text store, not the document
+                    document_model.store_text(document_id, current_user_id, processing_result.get('extracted_text'))
+                    
                     # Update document with processing results
                     update_data = {
                         'processing_status': processing_result['status'],
-                        'extracted_text': processing_result.get('extracted_text'),
                         'summary': processing_result.get('summary'),
                         'key_insights': processing_result.get('key_insights', []),
                         'metadata': processing_result.get('processing_metadata', {}),
-                        'embeddings_stored': processing_result['status'] == 'completed'
+                        'embeddings_stored': processing_result['status'] == 'completed',
+                        'template_answers': []
                     }
                     
                     if processing_result['status'] == 'failed':
@@ -118,8 +142,13 @@ def upload_document():
                     document_model.update_document(document_id, update_data)
                     print(f"Document {document_id} updated with processing results")
                     
+                    # Answers cached against the previous index are no longer valid
+                    QACache(app_instance.db).invalidate_document(document_id)
+                    if get_session_cache():
+                        get_session_cache().invalidate_document(document_id)
+                    
                     # Get updated document to send complete data to frontend
-                    updated_document = document_model.find_by_id(document_id)
+                    updated_document = document_model.find_by_id(document_id, Document.LIST_PROJECTION)
                     
                     # Notify frontend that processing completed
                     if websocket_notifications:
@@ -161,6 +190,23 @@ def upload_document():
                                 }
                             }
                         )
+                    
+                    # Answer the tenant's standard questions now so they are served instantly later
+                    if QUESTION_TEMPLATES_ENABLED and processing_result['status'] == 'completed':
+                        try:
+                            template_answers = QuestionTemplates(app_instance.db).precompute(
+                                processor, document_id, current_user_id
+                            )
+                            if get_session_cache():
+                                get_session_cache().invalidate_document(document_id)
+                            if websocket_notifications:
+                                websocket_notifications.notify_user(
+                                    current_user_id,
+                                    'document_template_answers_ready',
+                                    {'document_id': document_id, 'count': len(template_answers)}
+                                )
+                        except Exception as template_error:
+                            print(f"Error precomputing template answers: {template_error}")
                         
                 except Exception as proc_error:
                     print(f"Error during async document processing: {proc_error}")
@@ -218,34 +264,35 @@ def upload_document():
 def get_documents():
     try:
         current_user_id = get_jwt_identity()
+        cursor = request.args.get('cursor')
         skip = int(request.args.get('skip', 0))
         limit = min(int(request.args.get('limit', 20)), 100)
+        exact_total = request.args.get('exact_total', 'false').lower() == 'true'
         
         document_model = Document(current_app.db)
-        documents = document_model.find_by_user_id(current_user_id, skip, limit)
-        
-        document_list = []
-        for doc in documents:
-            document_list.append({
-                'id': str(doc['_id']),
-                'filename': doc['filename'],
-                'size': doc['size'],
-                'content_type': doc['content_type'],
-                'processing_status': doc['processing_status'],
-                'upload_date': doc['upload_date'].isoformat(),
-                'processed_date': doc['processed_date'].isoformat() if doc['processed_date'] else None,
-                'summary': doc.get('summary'),
-                'tags': doc.get('tags', []),
-                'metadata': doc.get('metadata', {})
-            })
+        if skip and not cursor:
+            # Offset paging is kept for old clients; the cursor it returns continues by keyset
+            documents, next_cursor = keyset_page(
+                document_model.find_by_user_id(current_user_id, skip, limit + 1), 'upload_date', limit
+            )
+        else:
+            try:
+                documents, next_cursor = document_model.find_page_by_user_id(current_user_id, cursor, limit)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        document_list = [document_list_item(doc) for doc in documents]
         
-        total_count = document_model.get_user_document_count(current_user_id)
+        total_count = document_model.get_user_document_count(current_user_id, exact=exact_total)
         
         return jsonify({
             'documents': document_list,
             'total': total_count,
+            'total_exact': exact_total,
             'skip': skip,
-            'limit': limit
+            'limit': limit,
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -258,13 +305,17 @@ def get_document(document_id):
         current_user_id = get_jwt_identity()
         document_model = Document(current_app.db)
         
-        document = document_model.find_by_id(document_id)
+        document = document_model.find_by_id(document_id, Document.LIST_PROJECTION)
         if not document:
             return jsonify({'error': 'Document not found'}), 404
         
         if str(document['user_id']) != current_user_id:
             return jsonify({'error': 'Access denied'}), 403
         
+        text_offset = max(int(request.args.get('text_offset', 0)), 0)
+        text_limit = min(int(request.args.get('text_limit', DOCUMENT_TEXT_PAGE_CHARS)), MAX_TEXT_PAGE_CHARS)
+        text_page = document_model.get_text_page(document, text_offset, text_limit)
+        
         return jsonify({
             'document': {
                 'id': str(document['_id']),
@@ -274,7 +325,8 @@ def get_document(document_id):
                 'processing_status': document['processing_status'],
                 'upload_date': document['upload_date'].isoformat(),
                 'processed_date': document['processed_date'].isoformat() if document['processed_date'] else None,
-                'extracted_text': document.get('extracted_text'),
+                'extracted_text': text_page.pop('text'),
+                'text_page': text_page,
                 'summary': document.get('summary'),
                 'key_insights': document.get('key_insights', []),
                 'tags': document.get('tags', []),
@@ -285,6 +337,28 @@ def get_document(document_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@documents_bp.route('/<document_id>/text', methods=['GET'])
+@jwt_required()
+def get_document_text(document_id):
+    try:
+        current_user_id = get_jwt_identity()
+        document_model = Document(current_app.db)
+        
+        document = document_model.find_by_id(document_id, {'user_id': 1, 'text_length': 1})
+        if not document:
+            return jsonify({'error': 'Document not found'}), 404
+        
+        if str(document['user_id']) != current_user_id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(int(request.args.get('limit', DOCUMENT_TEXT_PAGE_CHARS)), MAX_TEXT_PAGE_CHARS)
+        
+        return jsonify(document_model.get_text_page(document, offset, limit)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @documents_bp.route('/<document_id>', methods=['DELETE'])
 @jwt_required()
 def delete_document(document_id):
@@ -292,7 +366,7 @@ def delete_document(document_id):
         current_user_id = get_jwt_identity()
         document_model = Document(current_app.db)
         
-        document = document_model.find_by_id(document_id)
+        document = document_model.find_by_id(document_id, Document.OWNERSHIP_PROJECTION)
         if not document:
             return jsonify({'error': 'Document not found'}), 404
         
@@ -302,9 +376,12 @@ def delete_document(document_id):
         if document.get('filepath') and os.path.exists(document['filepath']):
             os.remove(document['filepath'])
         
-        processor = DocumentProcessor(current_app.chroma)
+        processor = DocumentProcessor(current_app.chroma, current_app.db)
         processor.delete_document_data(document_id)
         
+        QACache(current_app.db).invalidate_document(document_id)
+        if get_session_cache():
+            get_session_cache().invalidate_document(document_id)
         document_model.delete_document(document_id)
         
         return jsonify({'message': 'Document deleted successfully'}), 200
@@ -329,7 +406,25 @@ def search_documents():
         document_id = data.get('document_id')
         limit = min(int(data.get('limit', 10)), 50)
         
-        processor = DocumentProcessor(current_app.chroma)
+        # Keyword mode lists whole documents and pages through them by cursor
+        if data.get('mode') == 'keyword':
+            try:
+                documents, next_cursor = Document(current_app.db).search_documents(
+                    current_user_id, query, data.get('cursor'), limit
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({
+                'query': query,
+                'mode': 'keyword',
+                'documents': [document_list_item(doc) for doc in documents],
+                'count': len(documents),
+                'has_more': next_cursor is not None,
+                'next_cursor': next_cursor
+            }), 200
+        
+        processor = DocumentProcessor(current_app.chroma, current_app.db)
         results = processor.search_documents(query, current_user_id, document_id, limit)
         
         return jsonify({
@@ -360,7 +455,7 @@ def add_tag(document_id):
             return jsonify({'error': 'Tag cannot be empty'}), 400
         
         document_model = Document(current_app.db)
-        document = document_model.find_by_id(document_id)
+        document = document_model.find_by_id(document_id, Document.OWNERSHIP_PROJECTION)
         
         if not document:
             return jsonify({'error': 'Document not found'}), 404
@@ -382,7 +477,7 @@ def remove_tag(document_id, tag):
         current_user_id = get_jwt_identity()
         document_model = Document(current_app.db)
         
-        document = document_model.find_by_id(document_id)
+        document = document_model.find_by_id(document_id, Document.OWNERSHIP_PROJECTION)
         if not document:
             return jsonify({'error': 'Document not found'}), 404
         
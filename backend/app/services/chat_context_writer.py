@@ -0,0 +1,204 @@
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, IndexModel
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHAT_CONTEXT_BATCH_SIZE = int(os.getenv('CHAT_CONTEXT_BATCH_SIZE', 32))
+CHAT_CONTEXT_POLL_SECONDS = float(os.getenv('CHAT_CONTEXT_POLL_SECONDS', 2))
+CHAT_CONTEXT_LEASE_SECONDS = int(os.getenv('CHAT_CONTEXT_LEASE_SECONDS', 60))
+CHAT_CONTEXT_MAX_ATTEMPTS = int(os.getenv('CHAT_CONTEXT_MAX_ATTEMPTS', 5))
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+FAILED = 'failed'
+
+
+class ChatContextQueue:
+    """Durable queue of Q&A turns waiting to be embedded into the chat history index.
+
+    Workers claim entries with a lease; an entry whose lease expires (for example
+    because the worker died mid-batch) is claimed again, so delivery is at least
+    once. The vector id is derived from the queue id, which makes redelivery an
+    idempotent upsert rather than a duplicate.
+    """
+    COLLECTION = 'chat_context_queue'
+    INDEXES = [
+        IndexModel([('status', 1), ('lease_until', 1)]),
+        IndexModel([('chat_id', 1)])
+    ]
+    HOT_QUERIES = [
+        {
+            'name': 'claimable queue entries',
+            'filter': {
+                'status': {'$in': [PENDING, PROCESSING]},
+                '$or': [{'lease_until': None}, {'lease_until': {'$lte': datetime(2024, 1, 1)}}]
+            },
+            'sort': [('created_at', 1)]
+        }
+    ]
+
+    def __init__(self, db):
+        self.collection = db[self.COLLECTION]
+
+    def enqueue(self, chat_id, user_id, question, answer, document_context=None):
+        result = self.collection.insert_one({
+            'chat_id': chat_id,
+            'user_id': user_id,
+            'question': question,
+            'answer': answer,
+            'document_context': document_context,
+            'status': PENDING,
+            'attempts': 0,
+            'lease_until': None,
+            'created_at': datetime.utcnow()
+        })
+        return str(result.inserted_id)
+
+    def claim_batch(self, worker_id, limit=CHAT_CONTEXT_BATCH_SIZE):
+        now = datetime.utcnow()
+        claimable = {
+            'status': {'$in': [PENDING, PROCESSING]},
+            '$or': [{'lease_until': None}, {'lease_until': {'$lte': now}}]
+        }
+        batch = []
+        for _ in range(limit):
+            entry = self.collection.find_one_and_update(
+                claimable,
+                {
+                    '$set': {
+                        'status': PROCESSING,
+                        'worker_id': worker_id,
+                        'lease_until': now + timedelta(seconds=CHAT_CONTEXT_LEASE_SECONDS)
+                    },
+                    '$inc': {'attempts': 1}
+                },
+                sort=[('created_at', 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if not entry:
+                break
+            batch.append(entry)
+        return batch
+
+    def complete(self, entry_ids, worker_id):
+        """Remove finished entries; returns the ids that were no longer in the queue.
+
+        An entry missing here was discarded while it was being written, so the
+        caller has to remove what it just stored. Entries another worker claimed
+        after this worker's lease expired are left for that worker.
+        """
+        gone = []
+        for entry_id in entry_ids:
+            if self.collection.delete_one({'_id': entry_id, 'worker_id': worker_id}).deleted_count:
+                continue
+            if not self.collection.find_one({'_id': entry_id}, {'_id': 1}):
+                gone.append(entry_id)
+        return gone
+
+    def fail(self, entries, error):
+        for entry in entries:
+            if entry['attempts'] >= CHAT_CONTEXT_MAX_ATTEMPTS:
+                update = {'status': FAILED, 'error': str(error), 'lease_until': None}
+            else:
+                # Back off before the entry becomes claimable again
+                retry_at = datetime.utcnow() + timedelta(seconds=CHAT_CONTEXT_POLL_SECONDS * 2 ** entry['attempts'])
+                update = {'status': PENDING, 'error': str(error), 'lease_until': retry_at}
+            self.collection.update_one({'_id': entry['_id']}, {'$set': update})
+
+    def discard_chat(self, chat_id):
+        return self.collection.delete_many({'chat_id': chat_id})
+
+    def get_stats(self):
+        counts = {PENDING: 0, PROCESSING: 0, FAILED: 0}
+        for row in self.collection.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+            counts[row['_id']] = row['count']
+        return counts
+
+
+class ChatContextWriter:
+    """Background thread that drains ChatContextQueue in batches.
+
+    Each batch is embedded with a single embedding call and upserted into the
+    chat history collection. enqueue callers can wake the writer with notify();
+    otherwise it polls every CHAT_CONTEXT_POLL_SECONDS.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='chat-context-writer', daemon=True)
+        self.thread.start()
+        logger.info(f"Chat context writer {self.worker_id} started")
+
+    def notify(self):
+        self.wakeup.set()
+
+    def _run(self):
+        from app.services.vector_service import VectorService
+
+        with self.app.app_context():
+            queue = ChatContextQueue(self.app.db)
+            vector_service = VectorService(self.app.chroma)
+            while True:
+                try:
+                    processed = self.process_batch(queue, vector_service)
+                except Exception as e:
+                    logger.error(f"Chat context writer error: {e}")
+                    processed = 0
+                if not processed:
+                    self.wakeup.wait(CHAT_CONTEXT_POLL_SECONDS)
+                    self.wakeup.clear()
+
+    def process_batch(self, queue, vector_service):
+        batch = queue.claim_batch(self.worker_id)
+        if not batch:
+            return 0
+        try:
+            vector_service.add_chat_contexts([
+                {
+                    'id': f"{entry['chat_id']}_{entry['_id']}",
+                    'chat_id': entry['chat_id'],
+                    'user_id': entry['user_id'],
+                    'question': entry['question'],
+                    'answer': entry['answer'],
+                    'document_context': entry.get('document_context')
+                }
+                for entry in batch
+            ])
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} chat contexts: {e}")
+            queue.fail(batch, e)
+            return 0
+        # The chat may have been deleted or cleared while this batch was in flight
+        discarded = set(queue.complete([entry['_id'] for entry in batch], self.worker_id))
+        if discarded:
+            vector_service.delete_chat_contexts([
+                f"{entry['chat_id']}_{entry['_id']}" for entry in batch if entry['_id'] in discarded
+            ])
+        return len(batch)
+
+
+def start_chat_context_writer(app):
+    # Under the debug reloader the parent process only watches files; its in-memory
+    # ChromaDB client is not the one serving requests
+    if os.getenv('FLASK_DEBUG', 'False').lower() == 'true' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return None
+    if app.db is None or app.chroma is None:
+        logger.warning("Chat context writer not started: database or ChromaDB unavailable")
+        return None
+    writer = ChatContextWriter(app)
+    writer.start()
+    return writer
@@ -0,0 +1,192 @@
+import logging
+import os
+import re
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_BUILDER_ENABLED = os.getenv('CONTEXT_BUILDER_ENABLED', 'True').lower() == 'true'
+MMR_LAMBDA = float(os.getenv('MMR_LAMBDA', 0.7))
+
+# Context token budgets per answering model, leaving room for the prompt and answer
+MODEL_CONTEXT_BUDGETS = {
+    'gpt-3.5-turbo': int(os.getenv('CONTEXT_TOKEN_BUDGET', 1500)),
+    'deepset/roberta-base-squad2': int(os.getenv('LOCAL_QA_CONTEXT_TOKEN_BUDGET', 750))
+}
+DEFAULT_CONTEXT_BUDGET = 1000
+
+_SENTENCE_END = re.compile(r'[.!?](?=\s|$)')
+_encoders = {}
+
+
+def _get_encoder(model):
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    if model not in _encoders:
+        try:
+            _encoders[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encoders[model] = tiktoken.get_encoding('cl100k_base')
+    return _encoders[model]
+
+
+def count_tokens(text, model='gpt-3.5-turbo'):
+    if not text:
+        return 0
+    encoder = _get_encoder(model)
+    if encoder:
+        return len(encoder.encode(text))
+    # Rough estimate when tiktoken is not installed
+    return (len(text) + 3) // 4
+
+
+def get_context_budget(model):
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+def truncate_to_tokens(text, max_tokens, model='gpt-3.5-turbo'):
+    """Trim text to max_tokens, preferring to cut at the end of a sentence."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    encoder = _get_encoder(model)
+    if encoder:
+        truncated = encoder.decode(encoder.encode(text)[:max_tokens])
+    else:
+        truncated = text[:max_tokens * 4]
+
+    sentence_ends = [m.end() for m in _SENTENCE_END.finditer(truncated)]
+    if sentence_ends and sentence_ends[-1] > len(truncated) // 2:
+        truncated = truncated[:sentence_ends[-1]]
+    return truncated.strip()
+
+
+class ContextBuilder:
+    """Packs retrieved chunks into a context string under an exact token budget.
+
+    Chunks are picked with maximal marginal relevance so near-duplicate chunks do not
+    crowd out other relevant passages, then chunks that overlap or touch in the source
+    text are merged by offset so the shared overlap is only sent once.
+    """
+
+    def __init__(self, model='gpt-3.5-turbo', token_budget=None, mmr_lambda=MMR_LAMBDA):
+        self.model = model
+        self.token_budget = token_budget or get_context_budget(model)
+        self.mmr_lambda = mmr_lambda
+
+    def _chunk_tokens(self, text, metadata):
+        token_count = metadata.get('token_count') if metadata else None
+        return token_count if token_count else count_tokens(text, self.model)
+
+    @staticmethod
+    def _overlap_chars(meta_a, meta_b):
+        if not meta_a or not meta_b:
+            return 0
+        if meta_a.get('document_id') != meta_b.get('document_id'):
+            return 0
+        if 'start_offset' not in meta_a or 'start_offset' not in meta_b:
+            return 0
+        start = max(meta_a['start_offset'], meta_b['start_offset'])
+        end = min(meta_a['end_offset'], meta_b['end_offset'])
+        return max(0, end - start)
+
+    def _mmr_order(self, relevance, embeddings):
+        if embeddings is None or len(embeddings) == 0:
+            return list(np.argsort(-relevance))
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        similarity = vectors @ vectors.T
+
+        remaining = list(range(len(relevance)))
+        order = []
+        max_sim = np.zeros(len(relevance), dtype=np.float32)
+        while remaining:
+            candidates = np.array(remaining)
+            scores = self.mmr_lambda * relevance[candidates] - (1 - self.mmr_lambda) * max_sim[candidates]
+            best = int(candidates[int(np.argmax(scores))])
+            order.append(best)
+            remaining.remove(best)
+            max_sim = np.maximum(max_sim, similarity[best])
+        return order
+
+    def _merge(self, chunks, metadatas):
+        """Merge selected chunks that overlap or are adjacent in the same document."""
+        items = sorted(
+            zip(chunks, metadatas),
+            key=lambda item: (
+                (item[1] or {}).get('document_id', ''),
+                (item[1] or {}).get('start_offset', float('inf'))
+            )
+        )
+
+        merged = []
+        for text, meta in items:
+            if merged:
+                prev_text, prev_meta = merged[-1]
+                overlap = self._overlap_chars(prev_meta, meta)
+                touching = (
+                    overlap == 0 and prev_meta and meta
+                    and prev_meta.get('document_id') == meta.get('document_id')
+                    and 'end_offset' in prev_meta and 'start_offset' in meta
+                    and meta['start_offset'] <= prev_meta['end_offset'] + 1
+                )
+                if overlap or touching:
+                    if meta['end_offset'] <= prev_meta['end_offset']:
+                        continue
+                    tail = text[max(0, prev_meta['end_offset'] - meta['start_offset']):]
+                    merged[-1] = (
+                        f"{prev_text} {tail.strip()}" if touching else prev_text + tail,
+                        {**prev_meta, 'end_offset': meta['end_offset']}
+                    )
+                    continue
+            merged.append((text, meta))
+        return [text for text, _ in merged]
+
+    def build(self, chunks, metadatas=None, relevance=None, embeddings=None):
+        """Return (context, selected_indices, token_count) for the given candidates.
+
+        ``relevance`` holds one score per chunk where higher means more relevant;
+        candidates are assumed to be in relevance order when it is omitted.
+        """
+        if not chunks:
+            return '', [], 0
+
+        metadatas = metadatas or [{} for _ in chunks]
+        if relevance is None:
+            relevance = np.linspace(1.0, 0.5, num=len(chunks))
+        relevance = np.asarray(relevance, dtype=np.float32)
+
+        selected = []
+        used_tokens = 0
+        for i in self._mmr_order(relevance, embeddings):
+            cost = self._chunk_tokens(chunks[i], metadatas[i])
+            for j in selected:
+                overlap = self._overlap_chars(metadatas[j], metadatas[i])
+                if overlap:
+                    cost -= count_tokens(chunks[i][:overlap], self.model)
+            if used_tokens + max(cost, 0) > self.token_budget:
+                continue
+            selected.append(i)
+            used_tokens += max(cost, 0)
+
+        if not selected:
+            context = truncate_to_tokens(chunks[0], self.token_budget, self.model)
+            return context, [0], count_tokens(context, self.model)
+
+        context = '\n\n'.join(self._merge([chunks[i] for i in selected], [metadatas[i] for i in selected]))
+        context = truncate_to_tokens(context, self.token_budget, self.model)
+        token_count = count_tokens(context, self.model)
+        logger.info(f"Built context from {len(selected)}/{len(chunks)} chunks, {token_count} tokens")
+        return context, selected, token_count
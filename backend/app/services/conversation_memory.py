@@ -0,0 +1,120 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from bson import ObjectId
+from dotenv import load_dotenv
+from app.services.context_builder import truncate_to_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MEMORY_RECENT_MESSAGES = int(os.getenv('MEMORY_RECENT_MESSAGES', 6))
+MEMORY_SUMMARY_EVERY = int(os.getenv('MEMORY_SUMMARY_EVERY', 6))
+MEMORY_MESSAGE_TOKENS = int(os.getenv('MEMORY_MESSAGE_TOKENS', 200))
+MEMORY_SUMMARY_WORDS = int(os.getenv('MEMORY_SUMMARY_WORDS', 150))
+MEMORY_MAX_COMPACT_MESSAGES = int(os.getenv('MEMORY_MAX_COMPACT_MESSAGES', 40))
+
+_compaction_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='memory-compaction')
+
+
+def _format_turns(messages):
+    lines = []
+    for message in messages:
+        speaker = 'User' if message['role'] == 'user' else 'Assistant'
+        lines.append(f"{speaker}: {truncate_to_tokens(message['content'], MEMORY_MESSAGE_TOKENS)}")
+    return '\n'.join(lines)
+
+
+class ConversationMemory:
+    """Bounded conversation state for a chat: a rolling summary plus recent turns.
+
+    The summary lives on the chat document under ``memory`` together with the
+    last message sequence it covers. Once MEMORY_SUMMARY_EVERY messages have
+    fallen out of the recent window they are folded into the summary, so the
+    context built for each turn stays the same size however long the chat runs.
+    """
+
+    def __init__(self, chat_model):
+        self.chat_model = chat_model
+
+    def build_context(self, chat, exclude_seq=None):
+        """Return the summary and the turns it does not cover as prompt text, or '' for a new chat."""
+        chat_id = str(chat['_id'])
+        memory = chat.get('memory') or {}
+        summarized_through = memory.get('summarized_through', -1)
+
+        # Include everything the summary does not cover yet, not just the recent window:
+        # messages wait outside the window until MEMORY_SUMMARY_EVERY of them build up
+        max_messages = MEMORY_RECENT_MESSAGES + MEMORY_SUMMARY_EVERY
+        messages = self.chat_model.get_chat_messages(chat_id, max_messages + 1)
+        messages = [
+            m for m in messages if m['seq'] > summarized_through and m['seq'] != exclude_seq
+        ][-max_messages:]
+
+        parts = []
+        if memory.get('summary'):
+            parts.append(f"Conversation summary:\n{memory['summary']}")
+        if messages:
+            parts.append(f"Recent conversation:\n{_format_turns(messages)}")
+        return '\n\n'.join(parts)
+
+    def compact(self, chat_id, processor_factory):
+        """Fold messages that left the recent window into the summary when enough have built up."""
+        chat = self.chat_model.collection.find_one(
+            {'_id': ObjectId(chat_id)}, {'next_seq': 1, 'memory': 1}
+        )
+        if not chat:
+            return False
+
+        memory = chat.get('memory') or {}
+        summarized_through = memory.get('summarized_through', -1)
+        window_start = chat.get('next_seq', 0) - MEMORY_RECENT_MESSAGES
+        if window_start - (summarized_through + 1) < MEMORY_SUMMARY_EVERY:
+            return False
+
+        end_seq = min(window_start, summarized_through + 1 + MEMORY_MAX_COMPACT_MESSAGES)
+        messages = self.chat_model.get_messages_range(chat_id, summarized_through + 1, end_seq)
+        if messages:
+            summary = processor_factory().compress_conversation(
+                memory.get('summary'), _format_turns(messages), MEMORY_SUMMARY_WORDS
+            )
+        else:
+            # The range was cleared; skip straight to the recent window
+            summary = memory.get('summary')
+            end_seq = window_start
+
+        # Only apply on top of the state we read so concurrent compactions cannot regress it
+        result = self.chat_model.collection.update_one(
+            {'_id': ObjectId(chat_id), 'memory.summarized_through': memory.get('summarized_through')},
+            {
+                '$set': {
+                    'memory': {
+                        'summary': summary,
+                        'summarized_through': end_seq - 1,
+                        'updated_at': datetime.utcnow()
+                    }
+                }
+            }
+        )
+        if result.modified_count:
+            logger.info(f"Compacted {len(messages)} messages into memory for chat {chat_id}")
+        return result.modified_count > 0
+
+
+def schedule_compaction(app, chat_id):
+    """Run compaction off the request path."""
+    def run():
+        from app.models.chat import Chat
+        from app.services.document_processor import DocumentProcessor
+
+        with app.app_context():
+            try:
+                ConversationMemory(Chat(app.db)).compact(
+                    chat_id, lambda: DocumentProcessor(app.chroma, app.db)
+                )
+            except Exception as e:
+                logger.error(f"Conversation memory compaction failed for chat {chat_id}: {e}")
+
+    _compaction_executor.submit(run)
@@ -11,31 +11,52 @@ except ImportError:
     Image = None
     pytesseract = None
 from app.services.vector_service import VectorService
+from app.services.reranker import get_reranker, RERANK_CANDIDATES
+from app.services.llm_cache import LLMCache, LLM_CACHE_ENABLED
+from app.services.llm_gateway import get_llm_gateway
+from app.services.extractive import select_salient_sentences
+from app.services.insight_classifier import PrototypeInsightClassifier, LABEL_DESCRIPTIONS
+from app.services.local_models import get_local_pipeline, TRANSFORMERS_AVAILABLE
+from app.services.context_builder import (
+    ContextBuilder, CONTEXT_BUILDER_ENABLED, count_tokens, get_context_budget, truncate_to_tokens
+)
+import json
 import logging
-import openai
+import math
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
-try:
-    from transformers import pipeline
-    TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    pipeline = None
-    TRANSFORMERS_AVAILABLE = False
-
 logger = logging.getLogger(__name__)
 
+ANALYSIS_MODE = os.getenv('ANALYSIS_MODE', 'combined').lower()
+SUMMARY_MODE = os.getenv('SUMMARY_MODE', 'map_reduce').lower()
+TEMPLATE_CONTEXT_TOKENS = int(os.getenv('TEMPLATE_CONTEXT_TOKENS', 600))
+SUMMARY_SECTION_WORDS = int(os.getenv('SUMMARY_SECTION_WORDS', 2500))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv('SUMMARY_MAX_CONCURRENCY', 4))
+SUMMARY_PRESELECT = os.getenv('SUMMARY_PRESELECT', 'False').lower() == 'true'
+SUMMARY_PRESELECT_METHOD = os.getenv('SUMMARY_PRESELECT_METHOD', 'textrank').lower()
+SUMMARY_PRESELECT_BUDGET_WORDS = int(os.getenv('SUMMARY_PRESELECT_BUDGET_WORDS', 800))
+
+INSIGHT_CATEGORIES = list(LABEL_DESCRIPTIONS.keys())
+
+def _is_json_list(content):
+    try:
+        return isinstance(json.loads(content), list)
+    except json.JSONDecodeError:
+        return False
+
 class DocumentProcessor:
-    def __init__(self, chroma_client):
+    def __init__(self, chroma_client, db=None):
         self.vector_service = VectorService(chroma_client)
+        self.llm_cache = LLMCache(db) if db is not None and LLM_CACHE_ENABLED else None
         
         # Try to initialize OpenAI
         self.use_openai = False
         try:
-            api_key = os.getenv('OPENAI_API_KEY')
-            if api_key:
-                self.openai_client = openai.OpenAI(api_key=api_key)
+            self.llm_gateway = get_llm_gateway()
+            if self.llm_gateway:
                 self.use_openai = True
                 print("DocumentProcessor initialized with OpenAI integration")
             else:
@@ -49,42 +70,69 @@ class DocumentProcessor:
         else:
             self.summarizer = None
             self.qa_pipeline = None
-            self.classifier = None
             print("Transformers not available - local models disabled")
+        
+        # Local key insights reuse the MiniLM embedding model instead of a zero-shot NLI model
+        self.insight_classifier = None
+        if self.vector_service.embedding_model:
+            self.insight_classifier = PrototypeInsightClassifier(self.vector_service.embedding_model)
+    
+    @property
+    def qa_model_name(self):
+        return 'gpt-3.5-turbo' if self.use_openai else 'deepset/roberta-base-squad2'
     
     def _init_local_models(self):
-        try:
-            self.summarizer = pipeline(
-                "summarization",
-                model="facebook/bart-large-cnn",
-                device=-1
-            )
-            print("Local summarization model loaded")
-        except Exception as e:
-            print(f"Failed to load summarization model: {e}")
-            self.summarizer = None
+        # Pipelines are loaded once per process and shared through batching schedulers
+        self.summarizer = get_local_pipeline("summarization", "facebook/bart-large-cnn")
+        self.qa_pipeline = get_local_pipeline("question-answering", "deepset/roberta-base-squad2")
+    
+    def _chat_completion(self, messages, model="gpt-3.5-turbo", max_tokens=300, temperature=0.2,
+                         use_cache=True, cache_if=None, operation='chat', **extra):
+        """Run a chat completion, serving identical deterministic requests from the LLM cache.
         
-        try:
-            self.qa_pipeline = pipeline(
-                "question-answering",
-                model="deepset/roberta-base-squad2",
-                device=-1
-            )
-            print("Local QA model loaded")
-        except Exception as e:
-            print(f"Failed to load QA model: {e}")
-            self.qa_pipeline = None
+        ``cache_if`` can reject responses that should not be stored, such as unparseable JSON.
+        """
+        params = {'max_tokens': max_tokens, 'temperature': temperature, **extra}
+        cache_key = None
+        if use_cache and self.llm_cache:
+            cache_key = LLMCache.make_key(model, messages, params)
+            try:
+                cached = self.llm_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"LLM cache hit for {model} completion")
+                    return cached
+            except Exception as e:
+                logger.warning(f"LLM cache lookup failed: {e}")
         
-        try:
-            self.classifier = pipeline(
-                "zero-shot-classification",
-                model="facebook/bart-large-mnli",
-                device=-1
-            )
-            print("Local classification model loaded")
-        except Exception as e:
-            print(f"Failed to load classification model: {e}")
-            self.classifier = None
+        response = self.llm_gateway.chat_completion(model, messages, operation=operation, **params)
+        content = response.choices[0].message.content.strip()
+        
+        if cache_key and (cache_if is None or cache_if(content)):
+            try:
+                self.llm_cache.put(cache_key, model, content, params)
+            except Exception as e:
+                logger.warning(f"LLM cache store failed: {e}")
+        
+        return content
+    
+    def _stream_chat_completion(self, messages, on_token, model="gpt-3.5-turbo", max_tokens=300, temperature=0.2):
+        """Run a streaming chat completion, passing each content delta to on_token."""
+        stream = self.llm_gateway.chat_completion(
+            model, messages,
+            operation='answer',
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+        return ''.join(parts).strip()
     
     def extract_text_from_file(self, filepath, content_type):
         try:
@@ -146,6 +194,20 @@ class DocumentProcessor:
             raise Exception(f"Failed to extract text from image: {str(e)}")
         return text.strip()
     
+    def _preselect_sentences(self, text, text_length):
+        """Compress the input to its most salient sentences before calling a model."""
+        if not SUMMARY_PRESELECT or text_length <= SUMMARY_PRESELECT_BUDGET_WORDS:
+            return text, text_length
+        try:
+            text = select_salient_sentences(
+                text, self.vector_service.embed_sentences,
+                SUMMARY_PRESELECT_BUDGET_WORDS, SUMMARY_PRESELECT_METHOD
+            )
+            return text, len(text.split())
+        except Exception as e:
+            logger.error(f"Error in extractive pre-selection, using full text: {e}")
+            return text, text_length
+    
     def generate_summary(self, text, max_length=150):
         if not text.strip():
             logger.info("Text empty, creating fallback summary")
@@ -158,6 +220,16 @@ class DocumentProcessor:
             logger.info("Document too short for summarization")
             return "Document too short for summarization"
         
+        text, text_length = self._preselect_sentences(text, text_length)
+        
+        # Long documents are summarized section by section instead of truncated
+        if self.use_openai and SUMMARY_MODE == 'map_reduce' and text_length > 3000:
+            try:
+                return self._map_reduce_summary(text)
+            except Exception as e:
+                logger.error(f"Error in map-reduce summarization: {e}")
+                logger.info("Falling back to truncated summary")
+        
         # Try OpenAI first
         if self.use_openai:
             try:
@@ -173,17 +245,16 @@ class DocumentProcessor:
 
 Summary:"""
                 
-                response = self.openai_client.chat.completions.create(
+                summary = self._chat_completion(
                     model="gpt-3.5-turbo",
                     messages=[
                         {"role": "system", "content": "You are a helpful assistant that creates concise document summaries."},
                         {"role": "user", "content": prompt}
                     ],
                     max_tokens=200,
-                    temperature=0.3
+                    temperature=0.3,
+                    operation='summary'
                 )
-                
-                summary = response.choices[0].message.content.strip()
                 logger.info(f"Successfully generated OpenAI summary: {summary[:100]}...")
                 return summary
                 
@@ -200,16 +271,17 @@ Summary:"""
                     text = ' '.join(words[:1024])
                     logger.info(f"Text truncated to 1024 words for local model")
                 
-                summary = self.summarizer(
+                summary = self.summarizer.run(
                     text,
                     max_length=min(max_length, 130),
                     min_length=20,
-                    do_sample=False
+                    do_sample=False,
+                    truncation=True
                 )
                 
-                if summary and isinstance(summary, list) and len(summary) > 0:
-                    if isinstance(summary[0], dict) and 'summary_text' in summary[0]:
-                        result_text = summary[0]['summary_text']
+                if summary:
+                    if isinstance(summary, dict) and 'summary_text' in summary:
+                        result_text = summary['summary_text']
                         logger.info(f"Successfully generated local summary: {result_text[:100]}...")
                         return result_text
                 
@@ -220,6 +292,87 @@ Summary:"""
         logger.info("Falling back to simple summary generation")
         return self._generate_fallback_summary(text)
     
+    def _split_sections(self, text, section_words=SUMMARY_SECTION_WORDS):
+        """Split text into sections of roughly section_words, keeping paragraphs whole where possible."""
+        sections = []
+        current = []
+        current_words = 0
+        
+        for paragraph in text.split('\n'):
+            words = paragraph.split()
+            if not words:
+                continue
+            # Paragraphs longer than a whole section are split on word boundaries
+            while len(words) > section_words:
+                if current:
+                    sections.append('\n'.join(current))
+                    current, current_words = [], 0
+                sections.append(' '.join(words[:section_words]))
+                words = words[section_words:]
+            if current_words + len(words) > section_words and current:
+                sections.append('\n'.join(current))
+                current, current_words = [], 0
+            current.append(' '.join(words))
+            current_words += len(words)
+        
+        if current:
+            sections.append('\n'.join(current))
+        return sections
+    
+    def _summarize_section(self, section, index, total):
+        prompt = f"""The following is part {index + 1} of {total} of a longer document. Summarize the key points of this part in 3-5 sentences:
+
+{section}
+
+Summary:"""
+        return self._chat_completion(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant that creates concise document summaries."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=250,
+            temperature=0.3,
+            operation='summary'
+        )
+    
+    def _map_reduce_summary(self, text):
+        """Summarize sections concurrently, then reduce the partial summaries into one.
+        
+        Section summaries go through the LLM cache, so re-processing an unchanged
+        document or one that shares sections costs no new completions.
+        """
+        sections = self._split_sections(text)
+        logger.info(f"Map-reduce summarization over {len(sections)} sections")
+        
+        with ThreadPoolExecutor(max_workers=min(SUMMARY_MAX_CONCURRENCY, len(sections))) as executor:
+            partials = list(executor.map(
+                lambda item: self._summarize_section(item[1], item[0], len(sections)),
+                enumerate(sections)
+            ))
+        
+        combined = '\n\n'.join(partials)
+        # Reduce again if the partial summaries themselves are too long for one call
+        if len(combined.split()) > 3000:
+            return self._map_reduce_summary(combined)
+        
+        prompt = f"""The following are summaries of consecutive parts of one document. Combine them into a concise summary of the whole document in about 2-3 sentences:
+
+{combined}
+
+Summary:"""
+        summary = self._chat_completion(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant that creates concise document summaries."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=200,
+            temperature=0.3,
+            operation='summary'
+        )
+        logger.info(f"Successfully generated map-reduce summary: {summary[:100]}...")
+        return summary
     
     def _generate_fallback_summary(self, text):
         """Generate a simple summary by taking the first few sentences"""
@@ -233,7 +386,7 @@ Summary:"""
         else:
             return f"Document contains {len(text.split())} words of content."
     
-    def extract_key_insights(self, text):
+    def extract_key_insights(self, text, chunks=None, chunk_embeddings=None):
         if not text.strip():
             return []
         
@@ -262,19 +415,18 @@ Return up to 5 insights in JSON format like this:
 Document:
 {text}"""
                 
-                response = self.openai_client.chat.completions.create(
+                insights_text = self._chat_completion(
                     model="gpt-3.5-turbo",
                     messages=[
                         {"role": "system", "content": "You are a helpful assistant that analyzes documents and extracts key insights. Always respond with valid JSON."},
                         {"role": "user", "content": prompt}
                     ],
                     max_tokens=300,
-                    temperature=0.2
+                    temperature=0.2,
+                    cache_if=_is_json_list,
+                    operation='insights'
                 )
                 
-                import json
-                insights_text = response.choices[0].message.content.strip()
-                
                 # Try to parse JSON response
                 try:
                     insights = json.loads(insights_text)
@@ -286,40 +438,111 @@ Document:
                 logger.error(f"Error extracting insights with OpenAI: {e}")
         
         # Try local model if OpenAI failed or not available
-        if self.classifier:
+        if self.insight_classifier:
             try:
-                categories = [
-                    "financial information", "legal terms", "technical specifications",
-                    "important dates", "contact information", "action items",
-                    "risks and concerns", "opportunities", "conclusions"
-                ]
-                
-                result = self.classifier(text, categories)
-                
-                insights = []
-                for label, score in zip(result['labels'], result['scores']):
-                    if score > 0.5:
-                        insights.append({
-                            'category': label,
-                            'insight': f"Content related to {label}",
-                            'confidence': round(score, 3)
-                        })
-                
-                return insights[:5]
+                if chunks is None:
+                    chunks = self.vector_service.chunk_text(text)
+                    chunk_embeddings = None
+                return self.insight_classifier.classify(chunks, chunk_embeddings)
             except Exception as e:
                 logger.error(f"Error extracting insights with local model: {e}")
         
         return []
     
-    def answer_question(self, question, context, document_id=None):
-        # Try OpenAI first
-        if self.use_openai:
-            try:
-                # Optimize context length for OpenAI API limits
-                if len(context) > 4000:
-                    context = context[:4000]
-                
-                prompt = f"""Based on the following context, answer the question as accurately as possible. If the answer cannot be found in the context, say "I cannot find this information in the provided context."
+    @staticmethod
+    def _validate_summary(summary):
+        return isinstance(summary, str) and len(summary.strip()) > 0
+    
+    @staticmethod
+    def _validate_insights(insights):
+        if not isinstance(insights, list):
+            return False
+        for item in insights:
+            if not isinstance(item, dict):
+                return False
+            if item.get('category') not in INSIGHT_CATEGORIES:
+                return False
+            if not isinstance(item.get('insight'), str) or not item['insight'].strip():
+                return False
+            confidence = item.get('confidence')
+            if not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+                return False
+        return True
+    
+    def analyze_document(self, text):
+        """Produce the summary and key insights in a single structured LLM call.
+        
+        The response is requested as a JSON object and each part is validated
+        separately; only a part that fails validation is retried on its own.
+        """
+        word_count = len(text.split())
+        if not self.use_openai or word_count < 50:
+            return self.generate_summary(text), self.extract_key_insights(text)
+        
+        # Long documents need full coverage, which the single truncated call cannot give
+        if SUMMARY_MODE == 'map_reduce' and word_count > 3000:
+            return self.generate_summary(text), self.extract_key_insights(text)
+        
+        text, word_count = self._preselect_sentences(text, word_count)
+        if word_count > 3000:
+            text = ' '.join(text.split()[:3000])
+            logger.info("Text truncated to 3000 words for combined analysis")
+        
+        categories = ', '.join(f'"{category}"' for category in INSIGHT_CATEGORIES)
+        prompt = f"""Analyze the following document and respond with a JSON object with exactly these keys:
+- "summary": a concise summary of the document in about 2-3 sentences
+- "insights": up to 5 key insights, each an object {{"category": ..., "insight": "brief description", "confidence": 0.0-1.0}} where category is one of: {categories}
+
+Document:
+{text}"""
+        
+        summary = None
+        insights = None
+        try:
+            content = self._chat_completion(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant that summarizes documents and extracts key insights. Always respond with a valid JSON object."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=500,
+                temperature=0.2,
+                response_format={"type": "json_object"},
+                cache_if=lambda content: self._parse_analysis(content) == (True, True),
+                operation='analysis'
+            )
+            result = json.loads(content)
+            if isinstance(result, dict):
+                if self._validate_summary(result.get('summary')):
+                    summary = result['summary'].strip()
+                if self._validate_insights(result.get('insights')):
+                    insights = result['insights'][:5]
+        except Exception as e:
+            logger.error(f"Error in combined document analysis: {e}")
+        
+        if summary is None:
+            logger.warning("Combined analysis returned no valid summary, retrying summary only")
+            summary = self.generate_summary(text)
+        if insights is None:
+            logger.warning("Combined analysis returned no valid insights, retrying insights only")
+            insights = self.extract_key_insights(text)
+        
+        return summary, insights
+    
+    def _parse_analysis(self, content):
+        try:
+            result = json.loads(content)
+        except json.JSONDecodeError:
+            return False, False
+        if not isinstance(result, dict):
+            return False, False
+        return self._validate_summary(result.get('summary')), self._validate_insights(result.get('insights'))
+    
+    def _answer_with_llm(self, question, context, on_token=None):
+        # Keep context within the model's token budget, cutting at a sentence end
+        context = truncate_to_tokens(context, get_context_budget('gpt-3.5-turbo'), 'gpt-3.5-turbo')
+        
+        prompt = f"""Based on the following context, answer the question as accurately as possible. If the answer cannot be found in the context, say "I cannot find this information in the provided context."
 
 Context:
 {context}
@@ -327,69 +550,105 @@ Context:
 Question: {question}
 
 Answer:"""
-                
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context. Be accurate and cite information from the context when possible."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=300,
-                    temperature=0.2
-                )
-                
-                answer = response.choices[0].message.content.strip()
-                
-                # Estimate confidence based on answer content
-                confidence = 0.8  # Default confidence for OpenAI responses
-                if "cannot find" in answer.lower() or "not mentioned" in answer.lower():
-                    confidence = 0.3
-                elif len(answer) > 100:  # Detailed answers might be more confident
-                    confidence = 0.9
-                
-                return {
-                    'answer': answer,
-                    'confidence': round(confidence, 3),
-                    'context_used': context[:500] + "..." if len(context) > 500 else context,
-                    'model': 'gpt-3.5-turbo'
-                }
-                
+        
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context. Be accurate and cite information from the context when possible."},
+            {"role": "user", "content": prompt}
+        ]
+        
+        if on_token:
+            answer = self._stream_chat_completion(messages, on_token, max_tokens=300, temperature=0.2)
+        else:
+            # Answers are cached per question by QACache instead
+            answer = self._chat_completion(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                max_tokens=300,
+                temperature=0.2,
+                use_cache=False,
+                operation='answer'
+            )
+        
+        # Estimate confidence based on answer content
+        confidence = 0.8  # Default confidence for OpenAI responses
+        if "cannot find" in answer.lower() or "not mentioned" in answer.lower():
+            confidence = 0.3
+        elif len(answer) > 100:  # Detailed answers might be more confident
+            confidence = 0.9
+        
+        return {
+            'answer': answer,
+            'confidence': round(confidence, 3),
+            'context_used': context[:500] + "..." if len(context) > 500 else context,
+            'model': 'gpt-3.5-turbo',
+            'route': 'llm'
+        }
+    
+    def _answer_extractive(self, question, context):
+        # Optimize context length for better QA performance
+        context = truncate_to_tokens(
+            context, get_context_budget('deepset/roberta-base-squad2'), 'deepset/roberta-base-squad2'
+        )
+        
+        result = self.qa_pipeline.run(
+            {'question': question, 'context': context},
+            max_answer_len=200,
+            max_seq_len=512,
+            doc_stride=128,
+            max_question_len=64
+        )
+        
+        # Adjust confidence based on answer quality
+        base_confidence = result['score']
+        answer_length = len(result['answer'])
+        adjusted_confidence = base_confidence
+        if answer_length > 20:
+            adjusted_confidence = min(1.0, base_confidence * 1.1)
+        if answer_length < 5:
+            adjusted_confidence = base_confidence * 0.9
+            
+        return {
+            'answer': result['answer'],
+            'confidence': round(adjusted_confidence, 3),
+            'context_used': context[max(0, result['start']-100):result['end']+100],
+            'start_position': result['start'],
+            'end_position': result['end'],
+            'model': 'deepset/roberta-base-squad2',
+            'route': 'extractive'
+        }
+    
+    def answer_question(self, question, context, document_id=None, on_token=None, route='llm', escalate_below=None):
+        """Answer from context with the LLM or the local extractive model.
+        
+        With route='extractive' the local model answers first and the question is
+        escalated to the LLM when its confidence is below escalate_below.
+        """
+        extractive_result = None
+        if route == 'extractive' and self.qa_pipeline:
+            try:
+                extractive_result = self._answer_extractive(question, context)
+                if not self.use_openai or escalate_below is None or extractive_result['confidence'] >= escalate_below:
+                    return extractive_result
+                logger.info(f"Extractive confidence {extractive_result['confidence']} below {escalate_below}, escalating to LLM")
+            except Exception as e:
+                logger.error(f"Error answering question with local model: {e}")
+        
+        # Try OpenAI first
+        if self.use_openai:
+            try:
+                result = self._answer_with_llm(question, context, on_token)
+                result['escalated'] = extractive_result is not None
+                return result
             except Exception as e:
                 logger.error(f"Error answering question with OpenAI: {e}")
         
+        if extractive_result:
+            return extractive_result
+        
         # Try local model if OpenAI failed or not available
         if self.qa_pipeline:
             try:
-                # Optimize context length for better QA performance
-                if len(context) > 3000:
-                    context = context[:3000]
-                
-                result = self.qa_pipeline(
-                    question=question,
-                    context=context,
-                    max_answer_len=200,
-                    max_seq_len=512,
-                    doc_stride=128,
-                    max_question_len=64
-                )
-                
-                # Adjust confidence based on answer quality
-                base_confidence = result['score']
-                answer_length = len(result['answer'])
-                adjusted_confidence = base_confidence
-                if answer_length > 20:
-                    adjusted_confidence = min(1.0, base_confidence * 1.1)
-                if answer_length < 5:
-                    adjusted_confidence = base_confidence * 0.9
-                    
-                return {
-                    'answer': result['answer'],
-                    'confidence': round(adjusted_confidence, 3),
-                    'context_used': context[max(0, result['start']-100):result['end']+100],
-                    'start_position': result['start'],
-                    'end_position': result['end'],
-                    'model': 'deepset/roberta-base-squad2'
-                }
+                return self._answer_extractive(question, context)
             except Exception as e:
                 logger.error(f"Error answering question with local model: {e}")
         
@@ -401,6 +660,86 @@ Answer:"""
             'model': 'fallback'
         }
     
+    def answer_questions_batch(self, questions, contexts, context_tokens=TEMPLATE_CONTEXT_TOKENS):
+        """Answer several questions, each with its own context, in one structured LLM call.
+        
+        Questions the response leaves unanswered, and every question when OpenAI is
+        unavailable, go through answer_question individually.
+        """
+        results = [None] * len(questions)
+        if self.use_openai:
+            contexts = [truncate_to_tokens(context, context_tokens, 'gpt-3.5-turbo') for context in contexts]
+            sections = '\n\n'.join(
+                f"Question {i + 1}: {question}\nContext {i + 1}:\n{context}"
+                for i, (question, context) in enumerate(zip(questions, contexts))
+            )
+            prompt = f"""Answer each question using only the context given with it. Respond with a JSON object {{"answers": [{{"id": <question number>, "answer": "...", "found": true|false}}]}} containing one entry per question. If the answer cannot be found in its context, set "found" to false and answer "I cannot find this information in the provided context."
+
+{sections}"""
+            try:
+                content = self._chat_completion(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context. Always respond with a valid JSON object."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=150 * len(questions),
+                    temperature=0.2,
+                    response_format={"type": "json_object"},
+                    use_cache=False,
+                    operation='answer'
+                )
+                for item in json.loads(content).get('answers', []):
+                    index = int(item.get('id', 0)) - 1
+                    answer = item.get('answer')
+                    if 0 <= index < len(questions) and isinstance(answer, str) and answer.strip():
+                        context = contexts[index]
+                        results[index] = {
+                            'answer': answer.strip(),
+                            'confidence': 0.8 if item.get('found', True) else 0.3,
+                            'context_used': context[:500] + "..." if len(context) > 500 else context,
+                            'model': 'gpt-3.5-turbo',
+                            'route': 'llm'
+                        }
+            except Exception as e:
+                logger.error(f"Error in batched question answering: {e}")
+        
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = self.answer_question(questions[i], contexts[i], route='extractive')
+        return results
+    
+    def compress_conversation(self, previous_summary, transcript, max_words=150):
+        """Fold new conversation turns into a running summary of the conversation."""
+        if self.use_openai:
+            prompt = f"""Update the running summary of a conversation between a user and an assistant with the new turns below. Keep facts, names, numbers, decisions and open questions the user may refer back to. Write at most {max_words} words.
+
+Current summary:
+{previous_summary or '(none)'}
+
+New turns:
+{transcript}
+
+Updated summary:"""
+            try:
+                return self._chat_completion(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You maintain concise, factual summaries of conversations."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=max_words * 2,
+                    temperature=0.2,
+                    operation='memory'
+                )
+            except Exception as e:
+                logger.error(f"Error compressing conversation with OpenAI: {e}")
+        
+        # Without the LLM keep the most central sentences of the summary and new turns
+        text = f"{previous_summary or ''} {transcript}".strip()
+        embed_fn = self.vector_service.embed_sentences
+        return select_salient_sentences(text, embed_fn, max_words, method='centroid')
+    
     def process_document(self, document_id, filepath, content_type, user_id):
         try:
             extracted_text = self.extract_text_from_file(filepath, content_type)
@@ -411,22 +750,34 @@ Answer:"""
                     'error': 'No meaningful text could be extracted from the document'
                 }
             
-            summary = self.generate_summary(extracted_text)
+            spans = self.vector_service.chunk_spans(extracted_text)
+            chunks = [span['text'] for span in spans]
+            
+            # Without OpenAI the local model embeds chunks for both insights and the index, so do it once
+            chunk_embeddings = None
+            if not self.use_openai and self.vector_service.embedding_model:
+                chunk_embeddings = self.vector_service.embed_sentences(chunks)
             
-            key_insights = self.extract_key_insights(extracted_text)
+            if ANALYSIS_MODE == 'combined' and self.use_openai:
+                summary, key_insights = self.analyze_document(extracted_text)
+            else:
+                summary = self.generate_summary(extracted_text)
+                key_insights = self.extract_key_insights(extracted_text, chunks, chunk_embeddings)
             
-            chunks = self.vector_service.chunk_text(extracted_text)
             chunk_metadata = [
                 {
                     'user_id': user_id,
                     'document_id': document_id,
                     'chunk_index': i,
-                    'chunk_length': len(chunk)
-                } for i, chunk in enumerate(chunks)
+                    'chunk_length': len(span['text']),
+                    'start_offset': span['start_offset'],
+                    'end_offset': span['end_offset'],
+                    'token_count': count_tokens(span['text'])
+                } for i, span in enumerate(spans)
             ]
             
             embeddings_count = self.vector_service.add_document_chunks(
-                document_id, chunks, chunk_metadata
+                document_id, chunks, chunk_metadata, chunk_embeddings
             )
             
             return {
@@ -453,5 +804,88 @@ Answer:"""
     def search_documents(self, query, user_id, document_id=None, limit=5):
         return self.vector_service.search_documents(query, user_id, limit, document_id)
     
+    @staticmethod
+    def retrieval_fetch_count(n_results):
+        """Number of candidates to fetch from the vector store for one question."""
+        return max(n_results, RERANK_CANDIDATES) if get_reranker() else n_results
+    
+    def select_context_chunks(self, query, user_id, document_id=None, n_results=5, top_k=3, fallback_k=2,
+                              query_embedding=None, search_results=None):
+        """Retrieve candidate chunks and pick the ones to send as context.
+        
+        With reranking enabled the search over-fetches candidates and orders them
+        with the cross-encoder; otherwise chunks are filtered by cosine distance.
+        The selected pool is then packed into a token-budgeted context.
+        ``search_results`` may be passed in when the search was already run as part
+        of a batch (see ``retrieval_fetch_count``).
+        """
+        reranker = get_reranker()
+        if search_results is None:
+            search_results = self.vector_service.search_documents(
+                query, user_id, self.retrieval_fetch_count(n_results), document_id,
+                include_embeddings=CONTEXT_BUILDER_ENABLED, query_embedding=query_embedding
+            )
+        
+        documents = search_results['documents']
+        distances = search_results['distances']
+        rerank_time_ms = None
+        relevance = None
+        selected = None
+        
+        if reranker and documents:
+            try:
+                # Keep a wider pool than top_k so the token budget decides the final cut
+                pool_size = top_k * 2 if CONTEXT_BUILDER_ENABLED else top_k
+                selected, relevance, rerank_time_ms = reranker.rerank(
+                    query, search_results['ids'], documents, pool_size
+                )
+            except Exception as e:
+                logger.error(f"Error reranking chunks, using distance filter: {e}")
+                selected = None
+        
+        if selected is None:
+            pool_size = n_results if CONTEXT_BUILDER_ENABLED else top_k
+            if documents and distances:
+                # Only use chunks with good similarity (distance < 0.8)
+                selected = [i for i, distance in enumerate(distances) if distance < 0.8 and i < len(documents)][:pool_size]
+                if not selected:
+                    selected = list(range(min(fallback_k, len(documents))))
+            else:
+                selected = list(range(min(top_k, len(documents))))
+            relevance = [1 - distances[i] for i in selected] if distances else None
+        
+        chunks = [documents[i] for i in selected]
+        metadatas = [search_results['metadatas'][i] for i in selected]
+        
+        if CONTEXT_BUILDER_ENABLED and chunks:
+            embeddings = search_results.get('embeddings')
+            builder = ContextBuilder(model=self.qa_model_name)
+            context, used, context_tokens = builder.build(
+                chunks, metadatas, relevance,
+                [embeddings[i] for i in selected] if embeddings else None
+            )
+            chunks = [chunks[i] for i in used]
+            metadatas = [metadatas[i] for i in used]
+        else:
+            context = ' '.join(chunks)
+            context_tokens = count_tokens(context)
+        
+        # Cross-encoder scores are logits; distance-based relevance is already 1 - distance
+        if rerank_time_ms is not None and relevance:
+            retrieval_confidence = float(1 / (1 + math.exp(-max(relevance))))
+        else:
+            retrieval_confidence = float(max(relevance)) if relevance else None
+        
+        return {
+            'context': context,
+            'context_tokens': context_tokens,
+            'retrieval_confidence': retrieval_confidence,
+            'chunks': chunks,
+            'metadatas': metadatas,
+            'search_results': search_results,
+            'rerank_scores': relevance if rerank_time_ms is not None else None,
+            'rerank_time_ms': rerank_time_ms
+        }
+    
     def delete_document_data(self, document_id):
         return self.vector_service.delete_document_embeddings(document_id)
\ No newline at end of file
@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from bson import ObjectId
+import numpy as np
+from dotenv import load_dotenv
+from app.models.document import Document
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_ENABLED = os.getenv('SESSION_CACHE_ENABLED', 'True').lower() == 'true'
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv('SESSION_CACHE_MAX_SESSIONS', 32))
+SESSION_CACHE_TTL_SECONDS = int(os.getenv('SESSION_CACHE_TTL_SECONDS', 1800))
+
+# Everything a chat turn needs from the document except the extracted text itself
+SESSION_DOCUMENT_PROJECTION = Document.QA_PROJECTION
+
+
+class DocumentSession:
+    """A chat's document state and chunk vectors, searched in memory."""
+
+    def __init__(self, chat_id, user_id, document, vectors):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.document = document
+        self.document_id = str(document['_id'])
+        self.ids = vectors['ids']
+        self.chunks = vectors['documents']
+        self.metadatas = vectors['metadatas']
+        self.embeddings = vectors['embeddings']
+        self.matrix = vectors['matrix']
+        self.distance_space = vectors['distance_space']
+        self.expires_at = time.monotonic() + SESSION_CACHE_TTL_SECONDS
+
+    @property
+    def has_text(self):
+        return bool(self.document.get('has_text'))
+
+    def _distances(self, query):
+        # Same metrics as the Chroma collection so distance thresholds keep their meaning
+        if self.distance_space == 'cosine':
+            norms = np.linalg.norm(self.matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+            return 1.0 - (self.matrix @ query) / np.where(norms == 0, 1.0, norms)
+        if self.distance_space == 'ip':
+            return 1.0 - self.matrix @ query
+        return np.sum((self.matrix - query) ** 2, axis=1)
+
+    def search(self, query_embedding, n_results=5, include_embeddings=False):
+        """Top-k search over the document's chunks, returning the search_documents format."""
+        search_results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        if include_embeddings:
+            search_results['embeddings'] = []
+        if not len(self.ids):
+            return search_results
+
+        distances = self._distances(np.asarray(query_embedding, dtype=np.float32))
+        k = min(n_results, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        for i in top[np.argsort(distances[top])]:
+            search_results['ids'].append(self.ids[i])
+            search_results['documents'].append(self.chunks[i])
+            search_results['metadatas'].append(self.metadatas[i])
+            search_results['distances'].append(float(distances[i]))
+            if include_embeddings:
+                search_results['embeddings'].append(self.embeddings[i])
+        return search_results
+
+
+class DocumentSessionCache:
+    """Per-process LRU + TTL cache of DocumentSession objects keyed by chat id.
+
+    Sessions for chats on the same processed document share one vector matrix.
+    """
+
+    def __init__(self, max_sessions=SESSION_CACHE_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id, user_id):
+        with self.lock:
+            session = self.sessions.get(chat_id)
+            if session is None or session.expires_at < time.monotonic() or session.user_id != user_id:
+                if session is not None and session.expires_at < time.monotonic():
+                    del self.sessions[chat_id]
+                self.misses += 1
+                return None
+            self.sessions.move_to_end(chat_id)
+            self.hits += 1
+            return session
+
+    def _shared_vectors(self, document):
+        with self.lock:
+            for session in self.sessions.values():
+                if (session.document_id == str(document['_id'])
+                        and session.document.get('processed_date') == document.get('processed_date')):
+                    return {
+                        'ids': session.ids,
+                        'documents': session.chunks,
+                        'metadatas': session.metadatas,
+                        'embeddings': session.embeddings,
+                        'matrix': session.matrix,
+                        'distance_space': session.distance_space
+                    }
+        return None
+
+    def warm(self, db, vector_service, chat):
+        """Load the session for a chat; returns None for chats without a usable document."""
+        if not chat.get('document_id'):
+            return None
+
+        document = db.documents.find_one({'_id': ObjectId(chat['document_id'])}, SESSION_DOCUMENT_PROJECTION)
+        if not document or str(document['user_id']) != str(chat['user_id']):
+            return None
+
+        vectors = self._shared_vectors(document)
+        if vectors is None:
+            vectors = vector_service.get_document_vectors(str(document['_id']))
+            vectors['matrix'] = np.asarray(vectors['embeddings'], dtype=np.float32)
+
+        chat_id = str(chat['_id'])
+        session = DocumentSession(chat_id, str(chat['user_id']), document, vectors)
+        # Documents still being processed are not cached; their state is about to change
+        if not session.has_text or not session.ids:
+            return session
+        with self.lock:
+            self.sessions[chat_id] = session
+            self.sessions.move_to_end(chat_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        logger.info(f"Warmed document session for chat {chat_id} ({len(session.ids)} chunks)")
+        return session
+
+    def evict(self, chat_id):
+        with self.lock:
+            self.sessions.pop(chat_id, None)
+
+    def invalidate_document(self, document_id):
+        with self.lock:
+            for chat_id in [c for c, s in self.sessions.items() if s.document_id == str(document_id)]:
+                del self.sessions[chat_id]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sessions': len(self.sessions),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+_session_cache = None
+_session_cache_lock = threading.Lock()
+
+
+def get_session_cache():
+    """Return the process-wide session cache, or None when SESSION_CACHE_ENABLED is off."""
+    global _session_cache
+    if not SESSION_CACHE_ENABLED:
+        return None
+    with _session_cache_lock:
+        if _session_cache is None:
+            _session_cache = DocumentSessionCache()
+    return _session_cache
@@ -0,0 +1,85 @@
+import logging
+import re
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(\[])')
+
+# TextRank builds an n x n similarity matrix; past this size centroid scoring is used instead
+TEXTRANK_MAX_SENTENCES = 2000
+
+
+def split_sentences(text):
+    sentences = []
+    for paragraph in text.split('\n'):
+        for sentence in _SENTENCE_SPLIT.split(paragraph.strip()):
+            sentence = sentence.strip()
+            if len(sentence.split()) >= 4:
+                sentences.append(sentence)
+    return sentences
+
+
+def _normalize(embeddings):
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def centroid_scores(embeddings):
+    vectors = _normalize(embeddings)
+    centroid = vectors.mean(axis=0)
+    centroid /= max(np.linalg.norm(centroid), 1e-12)
+    return vectors @ centroid
+
+
+def textrank_scores(embeddings, damping=0.85, iterations=50, tolerance=1e-6):
+    vectors = _normalize(embeddings)
+    similarity = np.clip(vectors @ vectors.T, 0, None)
+    np.fill_diagonal(similarity, 0)
+
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    transition = np.divide(similarity, row_sums, out=np.zeros_like(similarity), where=row_sums > 0)
+
+    n = len(vectors)
+    scores = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(iterations):
+        updated = (1 - damping) / n + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < tolerance:
+            scores = updated
+            break
+        scores = updated
+    return scores
+
+
+def select_salient_sentences(text, embed_fn, budget_words, method='textrank'):
+    """Pick the most salient sentences up to budget_words, returned in document order.
+
+    ``embed_fn`` maps a list of sentences to a list of embedding vectors.
+    """
+    sentences = split_sentences(text)
+    total_words = sum(len(sentence.split()) for sentence in sentences)
+    if total_words <= budget_words:
+        return text
+
+    embeddings = embed_fn(sentences)
+    if method == 'textrank' and len(sentences) <= TEXTRANK_MAX_SENTENCES:
+        scores = textrank_scores(embeddings)
+    else:
+        scores = centroid_scores(embeddings)
+
+    selected = []
+    used_words = 0
+    for i in np.argsort(-scores):
+        words = len(sentences[i].split())
+        if used_words + words > budget_words:
+            continue
+        selected.append(int(i))
+        used_words += words
+
+    selected.sort()
+    logger.info(
+        f"Extractive pre-selection kept {len(selected)}/{len(sentences)} sentences "
+        f"({used_words}/{total_words} words)"
+    )
+    return ' '.join(sentences[i] for i in selected)
@@ -0,0 +1,112 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+logger = logging.getLogger(__name__)
+
+LOCAL_BATCH_SIZE = int(os.getenv('LOCAL_BATCH_SIZE', 8))
+LOCAL_BATCH_WAIT_MS = float(os.getenv('LOCAL_BATCH_WAIT_MS', 10))
+LOCAL_INFERENCE_THREADS = int(os.getenv('LOCAL_INFERENCE_THREADS', os.cpu_count() or 1))
+
+_threads_configured = False
+_threads_lock = threading.Lock()
+
+
+def _configure_torch_threads():
+    global _threads_configured
+    with _threads_lock:
+        if torch is None or _threads_configured:
+            return
+        torch.set_num_threads(LOCAL_INFERENCE_THREADS)
+        _threads_configured = True
+        logger.info(f"Local inference using {LOCAL_INFERENCE_THREADS} intra-op threads")
+
+
+class BatchingScheduler:
+    """Queues requests for one local pipeline and runs them in dynamic batches.
+
+    A dedicated worker thread collects requests until ``max_batch_size`` is reached
+    or ``max_wait_ms`` has passed since the first one arrived, then runs them as a
+    single padded batch. Requests with different keyword arguments are batched
+    separately since a pipeline call takes one set of generation parameters.
+    """
+
+    def __init__(self, name, pipeline, max_batch_size=LOCAL_BATCH_SIZE, max_wait_ms=LOCAL_BATCH_WAIT_MS):
+        self.name = name
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self._worker = threading.Thread(target=self._run, name=f"inference-{name}", daemon=True)
+        self._worker.start()
+
+    def run(self, item, timeout=None, **kwargs):
+        """Submit one input and block until its result is ready."""
+        return self.submit(item, **kwargs).result(timeout=timeout)
+
+    def submit(self, item, **kwargs):
+        future = Future()
+        self.queue.put((item, kwargs, future))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        _configure_torch_threads()
+        while True:
+            batch = self._collect()
+            groups = {}
+            for item, kwargs, future in batch:
+                key = tuple(sorted(kwargs.items()))
+                groups.setdefault(key, []).append((item, future))
+
+            for key, requests in groups.items():
+                inputs = [item for item, _ in requests]
+                try:
+                    results = self.pipeline(inputs, batch_size=len(inputs), **dict(key))
+                    if isinstance(results, dict):
+                        results = [results]
+                    for (_, future), result in zip(requests, results):
+                        # Pipelines wrap some per-input results in a single-element list
+                        if isinstance(result, list) and len(result) == 1:
+                            result = result[0]
+                        future.set_result(result)
+                except Exception as e:
+                    logger.error(f"Batched {self.name} inference failed: {e}")
+                    for _, future in requests:
+                        if not future.done():
+                            future.set_exception(e)
+                self.batches += 1
+                self.items += len(inputs)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'queued': self.queue.qsize()
+        }
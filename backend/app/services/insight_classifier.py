@@ -0,0 +1,97 @@
+import logging
+import os
+import re
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INSIGHT_CONFIDENCE_THRESHOLD = float(os.getenv('INSIGHT_CONFIDENCE_THRESHOLD', 0.35))
+
+# Short descriptions embed far better than the bare category names
+LABEL_DESCRIPTIONS = {
+    "financial information": "Financial figures, prices, costs, fees, payments, revenue, budgets and amounts of money.",
+    "legal terms": "Legal clauses, obligations, liability, governing law, termination, warranties and contractual terms.",
+    "technical specifications": "Technical requirements, specifications, system architecture, performance figures and configuration details.",
+    "important dates": "Deadlines, effective dates, schedules, durations, renewal dates and milestones.",
+    "contact information": "Names, addresses, email addresses, phone numbers and contact details of people or organizations.",
+    "action items": "Tasks to be done, next steps, responsibilities and required actions.",
+    "risks and concerns": "Risks, problems, issues, concerns, penalties, failures and potential negative outcomes.",
+    "opportunities": "Opportunities, benefits, growth potential, advantages and improvements.",
+    "conclusions": "Conclusions, findings, results, outcomes and final recommendations."
+}
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+class PrototypeInsightClassifier:
+    """Classifies document chunks against cached label prototype embeddings.
+
+    Each chunk is embedded once and scored against every category in a single
+    matrix product, replacing one zero-shot NLI pass per candidate label.
+    """
+
+    _prototypes = {}
+    _lock = threading.Lock()
+
+    def __init__(self, embedding_model, temperature=0.05):
+        self.embedding_model = embedding_model
+        self.temperature = temperature
+        self.labels = list(LABEL_DESCRIPTIONS.keys())
+
+    def _get_prototypes(self):
+        key = id(self.embedding_model)
+        with self._lock:
+            if key not in self._prototypes:
+                vectors = self.embedding_model.encode([LABEL_DESCRIPTIONS[label] for label in self.labels])
+                self._prototypes[key] = self._normalize(vectors)
+            return self._prototypes[key]
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    @staticmethod
+    def _snippet(chunk, max_length=200):
+        first_sentence = _SENTENCE_END.split(chunk.strip(), maxsplit=1)[0]
+        return first_sentence if len(first_sentence) <= max_length else first_sentence[:max_length].rsplit(' ', 1)[0] + '...'
+
+    def classify(self, chunks, chunk_embeddings=None, threshold=INSIGHT_CONFIDENCE_THRESHOLD,
+                 max_insights=5, evidence_k=2):
+        if not chunks:
+            return []
+
+        if chunk_embeddings is None:
+            chunk_embeddings = self.embedding_model.encode(chunks, batch_size=64)
+        chunk_vectors = self._normalize(chunk_embeddings)
+        similarity = chunk_vectors @ self._get_prototypes().T
+
+        # Per-chunk softmax over labels turns raw cosine similarity into a label assignment
+        logits = similarity / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        best_chunks = np.argsort(-probabilities, axis=0)[:evidence_k]
+        label_confidence = probabilities.max(axis=0)
+
+        insights = []
+        for label_index in np.argsort(-label_confidence):
+            confidence = float(label_confidence[label_index])
+            if confidence < threshold:
+                break
+            evidence = [chunks[i] for i in best_chunks[:, label_index]]
+            insights.append({
+                'category': self.labels[label_index],
+                'insight': self._snippet(evidence[0]),
+                'confidence': round(confidence, 3),
+                'evidence': [self._snippet(chunk, 300) for chunk in evidence]
+            })
+            if len(insights) >= max_insights:
+                break
+
+        return insights
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from pymongo import IndexModel
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'True').lower() == 'true'
+LLM_CACHE_TTL_DAYS = int(os.getenv('LLM_CACHE_TTL_DAYS', 30))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 50000))
+
+
+class LLMCache:
+    """Persistent cache of chat completions keyed by (model, prompt hash, parameters).
+
+    Entries expire through a TTL index on ``expires_at``; once the collection grows
+    past ``max_entries`` the least recently used entries are evicted.
+    """
+    COLLECTION = 'llm_cache'
+    INDEXES = [
+        IndexModel([('expires_at', 1)], expireAfterSeconds=0),
+        IndexModel([('last_used_at', 1)])
+    ]
+    HOT_QUERIES = [
+        {'name': 'least recently used cache entries', 'filter': {}, 'sort': [('last_used_at', 1)]}
+    ]
+
+    def __init__(self, db, ttl_days=LLM_CACHE_TTL_DAYS, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.collection = db[self.COLLECTION]
+        self.ttl = timedelta(days=ttl_days)
+        self.max_entries = max_entries
+
+    @staticmethod
+    def make_key(model, messages, params):
+        prompt_hash = hashlib.sha256(
+            json.dumps(messages, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+        params_key = json.dumps(params, sort_keys=True)
+        return hashlib.sha256(f"{model}|{prompt_hash}|{params_key}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = datetime.utcnow()
+        entry = self.collection.find_one_and_update(
+            {'_id': key, 'expires_at': {'$gt': now}},
+            {'$set': {'last_used_at': now}, '$inc': {'hits': 1}},
+            projection={'content': 1}
+        )
+        return entry['content'] if entry else None
+
+    def put(self, key, model, content, params):
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {'_id': key},
+            {
+                '$set': {
+                    'model': model,
+                    'params': params,
+                    'content': content,
+                    'created_at': now,
+                    'last_used_at': now,
+                    'expires_at': now + self.ttl
+                },
+                '$setOnInsert': {'hits': 0}
+            },
+            upsert=True
+        )
+        self._evict_if_needed()
+
+    def _evict_if_needed(self):
+        excess = self.collection.estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return
+        oldest = [
+            entry['_id'] for entry in
+            self.collection.find({}, {'_id': 1}).sort('last_used_at', 1).limit(excess)
+        ]
+        if oldest:
+            self.collection.delete_many({'_id': {'$in': oldest}})
+            logger.info(f"Evicted {len(oldest)} LLM cache entries")
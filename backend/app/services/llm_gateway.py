@@ -0,0 +1,251 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+import httpx
+import openai
+from dotenv import load_dotenv
+from app.services.context_builder import count_tokens
+from app.services.circuit_breaker import get_circuit_breaker, CircuitOpenError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OPENAI_RPM_LIMIT = int(os.getenv('OPENAI_RPM_LIMIT', 3500))
+OPENAI_TPM_LIMIT = int(os.getenv('OPENAI_TPM_LIMIT', 90000))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 4))
+OPENAI_BACKOFF_BASE = float(os.getenv('OPENAI_BACKOFF_BASE', 0.5))
+OPENAI_BACKOFF_MAX = float(os.getenv('OPENAI_BACKOFF_MAX', 20))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 30))
+OPENAI_RETRY_DEADLINE = float(os.getenv('OPENAI_RETRY_DEADLINE', 45))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 20))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until enough capacity has refilled."""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def acquire(self, amount=1, deadline=None):
+        """Take ``amount`` tokens; returns False instead if they cannot be had before ``deadline``."""
+        # A single request larger than the bucket may still run once the bucket is full
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.refill_per_second
+            if deadline is not None and time.monotonic() + wait >= deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+
+class ModelMetrics:
+    def __init__(self, window=500):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.latencies = deque(maxlen=window)
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'avg_latency_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            'p95_latency_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2) if latencies else 0.0
+        }
+
+
+class LLMGateway:
+    """Process-wide OpenAI gateway shared by every service.
+
+    Holds one pooled keep-alive HTTP client, limits requests and tokens per minute
+    with token buckets, retries transient failures with jittered exponential backoff
+    honouring Retry-After, and keeps per-model latency and error metrics.
+    Streamed completions are measured and reported to the circuit breaker when
+    the stream has been read to the end, not when its first byte arrives.
+
+    Every failed attempt counts toward the circuit breaker, and retrying stops once
+    the circuit leaves the closed state or the next attempt would start after
+    OPENAI_RETRY_DEADLINE seconds, so a struggling provider fails over quickly.
+    """
+
+    def __init__(self, api_key):
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+            ),
+            timeout=OPENAI_TIMEOUT
+        )
+        # Retries are handled here so they can respect the shared rate limits
+        self.client = openai.OpenAI(api_key=api_key, max_retries=0, http_client=self.http_client)
+        self.request_bucket = TokenBucket(OPENAI_RPM_LIMIT, OPENAI_RPM_LIMIT / 60)
+        self.token_bucket = TokenBucket(OPENAI_TPM_LIMIT, OPENAI_TPM_LIMIT / 60)
+        self.metrics = defaultdict(ModelMetrics)
+        self.metrics_lock = threading.Lock()
+
+    @staticmethod
+    def _retry_after(error):
+        response = getattr(error, 'response', None)
+        if response is None:
+            return None
+        headers = response.headers
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            if headers.get('retry-after'):
+                return float(headers['retry-after'])
+        except ValueError:
+            return None
+        return None
+
+    def _backoff(self, attempt, error):
+        delay = min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * (2 ** attempt))
+        jittered = random.uniform(0, delay)
+        retry_after = self._retry_after(error)
+        return max(jittered, retry_after) if retry_after else jittered
+
+    def _track_stream(self, model, breaker, start, stream):
+        """Yield a streamed response, recording its latency and outcome once it has been read."""
+        finished = False
+        try:
+            for chunk in stream:
+                yield chunk
+            finished = True
+        except RETRYABLE_ERRORS + (httpx.TransportError,) as e:
+            # A dropped connection while reading is not wrapped in an OpenAI error
+            finished = True
+            with self.metrics_lock:
+                self.metrics[model].errors += 1
+            breaker.record_failure(e)
+            raise
+        except Exception:
+            finished = True
+            with self.metrics_lock:
+                self.metrics[model].errors += 1
+            breaker.release()
+            raise
+        finally:
+            if not finished:
+                # Abandoned by the reader; says nothing about provider health
+                breaker.release()
+                stream.close()
+        with self.metrics_lock:
+            metrics = self.metrics[model]
+            metrics.requests += 1
+            metrics.latencies.append((time.perf_counter() - start) * 1000)
+        breaker.record_success()
+
+    def _call(self, model, estimated_tokens, request_fn, operation, stream=False):
+        breaker = get_circuit_breaker('openai', operation)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"OpenAI circuit for {operation} is open")
+
+        deadline = time.monotonic() + OPENAI_RETRY_DEADLINE
+        last_error = None
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            # Every attempt, retries included, passes the shared limiters; the first
+            # waits as long as it takes, retries give up at the deadline
+            wait_until = deadline if last_error else None
+            if not (self.request_bucket.acquire(1, wait_until)
+                    and self.token_bucket.acquire(estimated_tokens, wait_until)):
+                raise last_error
+            start = time.perf_counter()
+            try:
+                response = request_fn()
+                if stream:
+                    return self._track_stream(model, breaker, start, response)
+                with self.metrics_lock:
+                    metrics = self.metrics[model]
+                    metrics.requests += 1
+                    metrics.latencies.append((time.perf_counter() - start) * 1000)
+                breaker.record_success()
+                return response
+            except RETRYABLE_ERRORS as e:
+                with self.metrics_lock:
+                    metrics = self.metrics[model]
+                    metrics.errors += 1
+                    if isinstance(e, openai.RateLimitError):
+                        metrics.rate_limited += 1
+                breaker.record_failure(e)
+                last_error = e
+                delay = self._backoff(attempt, e)
+                if attempt == OPENAI_MAX_RETRIES or not breaker.is_closed() \
+                        or time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(f"OpenAI {model} call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                with self.metrics_lock:
+                    self.metrics[model].retries += 1
+                time.sleep(delay)
+            except Exception:
+                with self.metrics_lock:
+                    self.metrics[model].errors += 1
+                # Request errors such as a bad prompt do not mean the provider is down
+                breaker.release()
+                raise
+
+    def chat_completion(self, model, messages, operation='chat', **params):
+        estimated_tokens = sum(count_tokens(message['content'], model) for message in messages)
+        estimated_tokens += params.get('max_tokens', 0)
+        return self._call(
+            model, estimated_tokens,
+            lambda: self.client.chat.completions.create(model=model, messages=messages, **params),
+            operation, stream=params.get('stream', False)
+        )
+
+    def embeddings(self, model, texts, operation='embeddings'):
+        estimated_tokens = sum(count_tokens(text) for text in texts)
+        return self._call(
+            model, estimated_tokens,
+            lambda: self.client.embeddings.create(model=model, input=texts),
+            operation
+        )
+
+    def get_metrics(self):
+        with self.metrics_lock:
+            return {model: metrics.to_dict() for model, metrics in self.metrics.items()}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway():
+    """Return the shared gateway, or None when no OpenAI API key is configured."""
+    global _gateway
+    if _gateway is not None:
+        return _gateway
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        return None
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway(api_key)
+    return _gateway
@@ -0,0 +1,203 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from glob import glob
+from dotenv import load_dotenv
+from app.services.inference_scheduler import BatchingScheduler
+
+load_dotenv()
+
+try:
+    from transformers import pipeline, AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    pipeline = None
+    AutoTokenizer = None
+    TRANSFORMERS_AVAILABLE = False
+
+try:
+    from optimum.onnxruntime import (
+        ORTModelForQuestionAnswering, ORTModelForSeq2SeqLM, ORTQuantizer
+    )
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SentenceTransformer = None
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# torch: PyTorch fp32; onnx: ONNX Runtime fp32; onnx-int8: ONNX Runtime with dynamic int8 weights
+LOCAL_INFERENCE_BACKEND = os.getenv('LOCAL_INFERENCE_BACKEND', 'torch').lower()
+LOCAL_ONNX_CACHE_DIR = os.getenv('LOCAL_ONNX_CACHE_DIR', 'models/onnx')
+# Instruction set targeted by int8 kernels: avx2, avx512, avx512_vnni or arm64
+LOCAL_ONNX_QUANT_ARCH = os.getenv('LOCAL_ONNX_QUANT_ARCH', 'avx2').lower()
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+if LOCAL_INFERENCE_BACKEND not in BACKENDS:
+    logger.warning(f"Unknown LOCAL_INFERENCE_BACKEND '{LOCAL_INFERENCE_BACKEND}', using torch")
+    LOCAL_INFERENCE_BACKEND = 'torch'
+
+# Pre-exported ONNX files shipped with the sentence-transformers hub models
+_EMBEDDING_ONNX_FILES = {
+    'onnx': 'onnx/model.onnx',
+    'onnx-int8': {
+        'avx2': 'onnx/model_quint8_avx2.onnx',
+        'avx512': 'onnx/model_qint8_avx512.onnx',
+        'avx512_vnni': 'onnx/model_qint8_avx512_vnni.onnx',
+        'arm64': 'onnx/model_qint8_arm64.onnx'
+    }
+}
+
+_schedulers = {}
+_embedding_models = {}
+_lock = threading.Lock()
+
+
+def _quantization_config():
+    if LOCAL_ONNX_QUANT_ARCH == 'arm64':
+        return AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+    if LOCAL_ONNX_QUANT_ARCH == 'avx512':
+        return AutoQuantizationConfig.avx512(is_static=False, per_channel=False)
+    if LOCAL_ONNX_QUANT_ARCH == 'avx512_vnni':
+        return AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    return AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+
+
+def _onnx_file_names(task, backend):
+    suffix = '_quantized' if backend == 'onnx-int8' else ''
+    if task == 'summarization':
+        return {
+            'encoder_file_name': f'encoder_model{suffix}.onnx',
+            'decoder_file_name': f'decoder_model{suffix}.onnx',
+            'decoder_with_past_file_name': f'decoder_with_past_model{suffix}.onnx'
+        }
+    return {'file_name': f'model{suffix}.onnx'}
+
+
+def _load_onnx_model(task, model_name, backend):
+    """Export a hub model to ONNX (quantizing it for onnx-int8) once, then load it from disk."""
+    model_class = ORTModelForSeq2SeqLM if task == 'summarization' else ORTModelForQuestionAnswering
+    target_dir = os.path.join(LOCAL_ONNX_CACHE_DIR, model_name.replace('/', '__'), backend)
+
+    file_names = _onnx_file_names(task, backend)
+    if os.path.isdir(target_dir) and not all(
+        os.path.exists(os.path.join(target_dir, name)) for name in file_names.values()
+    ):
+        # Left behind by an export that was interrupted before exports were built aside
+        logger.warning(f"Removing incomplete ONNX export in {target_dir}")
+        shutil.rmtree(target_dir, ignore_errors=True)
+
+    if not os.path.isdir(target_dir):
+        logger.info(f"Exporting {model_name} to ONNX ({backend}) in {target_dir}")
+        # Build in a scratch directory and rename it into place, so an interrupted
+        # export never leaves a partial target_dir that later loads would trust
+        os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix=f"{backend}-", dir=os.path.dirname(target_dir))
+        output_dir = os.path.join(build_dir, 'model')
+        try:
+            exported = model_class.from_pretrained(model_name, export=True)
+            if backend == 'onnx-int8':
+                export_dir = os.path.join(build_dir, 'export')
+                exported.save_pretrained(export_dir)
+                quantization_config = _quantization_config()
+                for onnx_path in sorted(glob(os.path.join(export_dir, '*.onnx'))):
+                    quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=os.path.basename(onnx_path))
+                    quantizer.quantize(save_dir=output_dir, quantization_config=quantization_config)
+                exported.config.save_pretrained(output_dir)
+                if getattr(exported, 'generation_config', None) is not None:
+                    exported.generation_config.save_pretrained(output_dir)
+            else:
+                exported.save_pretrained(output_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+            try:
+                os.rename(output_dir, target_dir)
+            except OSError:
+                # Another worker finished the same export first; keep its copy
+                if not os.path.isdir(target_dir):
+                    raise
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    model = model_class.from_pretrained(target_dir, **file_names)
+    tokenizer = AutoTokenizer.from_pretrained(target_dir)
+    return model, tokenizer
+
+
+def load_pipeline(task, model_name, backend=LOCAL_INFERENCE_BACKEND):
+    """Build a transformers pipeline on the requested backend.
+
+    ONNX backends fall back to PyTorch when optimum is missing or the export fails.
+    """
+    if backend != 'torch':
+        if not ONNX_AVAILABLE:
+            print(f"optimum[onnxruntime] not installed, loading {model_name} with PyTorch")
+        else:
+            try:
+                model, tokenizer = _load_onnx_model(task, model_name, backend)
+                return pipeline(task, model=model, tokenizer=tokenizer)
+            except Exception as e:
+                print(f"Failed to load ONNX {task} model ({model_name}), using PyTorch: {e}")
+    return pipeline(task, model=model_name, device=-1)
+
+
+def get_local_pipeline(task, model_name):
+    """Return the process-wide batching scheduler for a local pipeline, loading it once.
+
+    Returns None when transformers is missing or the model fails to load.
+    """
+    key = (task, model_name)
+    with _lock:
+        if key not in _schedulers:
+            scheduler = None
+            if TRANSFORMERS_AVAILABLE:
+                try:
+                    local_pipeline = load_pipeline(task, model_name)
+                    scheduler = BatchingScheduler(f"{task}:{model_name}", local_pipeline)
+                    print(f"Local {task} model ({model_name}) loaded on {LOCAL_INFERENCE_BACKEND} backend")
+                except Exception as e:
+                    print(f"Failed to load {task} model ({model_name}): {e}")
+            _schedulers[key] = scheduler
+        return _schedulers[key]
+
+
+def load_embedding_model(model_name, backend=LOCAL_INFERENCE_BACKEND):
+    """Build a SentenceTransformer on the requested backend, falling back to PyTorch."""
+    if backend != 'torch':
+        file_name = _EMBEDDING_ONNX_FILES[backend]
+        if isinstance(file_name, dict):
+            file_name = file_name.get(LOCAL_ONNX_QUANT_ARCH, file_name['avx2'])
+        try:
+            return SentenceTransformer(model_name, backend='onnx', model_kwargs={'file_name': file_name})
+        except Exception as e:
+            print(f"Failed to load ONNX embedding model ({model_name}), using PyTorch: {e}")
+    return SentenceTransformer(model_name)
+
+
+def get_embedding_model(model_name):
+    """Return the process-wide local embedding model, or None when it cannot be loaded."""
+    with _lock:
+        if model_name not in _embedding_models:
+            model = None
+            if SENTENCE_TRANSFORMERS_AVAILABLE:
+                try:
+                    model = load_embedding_model(model_name)
+                    print(f"Local embedding model ({model_name}) loaded on {LOCAL_INFERENCE_BACKEND} backend")
+                except Exception as e:
+                    print(f"Failed to initialize local embedding model: {e}")
+            _embedding_models[model_name] = model
+        return _embedding_models[model_name]
+
+
+def get_scheduler_stats():
+    with _lock:
+        schedulers = list(_schedulers.values())
+    return {scheduler.name: scheduler.stats() for scheduler in schedulers if scheduler}
@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime
+import numpy as np
+from bson import ObjectId
+from pymongo import IndexModel
+from dotenv import load_dotenv
+from app.services.reranker import RERANK_ENABLED
+from app.services.context_builder import CONTEXT_BUILDER_ENABLED, get_context_budget
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QA_CACHE_ENABLED = os.getenv('QA_CACHE_ENABLED', 'True').lower() == 'true'
+QA_CACHE_SIMILARITY = float(os.getenv('QA_CACHE_SIMILARITY', 0.95))
+QA_CACHE_SEMANTIC_CANDIDATES = int(os.getenv('QA_CACHE_SEMANTIC_CANDIDATES', 500))
+
+_NON_WORD = re.compile(r'[^\w\s]')
+
+
+def normalize_question(question):
+    return ' '.join(_NON_WORD.sub(' ', question.lower()).split())
+
+
+class QACache:
+    """Answer cache for document questions.
+
+    Exact hits are keyed on (document id, normalized question, retrieval fingerprint).
+    Semantic hits compare the question embedding against cached questions for the
+    same document and fingerprint. The fingerprint changes whenever the document is
+    re-processed or the retrieval setup changes, so stale answers are never served.
+    """
+    COLLECTION = 'qa_cache'
+    INDEXES = [
+        IndexModel([('document_id', 1), ('fingerprint', 1), ('question_key', 1)]),
+        IndexModel([('document_id', 1), ('fingerprint', 1), ('created_at', -1)])
+    ]
+    HOT_QUERIES = [
+        {
+            'name': 'exact cached answer',
+            'filter': {'document_id': ObjectId(), 'question_key': 'what is the term', 'fingerprint': '0' * 16}
+        },
+        {
+            'name': 'semantic cache candidates',
+            'filter': {'document_id': ObjectId(), 'fingerprint': '0' * 16},
+            'sort': [('created_at', -1)]
+        }
+    ]
+
+    def __init__(self, db):
+        self.collection = db[self.COLLECTION]
+
+    @staticmethod
+    def retrieval_fingerprint(document, model):
+        processed_date = document.get('processed_date')
+        parts = [
+            str(document['_id']),
+            processed_date.isoformat() if processed_date else '',
+            model,
+            str(RERANK_ENABLED),
+            str(CONTEXT_BUILDER_ENABLED),
+            str(get_context_budget(model))
+        ]
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+    def get_exact(self, document_id, question, fingerprint):
+        entry = self.collection.find_one_and_update(
+            {
+                'document_id': ObjectId(document_id),
+                'question_key': normalize_question(question),
+                'fingerprint': fingerprint
+            },
+            {'$inc': {'hits': 1}, '$set': {'last_hit_at': datetime.utcnow()}},
+            projection={'embedding': 0}
+        )
+        return entry
+
+    def get_semantic(self, document_id, question_embedding, fingerprint, threshold=QA_CACHE_SIMILARITY):
+        candidates = list(self.collection.find(
+            {'document_id': ObjectId(document_id), 'fingerprint': fingerprint},
+            {'embedding': 1}
+        ).sort('created_at', -1).limit(QA_CACHE_SEMANTIC_CANDIDATES))
+
+        query = np.asarray(question_embedding, dtype=np.float32)
+        candidates = [c for c in candidates if c.get('embedding') and len(c['embedding']) == len(query)]
+        if not candidates:
+            return None
+
+        matrix = np.asarray([c['embedding'] for c in candidates], dtype=np.float32)
+        similarities = matrix @ query / np.maximum(
+            np.linalg.norm(matrix, axis=1) * np.linalg.norm(query), 1e-12
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold:
+            return None
+
+        entry = self.collection.find_one_and_update(
+            {'_id': candidates[best]['_id']},
+            {'$inc': {'hits': 1}, '$set': {'last_hit_at': datetime.utcnow()}},
+            projection={'embedding': 0}
+        )
+        if entry:
+            entry['similarity'] = round(float(similarities[best]), 4)
+        return entry
+
+    def put(self, document_id, question, fingerprint, question_embedding, result):
+        self.collection.update_one(
+            {
+                'document_id': ObjectId(document_id),
+                'question_key': normalize_question(question),
+                'fingerprint': fingerprint
+            },
+            {
+                '$set': {
+                    'question': question,
+                    'embedding': list(question_embedding) if question_embedding is not None else None,
+                    'result': result,
+                    'created_at': datetime.utcnow()
+                },
+                '$setOnInsert': {'hits': 0}
+            },
+            upsert=True
+        )
+
+    def invalidate_document(self, document_id):
+        result = self.collection.delete_many({'document_id': ObjectId(document_id)})
+        if result.deleted_count:
+            logger.info(f"Invalidated {result.deleted_count} cached answers for document {document_id}")
+        return result.deleted_count
@@ -0,0 +1,103 @@
+import logging
+import os
+import re
+from datetime import datetime
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QA_ROUTING_ENABLED = os.getenv('QA_ROUTING_ENABLED', 'True').lower() == 'true'
+QA_ROUTING_DEFAULT_POLICY = os.getenv('QA_ROUTING_DEFAULT_POLICY', 'balanced').lower()
+
+# quality: always use the LLM; balanced: extractive for confident fact lookups;
+# latency / cost: extractive whenever the question is not open-ended
+QA_POLICIES = {
+    'quality': {'min_retrieval_confidence': None, 'escalate_below': None},
+    'balanced': {'min_retrieval_confidence': 0.5, 'escalate_below': 0.4},
+    'latency': {'min_retrieval_confidence': 0.3, 'escalate_below': 0.2},
+    'cost': {'min_retrieval_confidence': 0.2, 'escalate_below': 0.1}
+}
+
+_FACTOID = re.compile(
+    r'^(who|whom|when|where|which|what (is|are|was|were) the (name|date|amount|price|cost|fee|term|number|address|email|phone|deadline|value|rate|percentage)|'
+    r'how (much|many|long|old)|what (date|time|year|day|amount|percentage))\b'
+)
+_OPEN_ENDED = re.compile(
+    r'\b(why|explain|summari[sz]e|describe|compare|discuss|analy[sz]e|implications?|pros and cons|overview|difference)\b'
+)
+
+
+class QARouter:
+    """Chooses between the local extractive QA model and the LLM for each question.
+
+    The decision uses the question type, retrieval confidence and the tenant's
+    policy. Decisions and their outcomes are written to ``qa_routing_log`` so the
+    thresholds can be tuned from real traffic.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.log_collection = db.qa_routing_log
+
+    @staticmethod
+    def classify_question(question):
+        normalized = ' '.join(question.lower().split())
+        if _OPEN_ENDED.search(normalized):
+            return 'open'
+        if _FACTOID.match(normalized):
+            return 'factoid'
+        return 'other'
+
+    def get_policy(self, user_id):
+        user = self.db.users.find_one({'_id': ObjectId(user_id)}, {'settings.qa_policy': 1})
+        policy = ((user or {}).get('settings') or {}).get('qa_policy', QA_ROUTING_DEFAULT_POLICY)
+        return policy if policy in QA_POLICIES else QA_ROUTING_DEFAULT_POLICY
+
+    def decide(self, question, retrieval_confidence, policy):
+        question_type = self.classify_question(question)
+        rules = QA_POLICIES[policy]
+        decision = {
+            'route': 'llm',
+            'question_type': question_type,
+            'policy': policy,
+            'retrieval_confidence': retrieval_confidence,
+            'escalate_below': rules['escalate_below']
+        }
+
+        if not QA_ROUTING_ENABLED or rules['min_retrieval_confidence'] is None:
+            decision['reason'] = 'policy'
+        elif question_type == 'open':
+            decision['reason'] = 'open_question'
+        elif question_type == 'other' and policy == 'balanced':
+            decision['reason'] = 'not_factoid'
+        elif retrieval_confidence is None or retrieval_confidence < rules['min_retrieval_confidence']:
+            decision['reason'] = 'low_retrieval_confidence'
+        else:
+            decision['route'] = 'extractive'
+            decision['reason'] = 'confident_lookup'
+
+        return decision
+
+    def record(self, user_id, document_id, question, decision, qa_result, latency_ms):
+        try:
+            self.log_collection.insert_one({
+                'user_id': ObjectId(user_id),
+                'document_id': ObjectId(document_id) if document_id else None,
+                'question': question[:500],
+                'question_type': decision['question_type'],
+                'policy': decision['policy'],
+                'decision': decision['route'],
+                'reason': decision['reason'],
+                'retrieval_confidence': decision['retrieval_confidence'],
+                'final_route': qa_result.get('route'),
+                'escalated': qa_result.get('escalated', False),
+                'model': qa_result.get('model'),
+                'confidence': qa_result.get('confidence'),
+                'latency_ms': latency_ms,
+                'created_at': datetime.utcnow()
+            })
+        except Exception as e:
+            logger.warning(f"Failed to record QA routing decision: {e}")
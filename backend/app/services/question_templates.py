@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+from datetime import datetime
+from bson import ObjectId
+from dotenv import load_dotenv
+from app.services.qa_cache import normalize_question
+from app.services.context_builder import CONTEXT_BUILDER_ENABLED
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QUESTION_TEMPLATES_ENABLED = os.getenv('QUESTION_TEMPLATES_ENABLED', 'True').lower() == 'true'
+QUESTION_TEMPLATE_BATCH_SIZE = int(os.getenv('QUESTION_TEMPLATE_BATCH_SIZE', 5))
+MAX_QUESTION_TEMPLATES = int(os.getenv('MAX_QUESTION_TEMPLATES', 30))
+
+_BUILTIN_TEMPLATES = [
+    'Who are the parties to this document?',
+    'What is the effective date?',
+    'What are the payment terms?',
+    'What are the renewal terms?'
+]
+
+try:
+    DEFAULT_QUESTION_TEMPLATES = json.loads(os.getenv('DEFAULT_QUESTION_TEMPLATES', 'null')) or _BUILTIN_TEMPLATES
+except ValueError:
+    logger.warning("DEFAULT_QUESTION_TEMPLATES is not a JSON list, using built-in templates")
+    DEFAULT_QUESTION_TEMPLATES = _BUILTIN_TEMPLATES
+
+
+class QuestionTemplates:
+    """Per-tenant standard questions answered once at ingest time.
+
+    Templates live in ``users.settings.question_templates`` (falling back to
+    DEFAULT_QUESTION_TEMPLATES). Answers are stored on the document under
+    ``template_answers`` keyed by the normalized question, so matching questions
+    can be answered without retrieval or an LLM call.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_templates(self, user_id):
+        user = self.db.users.find_one({'_id': ObjectId(user_id)}, {'settings.question_templates': 1})
+        templates = ((user or {}).get('settings') or {}).get('question_templates')
+        return templates if templates is not None else DEFAULT_QUESTION_TEMPLATES
+
+    @staticmethod
+    def validate(templates):
+        """Return cleaned templates, or raise ValueError when the list is not acceptable."""
+        if not isinstance(templates, list) or not all(isinstance(t, str) for t in templates):
+            raise ValueError('Question templates must be a list of strings')
+        cleaned = []
+        seen = set()
+        for template in templates:
+            template = template.strip()
+            if template and normalize_question(template) not in seen:
+                seen.add(normalize_question(template))
+                cleaned.append(template[:500])
+        if len(cleaned) > MAX_QUESTION_TEMPLATES:
+            raise ValueError(f'At most {MAX_QUESTION_TEMPLATES} question templates are allowed')
+        return cleaned
+
+    def precompute(self, processor, document_id, user_id):
+        """Answer the tenant's templates for a processed document and store them on it."""
+        templates = self.get_templates(user_id)
+        if not templates:
+            return []
+
+        # One embedding call and one vector query for all templates
+        query_embeddings = processor.vector_service.embed_queries(templates)
+        search_results = processor.vector_service.search_documents_batch(
+            query_embeddings, user_id, processor.retrieval_fetch_count(7), document_id,
+            include_embeddings=CONTEXT_BUILDER_ENABLED
+        )
+
+        questions, contexts, sources = [], [], []
+        for question, results in zip(templates, search_results):
+            selection = processor.select_context_chunks(
+                question, user_id, document_id, n_results=7, top_k=4, fallback_k=3, search_results=results
+            )
+            if selection['context'].strip():
+                questions.append(question)
+                contexts.append(selection['context'])
+                sources.append(selection['metadatas'][:3])
+
+        answers = []
+        for start in range(0, len(questions), QUESTION_TEMPLATE_BATCH_SIZE):
+            batch = slice(start, start + QUESTION_TEMPLATE_BATCH_SIZE)
+            results = processor.answer_questions_batch(questions[batch], contexts[batch])
+            for question, batch_sources, result in zip(questions[batch], sources[batch], results):
+                if result.get('model') == 'fallback':
+                    continue
+                answers.append({
+                    'question': question,
+                    'normalized_question': normalize_question(question),
+                    'answer': result['answer'],
+                    'confidence': result['confidence'],
+                    'context_used': result.get('context_used', ''),
+                    'sources': batch_sources,
+                    'model': result.get('model'),
+                    'route': result.get('route')
+                })
+
+        self.db.documents.update_one(
+            {'_id': ObjectId(document_id)},
+            {'$set': {'template_answers': answers, 'template_answers_date': datetime.utcnow()}}
+        )
+        logger.info(f"Stored {len(answers)} template answers for document {document_id}")
+        return answers
+
+    @staticmethod
+    def find_answer(document, question):
+        normalized = normalize_question(question)
+        for entry in document.get('template_answers') or []:
+            if entry.get('normalized_question') == normalized:
+                return entry
+        return None
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    from sentence_transformers import CrossEncoder
+    CROSS_ENCODER_AVAILABLE = True
+except ImportError:
+    CrossEncoder = None
+    CROSS_ENCODER_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv('RERANK_ENABLED', 'False').lower() == 'true'
+RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', 20))
+RERANK_CACHE_SIZE = int(os.getenv('RERANK_CACHE_SIZE', 10000))
+
+
+def query_hash(query):
+    normalized = ' '.join(query.lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class Reranker:
+    """Scores (query, chunk) pairs with a small cross-encoder in one batched pass.
+
+    Scores are cached per (query hash, chunk id) so repeated questions over the
+    same document only pay for chunks that have not been seen yet.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, cache_size=RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.model = None
+
+        if CROSS_ENCODER_AVAILABLE:
+            try:
+                self.model = CrossEncoder(model_name, device='cpu')
+                print(f"Cross-encoder reranker ({model_name}) initialized")
+            except Exception as e:
+                print(f"Failed to initialize cross-encoder reranker: {e}")
+                self.model = None
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    def _get_cached(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def _set_cached(self, key, score):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, query, chunk_ids, chunks):
+        q_hash = query_hash(query)
+        scores = [None] * len(chunks)
+        missing = []
+
+        for i, chunk_id in enumerate(chunk_ids):
+            cached = self._get_cached((q_hash, chunk_id))
+            if cached is not None:
+                scores[i] = cached
+            else:
+                missing.append(i)
+
+        if missing:
+            pairs = [(query, chunks[i]) for i in missing]
+            predicted = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            for i, value in zip(missing, predicted):
+                scores[i] = float(value)
+                self._set_cached((q_hash, chunk_ids[i]), scores[i])
+
+        return scores
+
+    def rerank(self, query, chunk_ids, chunks, top_k):
+        """Return (indices ordered by score, scores, elapsed_ms) for the top_k chunks."""
+        start = time.perf_counter()
+        scores = self.score(query, chunk_ids, chunks)
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)[:top_k]
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(f"Reranked {len(chunks)} candidates in {elapsed_ms}ms")
+        return order, [scores[i] for i in order], elapsed_ms
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Process-wide reranker so the model and score cache survive across requests."""
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+    return _reranker if _reranker.available else None
@@ -2,18 +2,13 @@ import chromadb
 import numpy as np
 from typing import List, Dict, Any
 import uuid
-import openai
 import os
 from dotenv import load_dotenv
+from app.services.llm_gateway import get_llm_gateway
+from app.services.local_models import get_embedding_model
 
 load_dotenv()
 
-try:
-    from sentence_transformers import SentenceTransformer
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
-
 class VectorService:
     def __init__(self, chroma_client):
         self.client = chroma_client
@@ -21,9 +16,8 @@ class VectorService:
         # Try to initialize OpenAI
         self.use_openai = False
         try:
-            api_key = os.getenv('OPENAI_API_KEY')
-            if api_key:
-                self.openai_client = openai.OpenAI(api_key=api_key)
+            self.llm_gateway = get_llm_gateway()
+            if self.llm_gateway:
                 self.embedding_model_name = 'text-embedding-3-small'
                 self.use_openai = True
                 print("OpenAI embedding service initialized")
@@ -32,15 +26,8 @@ class VectorService:
         except Exception as e:
             print(f"Failed to initialize OpenAI: {e}")
         
-        # Always initialize local model as fallback
-        self.embedding_model = None
-        if SENTENCE_TRANSFORMERS_AVAILABLE:
-            try:
-                self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-                print("Local embedding model (all-MiniLM-L6-v2) initialized as fallback")
-            except Exception as e:
-                print(f"Failed to initialize local embedding model: {e}")
-                self.embedding_model = None
+        # Always initialize local model as fallback; it is loaded once per process
+        self.embedding_model = get_embedding_model('all-MiniLM-L6-v2')
         
         self.document_collection = self.client.get_or_create_collection(
             name="documents",
@@ -55,10 +42,7 @@ class VectorService:
     def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
         if self.use_openai:
             try:
-                response = self.openai_client.embeddings.create(
-                    model=self.embedding_model_name,
-                    input=texts
-                )
+                response = self.llm_gateway.embeddings(self.embedding_model_name, texts)
                 return [embedding.embedding for embedding in response.data]
             except Exception as e:
                 print(f"OpenAI embedding failed: {e}")
@@ -72,9 +56,11 @@ class VectorService:
         else:
             raise Exception("No embedding service available")
     
-    def add_document_chunks(self, document_id: str, chunks: List[str], metadata: List[Dict[str, Any]]):
+    def add_document_chunks(self, document_id: str, chunks: List[str], metadata: List[Dict[str, Any]],
+                            embeddings: List[List[float]] = None):
         chunk_ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
-        embeddings = self._generate_embeddings(chunks)
+        if embeddings is None:
+            embeddings = self._generate_embeddings(chunks)
         
         for i, meta in enumerate(metadata):
             meta['document_id'] = document_id
@@ -89,45 +75,109 @@ class VectorService:
         
         return len(chunks)
     
-    def search_documents(self, query: str, user_id: str, n_results: int = 5, document_id: str = None):
-        query_embedding = self._generate_embeddings([query])
+    def embed_sentences(self, texts: List[str]) -> List[List[float]]:
+        """Embed many short texts, preferring the local model to avoid per-token API cost."""
+        if self.embedding_model:
+            return self.embedding_model.encode(texts, batch_size=64).tolist()
+        return self._generate_embeddings(texts)
+    
+    def embed_query(self, query: str) -> List[float]:
+        return self._generate_embeddings([query])[0]
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed a batch of queries in a single embedding call."""
+        return self._generate_embeddings(queries)
+    
+    def search_documents(self, query: str, user_id: str, n_results: int = 5, document_id: str = None,
+                         include_embeddings: bool = False, query_embedding: List[float] = None):
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         
+        return self.search_documents_batch(
+            [query_embedding], user_id, n_results, document_id, include_embeddings
+        )[0]
+    
+    def search_documents_batch(self, query_embeddings: List[List[float]], user_id: str, n_results: int = 5,
+                               document_id: str = None, include_embeddings: bool = False):
+        """Run one Chroma query for many query vectors; returns one result dict per query."""
         if document_id:
             where_clause = {"$and": [{"user_id": user_id}, {"document_id": document_id}]}
         else:
             where_clause = {"user_id": user_id}
         
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        
         results = self.document_collection.query(
-            query_embeddings=query_embedding,
+            query_embeddings=query_embeddings,
             n_results=n_results,
             where=where_clause,
-            include=["documents", "metadatas", "distances"]
+            include=include
         )
         
+        batch_results = []
+        for i in range(len(query_embeddings)):
+            search_results = {
+                'ids': results['ids'][i] if results['ids'] else [],
+                'documents': results['documents'][i] if results['documents'] else [],
+                'metadatas': results['metadatas'][i] if results['metadatas'] else [],
+                'distances': results['distances'][i] if results['distances'] else []
+            }
+            if include_embeddings:
+                search_results['embeddings'] = results['embeddings'][i] if results.get('embeddings') else []
+            batch_results.append(search_results)
+        return batch_results
+    
+    def get_document_vectors(self, document_id: str):
+        """Load every chunk of a document with its embedding, for in-memory search."""
+        results = self.document_collection.get(
+            where={"document_id": document_id},
+            include=["documents", "metadatas", "embeddings"]
+        )
         return {
-            'documents': results['documents'][0] if results['documents'] else [],
-            'metadatas': results['metadatas'][0] if results['metadatas'] else [],
-            'distances': results['distances'][0] if results['distances'] else []
+            'ids': results['ids'],
+            'documents': results['documents'] or [],
+            'metadatas': results['metadatas'] or [],
+            'embeddings': results['embeddings'] or [],
+            'distance_space': (self.document_collection.metadata or {}).get('hnsw:space', 'l2')
         }
     
     def add_chat_context(self, chat_id: str, user_id: str, question: str, answer: str, document_context: str = None):
-        context_text = f"Question: {question}\nAnswer: {answer}"
-        if document_context:
-            context_text += f"\nContext: {document_context}"
+        self.add_chat_contexts([{
+            'id': f"{chat_id}_{uuid.uuid4()}",
+            'chat_id': chat_id,
+            'user_id': user_id,
+            'question': question,
+            'answer': answer,
+            'document_context': document_context
+        }])
+    
+    def add_chat_contexts(self, entries: List[Dict[str, Any]]):
+        """Embed and store many Q&A turns with one embedding call.
+        
+        Uses upsert on the caller-supplied ids so a redelivered entry replaces itself.
+        """
+        texts = []
+        for entry in entries:
+            context_text = f"Question: {entry['question']}\nAnswer: {entry['answer']}"
+            if entry.get('document_context'):
+                context_text += f"\nContext: {entry['document_context']}"
+            texts.append(context_text)
         
-        embedding = self._generate_embeddings([context_text])[0]
+        embeddings = self._generate_embeddings(texts)
         
-        self.chat_collection.add(
-            embeddings=[embedding],
-            documents=[context_text],
+        self.chat_collection.upsert(
+            embeddings=embeddings,
+            documents=texts,
             metadatas=[{
-                'chat_id': chat_id,
-                'user_id': user_id,
-                'question': question,
-                'answer': answer,
-                'has_document_context': bool(document_context)
-            }],
-            ids=[f"{chat_id}_{uuid.uuid4()}"]
+                'chat_id': entry['chat_id'],
+                'user_id': entry['user_id'],
+                'question': entry['question'],
+                'answer': entry['answer'],
+                'has_document_context': bool(entry.get('document_context'))
+            } for entry in entries],
+            ids=[entry['id'] for entry in entries]
         )
     
     def get_relevant_chat_history(self, query: str, chat_id: str, n_results: int = 3):
@@ -166,6 +216,15 @@ class VectorService:
             print(f"Error deleting chat embeddings: {e}")
             return False
     
+    def delete_chat_contexts(self, ids: List[str]):
+        try:
+            if ids:
+                self.chat_collection.delete(ids=ids)
+            return True
+        except Exception as e:
+            print(f"Error deleting chat contexts: {e}")
+            return False
+    
     def get_collection_stats(self):
         embedding_dim = 1536 if self.use_openai else 384  # OpenAI vs local model dimension
         return {
@@ -176,7 +235,11 @@ class VectorService:
         }
     
     def chunk_text(self, text: str, chunk_size: int = 1500, overlap: int = 300):
-        chunks = []
+        return [span['text'] for span in self.chunk_spans(text, chunk_size, overlap)]
+    
+    def chunk_spans(self, text: str, chunk_size: int = 1500, overlap: int = 300):
+        """Chunk text and keep each chunk's character offsets in the source text."""
+        spans = []
         start = 0
         text_length = len(text)
         
@@ -191,10 +254,16 @@ class VectorService:
                     end = last_space
                 chunk = text[start:end]
             
-            chunks.append(chunk.strip())
+            stripped = chunk.strip()
+            start_offset = start + (len(chunk) - len(chunk.lstrip()))
+            spans.append({
+                'text': stripped,
+                'start_offset': start_offset,
+                'end_offset': start_offset + len(stripped)
+            })
             start = end - overlap
             
             if start >= text_length:
                 break
         
-        return chunks
\ No newline at end of file
+        return spans
\ No newline at end of file
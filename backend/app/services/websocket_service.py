@@ -1,9 +1,11 @@
 from flask_socketio import emit, join_room, leave_room, disconnect
 from flask_jwt_extended import decode_token, get_jwt_identity
-from flask import request
+from flask import request, session, current_app
 from functools import wraps
 from datetime import datetime
 import logging
+from app.models.chat import Chat
+from app.services.document_session_cache import get_session_cache
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +36,7 @@ def init_socketio_events(socketio):
                 user_id = decoded_token['sub']
                 room_name = f'user_{user_id}'
                 join_room(room_name)
+                session['user_id'] = user_id
                 emit('connected', {'status': 'success', 'message': 'Connected to IntelliDoc'})
                 logger.info(f"User {user_id} connected via WebSocket and joined room {room_name}")
             else:
@@ -76,9 +79,23 @@ def init_socketio_events(socketio):
         try:
             if 'chat_id' in data:
                 chat_id = data['chat_id']
+                
+                # Streamed answers are sent to this room, so only the chat's owner may join it
+                user_id = session.get('user_id')
+                chat = Chat(current_app.db).find_by_id(chat_id, Chat.OWNERSHIP_PROJECTION) if user_id else None
+                if not chat or str(chat['user_id']) != user_id:
+                    emit('error', {'message': 'Chat not found or access denied'})
+                    return
+                
                 join_room(f'chat_{chat_id}')
                 emit('joined_chat_room', {'chat_id': chat_id})
                 logger.info(f"Client joined chat room: {chat_id}")
+                
+                # Preload the chat's document so the first question skips Mongo and Chroma
+                if get_session_cache():
+                    socketio.start_background_task(
+                        _warm_document_session, current_app._get_current_object(), chat_id, session['user_id']
+                    )
         except Exception as e:
             logger.error(f"Error joining chat room: {e}")
             emit('error', {'message': 'Failed to join chat room'})
@@ -94,6 +111,17 @@ def init_socketio_events(socketio):
         except Exception as e:
             logger.error(f"Error leaving chat room: {e}")
 
+def _warm_document_session(app, chat_id, user_id):
+    from app.services.vector_service import VectorService
+    
+    with app.app_context():
+        try:
+            chat = Chat(app.db).find_by_id(chat_id, Chat.OWNERSHIP_PROJECTION)
+            if chat and str(chat['user_id']) == user_id and app.chroma:
+                get_session_cache().warm(app.db, VectorService(app.chroma), chat)
+        except Exception as e:
+            logger.error(f"Error warming document session for chat {chat_id}: {e}")
+
 class WebSocketNotifications:
     def __init__(self, socketio):
         self.socketio = socketio
@@ -156,6 +184,28 @@ class WebSocketNotifications:
             'timestamp': datetime.utcnow().isoformat()
         }, room=f'chat_{chat_id}')
     
+    def notify_chat_message_token(self, chat_id, message_id, token):
+        self.socketio.emit('chat_message_token', {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'token': token
+        }, room=f'chat_{chat_id}')
+    
+    def notify_chat_message_complete(self, chat_id, message):
+        self.socketio.emit('chat_message_complete', {
+            'chat_id': chat_id,
+            'message': message,
+            'timestamp': datetime.utcnow().isoformat()
+        }, room=f'chat_{chat_id}')
+    
+    def notify_chat_message_failed(self, chat_id, message_id, error=None):
+        self.socketio.emit('chat_message_failed', {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'error': error,
+            'timestamp': datetime.utcnow().isoformat()
+        }, room=f'chat_{chat_id}')
+    
     def notify_document_updated(self, user_id, document_id, update_type, data=None):
         self.socketio.emit('document_updated', {
             'document_id': document_id,
@@ -0,0 +1,162 @@
+"""Compare latency and accuracy of the local models across inference backends.
+
+Usage (from the backend directory):
+    python scripts/benchmark_inference.py --backends torch onnx onnx-int8 --runs 20
+
+Accuracy is measured against the PyTorch fp32 path: QA exact match / token F1 on a
+small built-in SQuAD-style set, embedding cosine similarity to the fp32 vectors and
+unigram overlap between summaries.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.local_models import BACKENDS, load_pipeline, load_embedding_model
+
+QA_SAMPLES = [
+    {
+        'question': 'When does the lease term begin?',
+        'context': 'This lease agreement is entered into by Acme Corp and Jane Smith. '
+                   'The lease term begins on March 1, 2024 and ends on February 28, 2025. '
+                   'Monthly rent of $2,400 is due on the first day of each month.',
+        'answer': 'March 1, 2024'
+    },
+    {
+        'question': 'How much is the monthly rent?',
+        'context': 'The lease term begins on March 1, 2024. Monthly rent of $2,400 is due on '
+                   'the first day of each month. A late fee of $75 applies after five days.',
+        'answer': '$2,400'
+    },
+    {
+        'question': 'Who is the project manager?',
+        'context': 'The migration project kicked off in January. Maria Lopez was appointed project '
+                   'manager and reports to the chief technology officer, David Chen.',
+        'answer': 'Maria Lopez'
+    },
+    {
+        'question': 'What percentage did revenue grow?',
+        'context': 'In the third quarter the company reported revenue of $48 million, '
+                   'representing growth of 12 percent compared with the same period last year.',
+        'answer': '12 percent'
+    },
+    {
+        'question': 'Where is the company headquartered?',
+        'context': 'Founded in 2009, Northwind Analytics is headquartered in Austin, Texas and '
+                   'operates regional offices in Denver and Toronto.',
+        'answer': 'Austin, Texas'
+    }
+]
+
+SUMMARY_TEXT = (
+    'The city council approved a new budget on Tuesday that increases funding for public '
+    'transportation by 15 percent. The plan adds three bus routes, extends service hours on '
+    'weekends and replaces forty diesel buses with electric models over the next two years. '
+    'Council members said the changes respond to a survey in which most residents named '
+    'unreliable transit as their top concern. Critics argued the budget relies on optimistic '
+    'revenue projections and could require cuts to other services if tax receipts fall short. '
+    'The mayor is expected to sign the budget next week, and the first new routes will begin '
+    'operating in the spring.'
+)
+
+EMBEDDING_SENTENCES = [sample['context'] for sample in QA_SAMPLES] + [SUMMARY_TEXT]
+
+
+def _normalize(text):
+    return ' '.join(''.join(c for c in text.lower() if c.isalnum() or c.isspace()).split())
+
+
+def _f1(prediction, truth):
+    prediction_tokens = _normalize(prediction).split()
+    truth_tokens = _normalize(truth).split()
+    common = sum(min(prediction_tokens.count(t), truth_tokens.count(t)) for t in set(truth_tokens))
+    if not prediction_tokens or not truth_tokens or common == 0:
+        return 0.0
+    precision = common / len(prediction_tokens)
+    recall = common / len(truth_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def _time(fn, runs):
+    fn()  # warm-up
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'p50_ms': round(statistics.median(latencies), 1),
+        'p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 1)
+    }
+
+
+def benchmark_qa(backend, runs):
+    qa = load_pipeline('question-answering', 'deepset/roberta-base-squad2', backend)
+    sample = QA_SAMPLES[0]
+    latency = _time(lambda: qa(question=sample['question'], context=sample['context']), runs)
+    exact, f1 = [], []
+    for sample in QA_SAMPLES:
+        answer = qa(question=sample['question'], context=sample['context'])['answer']
+        exact.append(float(_normalize(answer) == _normalize(sample['answer'])))
+        f1.append(_f1(answer, sample['answer']))
+    return {**latency, 'exact_match': round(np.mean(exact), 3), 'f1': round(np.mean(f1), 3)}
+
+
+def benchmark_embeddings(backend, runs, reference):
+    model = load_embedding_model('all-MiniLM-L6-v2', backend)
+    latency = _time(lambda: model.encode(EMBEDDING_SENTENCES), runs)
+    vectors = model.encode(EMBEDDING_SENTENCES, normalize_embeddings=True)
+    result = {**latency}
+    if reference is not None:
+        result['cosine_to_torch'] = round(float(np.mean(np.sum(vectors * reference, axis=1))), 4)
+    return result, vectors
+
+
+def benchmark_summarization(backend, runs, reference):
+    summarizer = load_pipeline('summarization', 'facebook/bart-large-cnn', backend)
+    generate = lambda: summarizer(SUMMARY_TEXT, max_length=80, min_length=20, do_sample=False)
+    latency = _time(generate, runs)
+    summary = generate()[0]['summary_text']
+    result = {**latency}
+    if reference is not None:
+        result['overlap_with_torch'] = round(_f1(summary, reference), 3)
+    return result, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--skip-summarization', action='store_true',
+                        help='BART is slow to export and run; skip it for quick checks')
+    args = parser.parse_args()
+
+    # The PyTorch path is always measured first so other backends can be compared to it
+    backends = ['torch'] + [b for b in args.backends if b != 'torch']
+    reference_vectors = None
+    reference_summary = None
+
+    for backend in backends:
+        print(f"\n=== {backend} ===")
+        print('question-answering:', benchmark_qa(backend, args.runs))
+
+        embeddings, vectors = benchmark_embeddings(backend, args.runs, reference_vectors)
+        print('embeddings:', embeddings)
+        if backend == 'torch':
+            reference_vectors = vectors
+
+        if not args.skip_summarization:
+            summarization, summary = benchmark_summarization(backend, max(1, args.runs // 5), reference_summary)
+            print('summarization:', summarization)
+            if backend == 'torch':
+                reference_summary = summary
+
+
+if __name__ == '__main__':
+    main()
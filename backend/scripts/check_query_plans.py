@@ -0,0 +1,40 @@
+"""Ensure the declared indexes and fail if any hot query would scan a whole collection.
+
+Usage (from the backend directory):
+    MONGODB_URI=mongodb://localhost:27017/intellidoc_test python scripts/check_query_plans.py
+
+Every model declares its indexes (INDEXES) and the query shapes it runs on hot
+paths (HOT_QUERIES). Each hot query is explained and the winning plan checked
+for COLLSCAN, so a new query shape without a supporting index fails here rather
+than in production. Exits with status 1 when any hot query scans.
+"""
+import os
+import sys
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.indexes import ensure_indexes, check_query_plans
+
+
+def main():
+    db = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/intellidoc')).get_default_database()
+    ensure_indexes(db)
+
+    results = check_query_plans(db)
+    width = max(len(f"{r['collection']}: {r['name']}") for r in results)
+    for result in results:
+        label = f"{result['collection']}: {result['name']}"
+        plan = 'COLLSCAN' if result['collscan'] else 'index'
+        sort = ' + in-memory sort' if result['in_memory_sort'] else ''
+        print(f"{label:<{width}}  {plan}{sort}")
+
+    scans = [r for r in results if r['collscan']]
+    if scans:
+        print(f"\n{len(scans)} hot quer{'y' if len(scans) == 1 else 'ies'} without a supporting index")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Every declared hot query must be answerable from an index.
+
+Runs against the database in MONGODB_TEST_URI, for example:
+    MONGODB_TEST_URI=mongodb://localhost:27017/intellidoc_test python -m pytest tests/
+
+The test only creates the declared indexes; it does not write or delete any
+documents. It is skipped when MONGODB_TEST_URI is unset or the server cannot
+be reached.
+"""
+import os
+
+import pytest
+
+pymongo = pytest.importorskip('pymongo')
+
+from app.models.indexes import ensure_indexes, check_query_plans
+
+MONGODB_TEST_URI = os.getenv('MONGODB_TEST_URI')
+
+
+@pytest.fixture(scope='module')
+def db():
+    if not MONGODB_TEST_URI:
+        pytest.skip('MONGODB_TEST_URI is not set')
+    client = pymongo.MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError as e:
+        pytest.skip(f'MongoDB is not reachable at {MONGODB_TEST_URI}: {e}')
+    ensure_indexes(client.get_default_database())
+    yield client.get_default_database()
+    client.close()
+
+
+def test_hot_queries_do_not_scan_collections(db):
+    results = check_query_plans(db)
+    assert results, 'No hot queries are declared'
+
+    scans = [f"{r['collection']}: {r['name']}" for r in results if r['collscan']]
+    assert not scans, f"Hot queries without a supporting index: {', '.join(scans)}"
@@ -11,6 +11,7 @@ const DocumentViewPage = () => {
   const [document, setDocument] = useState(null);
   const [loading, setLoading] = useState(true);
   const [newTag, setNewTag] = useState('');
+  const [loadingText, setLoadingText] = useState(false);
 
   const fetchDocument = useCallback(async () => {
     try {
@@ -30,6 +31,25 @@ const DocumentViewPage = () => {
     }
   }, [id, fetchDocument]);
 
+  const handleLoadMoreText = async () => {
+    if (!document?.text_page?.next_offset) return;
+
+    setLoadingText(true);
+    try {
+      const page = await apiService.getDocumentText(id, document.text_page.next_offset);
+      setDocument((current) => ({
+        ...current,
+        extracted_text: current.extracted_text + page.text,
+        text_page: page,
+      }));
+    } catch (error) {
+      console.error('Failed to load document text:', error);
+      toast.error('Failed to load more text');
+    } finally {
+      setLoadingText(false);
+    }
+  };
+
   const handleAddTag = async (e) => {
     e.preventDefault();
     if (!newTag.trim()) return;
@@ -214,6 +234,13 @@ const DocumentViewPage = () => {
                     {document.extracted_text}
                   </pre>
                 </div>
+                {document.text_page?.has_more && (
+                  <div className="text-center mt-3">
+                    <Button variant="outline-primary" size="sm" onClick={handleLoadMoreText} disabled={loadingText}>
+                      {loadingText ? <Spinner animation="border" size="sm" /> : 'Load more'}
+                    </Button>
+                  </div>
+                )}
               </Card.Body>
             </Card>
           )}
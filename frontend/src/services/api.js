@@ -113,6 +113,11 @@ class ApiService {
     return response.data;
   }
 
+  async getDocumentText(id, offset = 0, limit = 20000) {
+    const response = await this.client.get(`/documents/${id}/text?offset=${offset}&limit=${limit}`);
+    return response.data;
+  }
+
   async deleteDocument(id) {
     const response = await this.client.delete(`/documents/${id}`);
     return response.data;
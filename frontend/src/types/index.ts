@@ -24,12 +24,21 @@ export interface Document {
   upload_date: string;
   processed_date?: string;
   extracted_text?: string;
+  text_page?: TextPage;
   summary?: string;
   key_insights?: KeyInsight[];
   tags?: string[];
   metadata?: Record<string, any>;
 }
 
+export interface TextPage {
+  offset: number;
+  length: number;
+  total_length: number;
+  has_more: boolean;
+  next_offset: number | null;
+}
+
 export interface KeyInsight {
   category: string;
   confidence: number;
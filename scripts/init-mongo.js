@@ -13,19 +13,7 @@ db.createUser({
   ]
 });
 
-// Create collections with indexes for better performance
-db.createCollection('users');
-db.users.createIndex({ "email": 1 }, { unique: true });
-
-db.createCollection('documents');
-db.documents.createIndex({ "user_id": 1 });
-db.documents.createIndex({ "upload_date": -1 });
-db.documents.createIndex({ "processing_status": 1 });
-db.documents.createIndex({ "filename": "text" });
-
-db.createCollection('chats');
-db.chats.createIndex({ "user_id": 1 });
-db.chats.createIndex({ "document_id": 1 });
-db.chats.createIndex({ "updated_at": -1 });
+// Collections and indexes are created by the backend at startup from the
+// INDEXES declared on each model (see backend/app/models/indexes.py)
 
 print('IntelliDoc database initialized successfully!');
\ No newline at end of file